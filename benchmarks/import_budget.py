@@ -0,0 +1,152 @@
+"""Import-time budget check for the CLI and the paths that should not load models.
+
+Each scenario runs in a fresh interpreter and reports its wall time (minus
+the time of a bare `python -c pass`) and which heavy dependencies it
+imported. A scenario fails when it loads one of `HEAVY_MODULES` or takes
+longer than its budget:
+
+    import          `import essay_grader`
+    workflow        `import essay_grader.workflow` (what main.py loads)
+    help            `python main.py --help`
+    cached_batch    `run_batch(..., regrade=True)` over an unchanged batch,
+                    so OCR, answers and grades all come from the previous run
+
+    python benchmarks/import_budget.py                 # print JSON, exit 1 on failure
+    python benchmarks/import_budget.py --budget 0.3
+
+`cached_batch` primes its results with one full run and is skipped when
+PaddleOCR is not installed.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_llm_server import start_stub_server  # noqa: E402
+
+HEAVY_MODULES = ("cv2", "numpy", "openai", "httpx", "paddleocr", "paddle", "torch", "transformers", "protonx")
+
+# Appended to every scenario: report the heavy modules it left loaded.
+_REPORT = (
+    "\nimport json as _json, sys as _sys\n"
+    "_sys.stderr.write('\\nIMPORTED ' + _json.dumps(sorted(m for m in {heavy!r} if m in _sys.modules)) + '\\n')\n"
+)
+
+_HELP = (
+    "import runpy, sys\n"
+    "sys.argv = ['main.py', '--help']\n"
+    "try:\n"
+    "    runpy.run_path({main!r}, run_name='__main__')\n"
+    "except SystemExit:\n"
+    "    pass\n"
+)
+
+_BATCH = (
+    "from essay_grader.workflow import run_batch\n"
+    "run_batch({samples!r}, configs_dir={configs!r}, results_dir={results!r}, api_url={url!r},\n"
+    "          ocr_lang={lang!r}, grade_cache=None, regrade={regrade!r})\n"
+)
+
+
+def _run(code: str, env: Dict[str, str]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=str(ROOT), env=env, capture_output=True, text=True, timeout=600
+    )
+    seconds = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"scenario failed:\n{proc.stderr[-2000:]}")
+    imported: List[str] = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("IMPORTED "):
+            imported = json.loads(line[len("IMPORTED ") :])
+    return {"seconds": seconds, "imported": imported}
+
+
+def measure(code: str, repeat: int, env: Dict[str, str], interpreter: float) -> Dict[str, Any]:
+    runs = [_run(code + _REPORT.format(heavy=HEAVY_MODULES), env) for _ in range(repeat)]
+    seconds = statistics.median(r["seconds"] for r in runs)
+    return {
+        "seconds": round(seconds, 4),
+        "over_interpreter": round(max(0.0, seconds - interpreter), 4),
+        "imported": runs[-1]["imported"],
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])))
+    interpreter = statistics.median(_run("pass", env)["seconds"] for _ in range(args.repeat))
+    scenarios: Dict[str, Any] = {
+        "import": measure("import essay_grader", args.repeat, env, interpreter),
+        "workflow": measure("import essay_grader.workflow", args.repeat, env, interpreter),
+        "help": measure(_HELP.format(main=str(ROOT / "main.py")), args.repeat, env, interpreter),
+    }
+
+    if importlib.util.find_spec("paddleocr") is None:
+        scenarios["cached_batch"] = {"skipped": "paddleocr is not installed"}
+    else:
+        server = start_stub_server(latency=0.0)
+        try:
+            with tempfile.TemporaryDirectory() as results:
+                params = dict(
+                    samples=args.samples, configs=args.configs, results=results, url=server.url, lang=args.ocr_lang
+                )
+                _run(_BATCH.format(regrade=False, **params), env)
+                scenarios["cached_batch"] = measure(_BATCH.format(regrade=True, **params), args.repeat, env, interpreter)
+        finally:
+            server.shutdown()
+
+    failures = []
+    for name, s in scenarios.items():
+        if "skipped" in s:
+            continue
+        if s["imported"]:
+            failures.append(f"{name}: imported {', '.join(s['imported'])}")
+        budget = args.budget * (args.batch_factor if name == "cached_batch" else 1.0)
+        if s["over_interpreter"] > budget:
+            failures.append(f"{name}: {s['over_interpreter']}s over the {round(budget, 4)}s budget")
+    return {
+        "interpreter_seconds": round(interpreter, 4),
+        "budget_seconds": args.budget,
+        "scenarios": scenarios,
+        "failures": failures,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="AutoEssayGrader import-time budget check")
+    p.add_argument("--samples", default=str(ROOT / "samples"))
+    p.add_argument("--configs", default=str(ROOT / "configs"))
+    p.add_argument("--ocr-lang", default="vi")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median is reported")
+    p.add_argument("--budget", type=float, default=0.5, help="Allowed seconds per scenario on top of interpreter start")
+    p.add_argument(
+        "--batch-factor",
+        type=float,
+        default=4.0,
+        help="Budget multiplier for cached_batch, which also reads results and writes the summary",
+    )
+    args = p.parse_args(argv)
+
+    report = run(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    for failure in report["failures"]:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
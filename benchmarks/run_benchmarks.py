@@ -0,0 +1,473 @@
+"""Reproducible benchmarks for the grading pipeline and each of its stages.
+
+Uses the images in `samples/` and a local stub LLM server (see
+`stub_llm_server.py`), so runs are comparable across machines and library
+upgrades. Stages whose dependencies are missing (PaddleOCR, ProtonX) are
+reported as skipped.
+
+    python benchmarks/run_benchmarks.py                      # run and print JSON
+    python benchmarks/run_benchmarks.py --save-baseline      # store as baseline
+    python benchmarks/run_benchmarks.py --compare            # fail on regressions
+
+Latency stats are per call in seconds (p50/p95); throughput is pages/min.
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from stub_llm_server import start_stub_server  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linear-interpolated percentile, `q` in [0, 100]."""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * q / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    return {
+        "n": len(samples),
+        "mean": round(sum(samples) / len(samples), 6) if samples else 0.0,
+        "p50": round(percentile(samples, 50), 6),
+        "p95": round(percentile(samples, 95), 6),
+        "max": round(max(samples), 6) if samples else 0.0,
+    }
+
+
+def time_calls(fn: Callable[[], Any], repeat: int) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children."""
+    scale = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(max(own, children), 1)
+
+
+def _skip(reason: str) -> Dict[str, Any]:
+    return {"skipped": reason}
+
+
+def _has(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _load_configs(configs_dir: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    with open(os.path.join(configs_dir, "questions.json"), "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    with open(os.path.join(configs_dir, "answer_key.json"), "r", encoding="utf-8") as f:
+        key = json.load(f)
+    return questions, key
+
+
+def _compiled_exam(configs_dir: str):
+    """The exam compiled in memory, so benchmarks leave `configs_dir` untouched."""
+    from essay_grader.exam import compile_exam
+
+    return compile_exam(*_load_configs(configs_dir))
+
+
+def _synthetic_lines(configs_dir: str) -> List[str]:
+    """OCR-like lines built from the answer key, used when OCR is unavailable."""
+    lines: List[str] = []
+    for qid, q in _compiled_exam(configs_dir).questions.items():
+        parts = [p for p in q.key.split("\n") if p.strip()]
+        lines.append(f"{qid}. {parts[0]}")
+        lines.extend(parts[1:])
+    return lines
+
+
+def bench_preprocess(images: List[str], repeat: int) -> Dict[str, Any]:
+    if not _has("cv2"):
+        return _skip("opencv-python is not installed")
+    from essay_grader.reader import PREPROCESS_PROFILES, PreprocessConfig, preprocess_image
+
+    out: Dict[str, Any] = {}
+    for profile in PREPROCESS_PROFILES:
+        cfg = PreprocessConfig.profile(profile)
+        samples: List[float] = []
+        for img in images:
+            samples += time_calls(lambda: preprocess_image(img, cfg), repeat)
+        out[profile] = summarize(samples)
+    return out
+
+
+def bench_ocr(images: List[str], lang: str, repeat: int) -> Dict[str, Any]:
+    if not _has("paddleocr"):
+        return _skip("paddleocr is not installed")
+    from essay_grader.ocr_engine import OCREngineConfig, clear_engines, get_paddle_ocr
+    from essay_grader.ocr_extractor import OCRExtractor
+    from essay_grader.reader import PreprocessConfig, preprocess_image
+
+    clear_engines()
+    cfg = OCREngineConfig(lang=lang)
+    t0 = time.perf_counter()
+    ocr = get_paddle_ocr(cfg)
+    cold = time.perf_counter() - t0
+
+    pages = [preprocess_image(img, PreprocessConfig.profile("fast")).ocr_image for img in images]
+    lines: List[List[str]] = []
+    samples: List[float] = []
+    for page in pages:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            res = list(ocr.predict(input=page))
+            samples.append(time.perf_counter() - t0)
+        lines.append(OCRExtractor.lines_from_results(res))
+    return {"cold_init_seconds": round(cold, 4), "warm_predict": summarize(samples), "_lines": lines}
+
+
+def bench_group(lines_per_page: List[List[str]], repeat: int) -> Dict[str, Any]:
+    from essay_grader.ocr_extractor import OCRExtractor
+
+    extractor = OCRExtractor()
+    samples: List[float] = []
+    for lines in lines_per_page:
+        samples += time_calls(lambda: extractor.group_by_question(lines), repeat * 100)
+    return summarize(samples)
+
+
+def bench_segment(repeat: int, lines: int = 2000) -> Dict[str, Any]:
+    """Geometry-aware segmentation of a dense synthetic two-column page."""
+    from essay_grader.segmentation import OCRLine, segment_pages
+
+    page = []
+    for i in range(lines):
+        col, row = i % 2, i // 2
+        text = f"{row // 25 + 1 + col * 40}. answer" if row % 25 == 0 else f"line {row} of column {col}"
+        x0 = 50 + col * 600 + (0 if row % 25 == 0 else 30)
+        page.append(OCRLine(text, (x0, 30.0 * row, x0 + 400, 30.0 * row + 20), 0.9))
+    result = summarize(time_calls(lambda: segment_pages([page]), repeat))
+    result["lines"] = lines
+    return result
+
+
+def bench_correct(answers: List[str], students: int) -> Dict[str, Any]:
+    """Compare the old one-call-per-answer path with batched, cached correction."""
+    from essay_grader.vietnamese_corrector import ProtonXOfflineConfig, ProtonXOfflineCorrector
+
+    cfg = ProtonXOfflineConfig()
+    corrector = ProtonXOfflineCorrector(cfg)
+    try:
+        t0 = time.perf_counter()
+        client = corrector._get_client()
+        load = time.perf_counter() - t0
+    except RuntimeError as e:
+        return _skip(str(e))
+
+    def per_answer() -> None:
+        for _ in range(students):
+            for text in answers:
+                client.text.correct(input=text, top_k=cfg.top_k, model=cfg.model)
+
+    def batched() -> None:
+        fresh = ProtonXOfflineCorrector(cfg)
+        fresh._client = client  # share the loaded model; only the call pattern differs
+        for _ in range(students):
+            fresh.correct_many(answers)
+
+    t_old = time_calls(per_answer, 1)[0]
+    t_new = time_calls(batched, 1)[0]
+    return {
+        "model_load_seconds": round(load, 4),
+        "students": students,
+        "per_answer_seconds": round(t_old, 4),
+        "batched_seconds": round(t_new, 4),
+        "speedup": round(t_old / t_new, 2) if t_new > 0 else None,
+    }
+
+
+def bench_grade(url: str, answers: Dict[str, str], configs_dir: str, repeat: int) -> Dict[str, Any]:
+    """Time grading one student per question and with a single combined request."""
+    if not _has("openai"):
+        return _skip("openai is not installed")
+    from essay_grader.llama_grader import LlamaGrader
+    from essay_grader.metrics import Metrics
+
+    exam = _compiled_exam(configs_dir)
+    items = {qid: (q.text, q.key, answers.get(qid, ""), q.max_score) for qid, q in exam.questions.items()}
+    rubrics = {qid: q.rubric for qid, q in exam.questions.items()}
+
+    per_question, per_student = [], []
+    m_question, m_student = Metrics(), Metrics()
+    with LlamaGrader(api_url=url, model="stub") as grader:
+        for _ in range(repeat):
+            for qid, item in items.items():
+                t0 = time.perf_counter()
+                grader.grade(*item, metrics=m_question, prefix=exam.questions[qid].prompt_prefix)
+                per_question.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            grader.grade_student(items, metrics=m_student, rubrics=rubrics)
+            per_student.append(time.perf_counter() - t0)
+
+    tokens_q = m_question.to_dict()["counters"].get("llm.prompt_tokens", 0) / repeat
+    tokens_s = m_student.to_dict()["counters"].get("llm.prompt_tokens", 0) / repeat
+    return {
+        "question": dict(summarize(per_question), prompt_tokens_per_student=tokens_q),
+        "student": dict(summarize(per_student), prompt_tokens_per_student=tokens_s),
+        "prompt_token_savings": round(1 - tokens_s / tokens_q, 3) if tokens_q else None,
+    }
+
+
+def bench_prompt_cache(url: str, answers: Dict[str, str], configs_dir: str, students: int) -> Dict[str, Any]:
+    """Time-to-first-token grading many students per question, with and without prefix-cache hints."""
+    if not _has("openai"):
+        return _skip("openai is not installed")
+    from essay_grader.llama_grader import LlamaGrader
+    from essay_grader.metrics import Metrics
+
+    exam = _compiled_exam(configs_dir)
+
+    out: Dict[str, Any] = {}
+    for label, prompt_cache in (("no_hints", False), ("cache_prompt", True)):
+        ttft: List[float] = []
+        metrics = Metrics()
+        with LlamaGrader(api_url=url, model="stub", prompt_cache=prompt_cache, stream=True) as grader:
+            for qid, q in exam.questions.items():
+                for n in range(students):
+                    # Distinct answers, so only the shared prefix can be reused.
+                    text = f"{answers.get(qid, '')} ({n})"
+                    before = metrics.to_dict()["stages"].get("llm.ttft", {}).get("total_seconds", 0.0)
+                    grader.grade(q.text, q.key, text, q.max_score, metrics=metrics, prefix=q.prompt_prefix)
+                    ttft.append(metrics.to_dict()["stages"].get("llm.ttft", {}).get("total_seconds", 0.0) - before)
+        counters = metrics.to_dict()["counters"]
+        prompt = counters.get("llm.prompt_tokens", 0)
+        out[label] = dict(
+            summarize(ttft),
+            cached_prompt_fraction=round(counters.get("llm.cached_prompt_tokens", 0) / prompt, 3) if prompt else None,
+        )
+    if out["no_hints"]["p50"] > 0:
+        out["ttft_p50_speedup"] = round(out["no_hints"]["p50"] / max(out["cache_prompt"]["p50"], 1e-9), 2)
+    return out
+
+
+def bench_exam(configs_dir: str, repeat: int) -> Dict[str, Any]:
+    """Time compiling the exam configs against loading the compiled artifact.
+
+    Loading includes fitting the pre-grader, which a compiled exam brings
+    precomputed.
+    """
+    from essay_grader.exam import CompiledExam, compile_exam
+    from essay_grader.pregrader import PreGrader
+
+    questions, key = _load_configs(configs_dir)
+
+    def compile_and_fit() -> None:
+        PreGrader.for_exam(compile_exam(questions, key))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "exam.json")
+        compile_exam(questions, key).save(path)
+        t_compile = time_calls(compile_and_fit, repeat)
+        t_load = time_calls(lambda: PreGrader.for_exam(CompiledExam.load(path)), repeat)
+        size = os.path.getsize(path)
+    compile_p50 = percentile(t_compile, 50)
+    load_p50 = percentile(t_load, 50)
+    return {
+        "compile": summarize(t_compile),
+        "load": summarize(t_load),
+        "artifact_bytes": size,
+        "speedup": round(compile_p50 / load_p50, 2) if load_p50 > 0 else None,
+    }
+
+
+def bench_e2e(samples_dir: str, url: str, configs_dir: str, lang: str, concurrency: int) -> Dict[str, Any]:
+    if not (_has("paddleocr") and _has("openai") and _has("cv2")):
+        return _skip("needs paddleocr, openai and opencv-python")
+    from essay_grader.workflow import collect_inputs, run_batch
+
+    pages = len(collect_inputs(samples_dir))
+    per_student: List[float] = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        t0 = time.perf_counter()
+        summary = run_batch(
+            samples_dir,
+            configs_dir=configs_dir,
+            results_dir=out_dir,
+            ocr_lang=lang,
+            api_url=url,
+            model="stub",
+            max_concurrency=concurrency,
+        )
+        wall = time.perf_counter() - t0
+        for entry in summary["students"]:
+            if "result" in entry:
+                with open(entry["result"], "r", encoding="utf-8") as f:
+                    stages = json.load(f).get("metrics", {}).get("stages", {})
+                if "student.total" in stages:
+                    per_student.append(stages["student.total"]["total_seconds"])
+    return {
+        "pages": pages,
+        "failed": summary["num_failed"],
+        "wall_seconds": round(wall, 4),
+        "pages_per_min": round(pages / wall * 60.0, 2) if wall > 0 else 0.0,
+        "student_latency": summarize(per_student),
+    }
+
+
+def _flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if k.startswith("_"):
+                continue
+            out.update(_flatten(v, f"{prefix}{k}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        out[prefix.rstrip(".")] = float(data)
+    return out
+
+
+# Leaf names we compare; True means higher is better.
+_COMPARED = {"p50": False, "p95": False, "cold_init_seconds": False, "pages_per_min": True, "speedup": True}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Return metrics that got worse than `baseline` by more than `tolerance` (a fraction)."""
+    cur = _flatten(current.get("results", {}))
+    base = _flatten(baseline.get("results", {}))
+    regressions = []
+    for name, old in base.items():
+        leaf = name.rsplit(".", 1)[-1]
+        if leaf not in _COMPARED or name not in cur or old <= 0:
+            continue
+        new = cur[name]
+        higher_is_better = _COMPARED[leaf]
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": old, "current": new, "worse_by": round(change, 3)})
+    peak_old = baseline.get("peak_rss_mb")
+    peak_new = current.get("peak_rss_mb")
+    if peak_old and peak_new and (peak_new - peak_old) / peak_old > tolerance:
+        regressions.append(
+            {"metric": "peak_rss_mb", "baseline": peak_old, "current": peak_new, "worse_by": round((peak_new - peak_old) / peak_old, 3)}
+        )
+    return regressions
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    images = sorted(
+        glob.glob(os.path.join(args.samples, "handwritten_*.png")) + glob.glob(os.path.join(args.samples, "typed.png"))
+    )
+    if not images:
+        raise SystemExit(f"No sample images found in {args.samples}")
+
+    server = start_stub_server(
+        latency=args.llm_latency, per_token=args.llm_per_token, per_prompt_token=args.llm_per_prompt_token
+    )
+    llm_url = args.llm_url or server.url
+    results: Dict[str, Any] = {}
+    try:
+        results["preprocess"] = bench_preprocess(images, args.repeat)
+        ocr = bench_ocr(images, args.ocr_lang, args.repeat)
+        lines = ocr.pop("_lines", None) or [_synthetic_lines(args.configs)]
+        results["ocr"] = ocr
+        results["group_by_question"] = bench_group(lines, args.repeat)
+        results["segment"] = bench_segment(args.repeat)
+        results["exam"] = bench_exam(args.configs, args.repeat)
+
+        from essay_grader.ocr_extractor import OCRExtractor
+
+        answers = OCRExtractor().group_by_question(lines[0])
+        results["correct"] = bench_correct(list(answers.values()), args.students)
+        results["grade"] = bench_grade(llm_url, answers, args.configs, args.repeat)
+        results["prompt_cache"] = bench_prompt_cache(llm_url, answers, args.configs, args.students)
+        results["end_to_end"] = bench_e2e(args.samples, llm_url, args.configs, args.ocr_lang, args.concurrency)
+        results["llm_requests"] = server.requests
+    finally:
+        server.shutdown()
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {
+            "repeat": args.repeat,
+            "llm_latency": args.llm_latency,
+            "llm_per_token": args.llm_per_token,
+            "llm_per_prompt_token": args.llm_per_prompt_token,
+            "llm_url": args.llm_url,
+            "concurrency": args.concurrency,
+            "students": args.students,
+        },
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="AutoEssayGrader benchmark suite")
+    p.add_argument("--samples", default=str(ROOT / "samples"), help="Directory with handwritten_*.png and typed.png")
+    p.add_argument("--configs", default=str(ROOT / "configs"))
+    p.add_argument("--ocr-lang", default="vi")
+    p.add_argument("--repeat", type=int, default=3, help="Repetitions per image/question")
+    p.add_argument("--students", type=int, default=20, help="Simulated students for the correction benchmark")
+    p.add_argument("--concurrency", type=int, default=4, help="max_concurrency for the end-to-end run")
+    p.add_argument("--llm-latency", type=float, default=0.2, help="Stub LLM delay per request (s)")
+    p.add_argument("--llm-per-token", type=float, default=0.0, help="Stub LLM delay per completion token (s)")
+    p.add_argument(
+        "--llm-per-prompt-token",
+        type=float,
+        default=0.0005,
+        help="Stub LLM delay per prompt token not served from its prefix cache (s)",
+    )
+    p.add_argument("--llm-url", default=None, help="Benchmark this OpenAI-compatible server instead of the stub")
+    p.add_argument("--output", default=None, help="Also write the report to this file")
+    p.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    p.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    p.add_argument("--compare", action="store_true", help="Compare with the baseline; exit 1 on regressions")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    args = p.parse_args(argv)
+
+    report = run(args)
+    status = 0
+    if args.compare:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            report["regressions"] = compare(report, baseline, args.tolerance)
+            status = 1 if report["regressions"] else 0
+        else:
+            report["regressions"] = None
+            print(f"No baseline at {args.baseline}; run with --save-baseline first.", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Minimal OpenAI-compatible chat completions server for benchmarks.
+
+Answers every request with a valid grading JSON after a configurable delay,
+so the grading stage can be timed without a real model. Honors llama.cpp's
+`cache_prompt`/`id_slot` hints by charging `--per-prompt-token` only for the
+part of a prompt not shared with the slot's previous prompt, and supports
+streaming so time-to-first-token can be measured:
+
+    python benchmarks/stub_llm_server.py --port 2911 --latency 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+GRADE = {
+    "score": 5.0,
+    "max_score": 10.0,
+    "correctness": "partially_correct",
+    "matched_points": ["stub"],
+    "missing_points": [],
+    "feedback": "stub response",
+}
+
+
+_STUDENT_QUESTION = re.compile(r"^=== QUESTION (\S+) ", re.MULTILINE)
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        prompt = "".join(str(m.get("content", "")) for m in req.get("messages", []))
+        # Per-student prompts list each question under a "=== QUESTION <id>" header.
+        qids = _STUDENT_QUESTION.findall(prompt)
+        content = json.dumps({qid: GRADE for qid in qids} if qids else GRADE)
+        prompt_tokens = _approx_tokens(prompt)
+        completion_tokens = _approx_tokens(content)
+        cached = self.server.cached_prefix_tokens(prompt, req) if req.get("cache_prompt") else 0
+        self.server.count_request(prompt_tokens, completion_tokens, cached)
+        timings = {"prompt_n": prompt_tokens - cached, "cache_n": cached, "predicted_n": completion_tokens}
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        # Prompt processing happens before the first token, generation after.
+        time.sleep(self.server.latency + self.server.per_prompt_token * (prompt_tokens - cached))
+        if req.get("stream"):
+            self._stream(req, content, usage, timings)
+            return
+        time.sleep(self.server.per_token * completion_tokens)
+
+        self._send_json(
+            200,
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "stub"),
+                "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+                ],
+                "usage": usage,
+                "timings": timings,
+            },
+        )
+
+    def _stream(self, req: Dict[str, Any], content: str, usage: Dict[str, int], timings: Dict[str, int]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": req.get("model", "stub")}
+        pieces = [content[i : i + 16] for i in range(0, len(content), 16)]
+        for piece in pieces:
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.per_token * _approx_tokens(piece))
+        final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], timings=timings)
+        if (req.get("stream_options") or {}).get("include_usage"):
+            final["usage"] = usage
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        latency: float = 0.0,
+        per_token: float = 0.0,
+        per_prompt_token: float = 0.0,
+        slots: int = 4,
+    ) -> None:
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.per_token = per_token
+        self.per_prompt_token = per_prompt_token
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        # Last prompt held by each slot, mimicking llama.cpp's per-slot KV cache.
+        self._slots: List[str] = [""] * max(1, slots)
+        self._lock = threading.Lock()
+
+    def count_request(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> None:
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+
+    def cached_prefix_tokens(self, prompt: str, req: Dict[str, Any]) -> int:
+        """Tokens of `prompt` already in a slot's cache; the slot then holds `prompt`.
+
+        Uses `id_slot` when given, otherwise the slot with the longest common
+        prefix, like llama.cpp's similarity-based slot selection.
+        """
+        with self._lock:
+            slot = req.get("id_slot")
+            if not isinstance(slot, int) or not 0 <= slot < len(self._slots):
+                slot = max(range(len(self._slots)), key=lambda i: _common_prefix(self._slots[i], prompt))
+            shared = _common_prefix(self._slots[slot], prompt)
+            self._slots[slot] = prompt
+        return shared // 4
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_stub_server(
+    latency: float = 0.0, per_token: float = 0.0, per_prompt_token: float = 0.0, port: int = 0
+) -> StubServer:
+    """Start a stub server on a background thread; `port=0` picks a free port."""
+    server = StubServer(("127.0.0.1", port), latency=latency, per_token=per_token, per_prompt_token=per_prompt_token)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Stub OpenAI-compatible LLM server")
+    p.add_argument("--port", type=int, default=2911)
+    p.add_argument("--latency", type=float, default=0.5, help="Fixed delay per request in seconds")
+    p.add_argument("--per-token", type=float, default=0.0, help="Extra delay per completion token in seconds")
+    p.add_argument(
+        "--per-prompt-token", type=float, default=0.0, help="Delay per prompt token not served from the prefix cache"
+    )
+    args = p.parse_args()
+    server = StubServer(
+        ("127.0.0.1", args.port), latency=args.latency, per_token=args.per_token, per_prompt_token=args.per_prompt_token
+    )
+    print(f"Stub LLM listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
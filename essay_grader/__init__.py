@@ -1,7 +1,28 @@
+"""AutoEssayGrader: OCR, segmentation and LLM grading of handwritten essays.
+
+Submodules are imported on first attribute access (`essay_grader.workflow`),
+so importing the package itself loads none of them or their dependencies.
+"""
+
+import importlib
+
 __all__ = [
     "reader",
     "ocr_extractor",
     "llama_grader",
     "workflow",
+    "service",
     "utils",
 ]
+
+
+def __getattr__(name: str):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
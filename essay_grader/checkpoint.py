@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .utils import ensure_dir
+
+
+JOURNAL_FILENAME = "journal.jsonl"
+SCORES_FILENAME = "scores.csv"
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class RunJournal:
+    """Append-only JSON-lines log of finished students in a batch run.
+
+    A line is appended (and fsynced) only after the student's `result.json`
+    has been written, so every `"status": "done"` line points to a complete
+    result. A restarted run reads the journal to skip those students. A line
+    cut short by a crash is ignored.
+    """
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        ensure_dir(os.path.dirname(path) or ".")
+        self._lock = threading.Lock()
+        self._f = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume and self._f.tell() > 0 and not _ends_with_newline(path):
+            # Terminate a line cut short by a crash so the next entry stays readable.
+            self._f.write("\n")
+
+    @staticmethod
+    def read(path: str) -> Dict[str, Dict[str, Any]]:
+        """Latest journal entry per student id; missing file -> {}."""
+        entries: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(path):
+            return entries
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and "student_id" in entry:
+                    entries[entry["student_id"]] = entry
+        return entries
+
+    def completed(self) -> Dict[str, Dict[str, Any]]:
+        """Students whose latest entry is done and whose result file still exists.
+
+        A relative `result` path is taken relative to the journal's directory
+        and returned made absolute.
+        """
+        base = os.path.dirname(os.path.abspath(self.path))
+        done: Dict[str, Dict[str, Any]] = {}
+        for sid, e in self.read(self.path).items():
+            if e.get("status") != "done" or not e.get("result"):
+                continue
+            result = os.path.join(base, e["result"])
+            if os.path.exists(result):
+                done[sid] = dict(e, result=result)
+        return done
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(dict(entry, ts=round(time.time(), 3)), ensure_ascii=False)
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+class ScoreSheet:
+    """CSV of per-question scores, one row appended as each student finishes.
+
+    Columns: student_id, total_score, max_total_score, one column per
+    question id, error. With `append`, rows are added to an existing file
+    (the header is only written to a new or empty one).
+    """
+
+    def __init__(self, path: str, question_ids: List[str], append: bool = False) -> None:
+        self.path = path
+        self.question_ids = list(question_ids)
+        ensure_dir(os.path.dirname(path) or ".")
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self._lock = threading.Lock()
+        self._f = open(path, "a" if append else "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._f)
+        if write_header:
+            self._writer.writerow(["student_id", "total_score", "max_total_score", *self.question_ids, "error"])
+            self._f.flush()
+
+    def add(self, student_id: str, final: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        grading = (final or {}).get("grading", {})
+        row = [
+            student_id,
+            (final or {}).get("total_score", ""),
+            (final or {}).get("max_total_score", ""),
+            *[grading.get(qid, {}).get("score", "") for qid in self.question_ids],
+            error or "",
+        ]
+        with self._lock:
+            self._writer.writerow(row)
+            self._f.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
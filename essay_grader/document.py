@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# cv2 and numpy are imported where pages are decoded, so listing and
+# counting pages (e.g. for a batch served from cached OCR) stays cheap.
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+PDF_EXTENSIONS = (".pdf",)
+DOCUMENT_EXTENSIONS = IMAGE_EXTENSIONS + PDF_EXTENSIONS
+_MULTIPAGE_IMAGE_EXTENSIONS = (".tif", ".tiff")
+
+# Rendering resolution for PDF pages; pages are additionally capped to the
+# preprocessing `max_side`, so a large page is never rendered bigger than
+# OCR will see it.
+DEFAULT_DPI = 200
+
+# (file path, 0-based page index within that file)
+PageRef = Tuple[str, int]
+Source = Union[str, Sequence[str]]
+
+
+def _suffix(path: str) -> str:
+    return Path(path).suffix.lower()
+
+
+def is_pdf(path: str) -> bool:
+    return _suffix(path) in PDF_EXTENSIONS
+
+
+_pdf_local = threading.local()
+
+
+def _open_pdf(path: str) -> Tuple[str, Any]:
+    """Open `path` with pypdfium2 or PyMuPDF; the last document is kept open per thread.
+
+    Returns (backend, document). Consecutive pages of one PDF then share a
+    parsed document instead of reopening the file for every page, until the
+    thread calls `release_documents`.
+    """
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    cached = getattr(_pdf_local, "doc", None)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2]
+    try:
+        import pypdfium2 as pdfium  # type: ignore
+
+        backend, doc = "pdfium", pdfium.PdfDocument(path)
+    except ImportError:
+        try:
+            import fitz  # type: ignore  # PyMuPDF
+        except ImportError as e:
+            raise RuntimeError(
+                "PDF input requires pypdfium2 or PyMuPDF. Install one with: pip install pypdfium2"
+            ) from e
+        backend, doc = "fitz", fitz.open(path)
+    release_documents()
+    _pdf_local.doc = (key, backend, doc)
+    return backend, doc
+
+
+def release_documents() -> None:
+    """Close the PDF the calling thread keeps open, if any (see `_open_pdf`)."""
+    cached = getattr(_pdf_local, "doc", None)
+    _pdf_local.doc = None
+    if cached is not None:
+        cached[2].close()
+
+
+def _pdf_page_count(path: str) -> int:
+    backend, doc = _open_pdf(path)
+    return len(doc) if backend == "pdfium" else doc.page_count
+
+
+def _render_pdf_page(path: str, index: int, dpi: int, max_side: Optional[int]) -> np.ndarray:
+    import cv2
+    import numpy as np
+
+    backend, doc = _open_pdf(path)
+    if backend == "pdfium":
+        page = doc[index]
+        try:
+            width, height = page.get_size()  # points (1/72 inch)
+            scale = dpi / 72.0
+            if max_side:
+                scale = min(scale, max_side / float(max(width, height)))
+            bitmap = page.render(scale=scale)
+            try:
+                # Copy out of the bitmap's buffer before it is freed.
+                img = np.array(bitmap.to_numpy(), copy=True)
+            finally:
+                bitmap.close()
+        finally:
+            page.close()
+        # pdfium renders BGR(A) by default, which is what OpenCV expects.
+        if img.ndim == 3 and img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    else:
+        page = doc.load_page(index)
+        rect = page.rect
+        scale = dpi / 72.0
+        if max_side:
+            scale = min(scale, max_side / float(max(rect.width, rect.height)))
+        import fitz  # type: ignore
+
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        # cvtColor copies, so the pixmap can be released.
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR if pix.n == 3 else cv2.COLOR_GRAY2BGR)
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return img
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue  # markers without a length
+        length = struct.unpack(">H", f.read(2))[0]
+        # Start-of-frame markers (except DHT, JPG and DAC) carry the size.
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def image_size(path: str, index: int = 0, dpi: int = DEFAULT_DPI) -> Optional[Tuple[int, int]]:
+    """(width, height) in pixels from the file header, without decoding pixels.
+
+    Known for PNG, JPEG and BMP files and for PDF pages (at `dpi`); None for
+    other formats or unreadable headers.
+    """
+    if is_pdf(path):
+        backend, doc = _open_pdf(path)
+        if backend == "pdfium":
+            width, height = doc.get_page_size(index)
+        else:
+            rect = doc.load_page(index).rect
+            width, height = rect.width, rect.height
+        return int(width * dpi / 72.0), int(height * dpi / 72.0)
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                return struct.unpack(">II", head[16:24])
+            if head[:2] == b"\xff\xd8":
+                return _jpeg_size(f)
+            if head[:2] == b"BM":
+                width, height = struct.unpack("<ii", head[18:26])
+                return width, abs(height)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+def decode_reduction(size: Optional[Tuple[int, int]], max_side: Optional[int]) -> int:
+    """Largest factor of 2, 4 or 8 by which an image can be decoded and still have `max_side` pixels.
+
+    The page is resized to `max_side` afterwards anyway, so decoding it
+    reduced loses nothing and never holds the full-resolution bitmap.
+    """
+    if size is None or not max_side:
+        return 1
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if longest // factor >= max_side:
+            return factor
+    return 1
+
+
+def page_count(path: str) -> int:
+    """Number of pages in one input file, without decoding any page."""
+    if is_pdf(path):
+        return _pdf_page_count(path)
+    if _suffix(path) in _MULTIPAGE_IMAGE_EXTENSIONS:
+        import cv2
+
+        if not hasattr(cv2, "imcount"):
+            return 1
+        try:
+            return max(1, int(cv2.imcount(path)))
+        except cv2.error:
+            return 1
+    return 1
+
+
+def _page_files(directory: str) -> List[str]:
+    return sorted(
+        str(p) for p in Path(directory).iterdir() if p.is_file() and p.suffix.lower() in DOCUMENT_EXTENSIONS
+    )
+
+
+def page_refs(source: Source, pages: Optional[Tuple[int, int]] = None) -> List[PageRef]:
+    """Expand a submission into the ordered pages it consists of.
+
+    `source` is an image, a multi-page TIFF, a PDF, a directory of page
+    files (sorted by name) or a list of such paths. `pages` (start, end)
+    keeps only that slice of the expanded pages, e.g. one student's pages of
+    a class PDF. Nothing is decoded here.
+    """
+    paths = [source] if isinstance(source, (str, os.PathLike)) else list(source)
+    refs: List[PageRef] = []
+    try:
+        for path in map(str, paths):
+            files = _page_files(path) if os.path.isdir(path) else [path]
+            for f in files:
+                refs.extend((f, i) for i in range(page_count(f)))
+    finally:
+        release_documents()
+    if pages is not None:
+        refs = refs[pages[0] : pages[1]]
+    return refs
+
+
+def load_page(path: str, index: int = 0, max_side: Optional[int] = None, dpi: int = DEFAULT_DPI) -> np.ndarray:
+    """Decode one page as a BGR image; only that page is rendered.
+
+    PDF pages are rendered at `dpi`, scaled down so the longest side is at
+    most `max_side`. Images at least twice as large as `max_side` are
+    decoded at 1/2, 1/4 or 1/8 resolution (`cv2.IMREAD_REDUCED_COLOR_*`),
+    which for JPEG scales in the decoder itself. Raises FileNotFoundError if
+    the page cannot be loaded.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Could not load image: {path}")
+    if is_pdf(path):
+        return _render_pdf_page(path, index, dpi, max_side)
+    import cv2
+
+    if index > 0:
+        ok, mats = cv2.imreadmulti(path, start=index, count=1)
+        img = mats[0] if ok and mats else None
+        if img is not None and img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    else:
+        factor = decode_reduction(image_size(path), max_side)
+        flags = getattr(cv2, f"IMREAD_REDUCED_COLOR_{factor}", cv2.IMREAD_COLOR) if factor > 1 else cv2.IMREAD_COLOR
+        img = cv2.imread(path, flags)
+    if img is None:
+        raise FileNotFoundError(f"Could not load image: {path} (page {index + 1})")
+    return img
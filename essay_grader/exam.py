@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .llama_grader import PROMPT_VERSION, STUDENT_PROMPT_VERSION, prompt_prefix, rubric
+from .manifest import content_hash, file_hash
+from .pregrader import NUMBER_RE, PreGradeConfig, PreGrader, normalize_text, word_tokens
+from .utils import ensure_dir, load_json_file, save_json_file
+
+
+# Bump whenever the compiled layout or how it is derived changes, so stale
+# artifacts on disk are recompiled.
+COMPILE_VERSION = "1"
+DEFAULT_MAX_SCORE = 10.0
+COMPILED_DIRNAME = ".compiled"
+
+QUESTIONS_FILENAME = "questions.json"
+ANSWER_KEY_FILENAME = "answer_key.json"
+
+# "- point", "* point", "• point", "a) point", "1. point"
+_BULLET = re.compile(r"^\s*(?:[-*•+]|\(?[A-Za-z0-9]{1,2}[.)])\s+")
+# Braces, semicolons, indented lines or calls: split code by sentence and
+# it falls apart, so such keys stay one point.
+_CODE = re.compile(r"[{};]|^[ \t]{2,}\S|\w\(.*\)", re.MULTILINE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_points(key: str) -> List[str]:
+    """Rubric points of an answer key: its bullet lines, else its sentences.
+
+    Keys that look like code are kept as a single point.
+    """
+    lines = [line for line in key.splitlines() if line.strip()]
+    if len(lines) >= 2 and all(_BULLET.match(line) for line in lines):
+        return [_BULLET.sub("", line).strip() for line in lines]
+    if _CODE.search(key):
+        return [key.strip()] if key.strip() else []
+    return [s.strip() for s in _SENTENCE_END.split(" ".join(line.strip() for line in lines)) if s.strip()]
+
+
+@dataclass(frozen=True)
+class CompiledQuestion:
+    """One question with everything grading derives from it, computed once.
+
+    `points` are the rubric points of the key (given in the config or split
+    out of the key text). `normalized_key`, `key_words` and `key_numbers`
+    are what the pre-grader matches answers against, `key_vector` the key's
+    character n-gram TF-IDF vector. `prompt_prefix` and `rubric` are the
+    shared parts of the per-question and per-student LLM prompts.
+    """
+
+    qid: str
+    text: str
+    key: str
+    max_score: float = DEFAULT_MAX_SCORE
+    weight: float = 1.0
+    points: Tuple[str, ...] = ()
+    normalized_key: str = ""
+    key_words: Tuple[str, ...] = ()
+    key_numbers: Tuple[str, ...] = ()
+    key_vector: Dict[str, float] = field(default_factory=dict, compare=False, hash=False)
+    prompt_prefix: str = ""
+    rubric: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "qid": self.qid,
+            "text": self.text,
+            "key": self.key,
+            "max_score": self.max_score,
+            "weight": self.weight,
+            "points": list(self.points),
+            "normalized_key": self.normalized_key,
+            "key_words": list(self.key_words),
+            "key_numbers": list(self.key_numbers),
+            "key_vector": self.key_vector,
+            "prompt_prefix": self.prompt_prefix,
+            "rubric": self.rubric,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompiledQuestion":
+        return cls(
+            qid=str(data["qid"]),
+            text=data["text"],
+            key=data["key"],
+            max_score=float(data["max_score"]),
+            weight=float(data["weight"]),
+            points=tuple(data["points"]),
+            normalized_key=data["normalized_key"],
+            key_words=tuple(data["key_words"]),
+            key_numbers=tuple(data["key_numbers"]),
+            key_vector={g: float(v) for g, v in data["key_vector"].items()},
+            prompt_prefix=data["prompt_prefix"],
+            rubric=data["rubric"],
+        )
+
+
+@dataclass(frozen=True)
+class CompiledExam:
+    """The exam configs compiled for grading; see `compile_exam` and `load_exam`.
+
+    `questions` keeps the order of `questions.json`. `document_frequency`
+    and `n_docs` are the pre-grader's IDF statistics over the exam's
+    questions and keys for `ngram_sizes`. `version` is a hash of the
+    sources and of everything compilation depends on.
+    """
+
+    version: str
+    questions: Dict[str, CompiledQuestion]
+    ngram_sizes: Tuple[int, ...] = PreGradeConfig.ngram_sizes
+    document_frequency: Dict[str, int] = field(default_factory=dict, compare=False, hash=False)
+    n_docs: int = 0
+
+    @property
+    def question_ids(self) -> List[str]:
+        return list(self.questions)
+
+    @property
+    def max_scores(self) -> Dict[str, float]:
+        return {qid: q.max_score for qid, q in self.questions.items()}
+
+    @property
+    def weights(self) -> Dict[str, float]:
+        return {qid: q.weight for qid, q in self.questions.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "version": self.version[:16],
+            "questions": len(self.questions),
+            "max_total_score": round(sum(q.max_score for q in self.questions.values()), 2),
+            "max_scores": self.max_scores,
+            "weights": self.weights,
+            "points": {qid: len(q.points) for qid, q in self.questions.items()},
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compile_version": COMPILE_VERSION,
+            "version": self.version,
+            "ngram_sizes": list(self.ngram_sizes),
+            "n_docs": self.n_docs,
+            "document_frequency": self.document_frequency,
+            "questions": [q.to_dict() for q in self.questions.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompiledExam":
+        if data.get("compile_version") != COMPILE_VERSION:
+            raise ValueError(f"Compiled exam has version {data.get('compile_version')!r}, expected {COMPILE_VERSION!r}")
+        questions = [CompiledQuestion.from_dict(q) for q in data["questions"]]
+        return cls(
+            version=data["version"],
+            questions={q.qid: q for q in questions},
+            ngram_sizes=tuple(data["ngram_sizes"]),
+            document_frequency={g: int(n) for g, n in data["document_frequency"].items()},
+            n_docs=int(data["n_docs"]),
+        )
+
+    def save(self, path: str) -> None:
+        ensure_dir(os.path.dirname(path) or ".")
+        save_json_file(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledExam":
+        return cls.from_dict(load_json_file(path))
+
+
+def _entry(value: Any, text_fields: Tuple[str, ...], what: str, qid: str) -> Tuple[str, Dict[str, Any]]:
+    """(text, options) of a config entry given as a string or an object."""
+    if isinstance(value, dict):
+        for name in text_fields:
+            if name in value:
+                return str(value[name]), value
+        raise ValueError(f"{what} {qid!r} has none of the fields {text_fields}")
+    return str(value), {}
+
+
+def compile_exam(
+    questions: Dict[str, Any], answer_key: Dict[str, Any], version: Optional[str] = None
+) -> CompiledExam:
+    """Compile question and answer-key configs (as loaded from JSON).
+
+    A question is its text or an object with `text` and optionally
+    `max_score` (default 10) and `weight` (default 1, used for the weighted
+    total). A key is its text or an object with `text` and optionally
+    `points`, the rubric points; otherwise they are split out of the text.
+    """
+    parsed: Dict[str, Tuple[str, str, Dict[str, Any], Dict[str, Any]]] = {}
+    for qid, value in questions.items():
+        qid = str(qid)
+        text, q_opts = _entry(value, ("text", "question"), "Question", qid)
+        key, k_opts = _entry(answer_key.get(qid, ""), ("text", "answer"), "Answer key", qid)
+        parsed[qid] = (text, key, q_opts, k_opts)
+
+    cfg = PreGradeConfig()
+    pregrader = PreGrader([p[0] for p in parsed.values()] + [p[1] for p in parsed.values()], cfg)
+    compiled: Dict[str, CompiledQuestion] = {}
+    for qid, (text, key, q_opts, k_opts) in parsed.items():
+        max_score = float(q_opts.get("max_score", DEFAULT_MAX_SCORE))
+        weight = float(q_opts.get("weight", 1.0))
+        if max_score <= 0 or weight < 0:
+            raise ValueError(f"Question {qid!r}: max_score must be positive and weight non-negative")
+        points = k_opts.get("points")
+        normalized = normalize_text(key)
+        compiled[qid] = CompiledQuestion(
+            qid=qid,
+            text=text,
+            key=key,
+            max_score=max_score,
+            weight=weight,
+            points=tuple(str(p) for p in points) if points else tuple(split_points(key)),
+            normalized_key=normalized,
+            key_words=tuple(sorted(set(word_tokens(normalized)))),
+            key_numbers=tuple(NUMBER_RE.findall(normalized)),
+            key_vector=pregrader.key_vector(key),
+            prompt_prefix=prompt_prefix(text, key, max_score),
+            rubric=rubric(text, key, max_score),
+        )
+    if version is None:
+        version = content_hash(COMPILE_VERSION, PROMPT_VERSION, STUDENT_PROMPT_VERSION, questions, answer_key)
+    df, n_docs = pregrader.idf_stats()
+    return CompiledExam(
+        version=version,
+        questions=compiled,
+        ngram_sizes=tuple(cfg.ngram_sizes),
+        document_frequency=df,
+        n_docs=n_docs,
+    )
+
+
+ExamLike = Union[CompiledExam, Tuple[Dict[str, Any], Dict[str, Any]]]
+
+
+def as_compiled(exam: ExamLike) -> CompiledExam:
+    """`exam` itself, or a (questions, answer_key) pair compiled in memory."""
+    if isinstance(exam, CompiledExam):
+        return exam
+    questions, answer_key = exam
+    return compile_exam(questions, answer_key)
+
+
+_compiled: Dict[str, CompiledExam] = {}
+_compiled_lock = threading.Lock()
+
+
+def exam_version(configs_dir: str) -> str:
+    """Version of the exam in `configs_dir`: a hash of its config files and the compiler."""
+    return content_hash(
+        COMPILE_VERSION,
+        PROMPT_VERSION,
+        STUDENT_PROMPT_VERSION,
+        file_hash(os.path.join(configs_dir, QUESTIONS_FILENAME)),
+        file_hash(os.path.join(configs_dir, ANSWER_KEY_FILENAME)),
+    )
+
+
+def compiled_path(configs_dir: str, version: str) -> str:
+    return os.path.join(configs_dir, COMPILED_DIRNAME, f"exam-{version[:16]}.json")
+
+
+def load_exam(configs_dir: str = "configs", compile_only: bool = False) -> CompiledExam:
+    """The compiled exam of `configs_dir`, compiled at most once per version.
+
+    The artifact is read from (or written to)
+    `configs_dir/.compiled/exam-<version>.json`, so later runs skip
+    compilation, and kept per process, so every grading worker of a run
+    shares one instance. Editing either config file changes the version and
+    triggers a recompile. With `compile_only`, the artifact is rebuilt even
+    if one exists.
+    """
+    version = exam_version(configs_dir)
+    with _compiled_lock:
+        exam = None if compile_only else _compiled.get(version)
+        if exam is not None:
+            return exam
+        path = compiled_path(configs_dir, version)
+        if not compile_only and os.path.exists(path):
+            try:
+                exam = CompiledExam.load(path)
+            except (OSError, ValueError, KeyError, TypeError):
+                exam = None  # stale or damaged; recompile
+            if exam is not None and exam.version != version:
+                exam = None
+        if exam is None:
+            exam = compile_exam(
+                load_json_file(os.path.join(configs_dir, QUESTIONS_FILENAME)),
+                load_json_file(os.path.join(configs_dir, ANSWER_KEY_FILENAME)),
+                version,
+            )
+            try:
+                exam.save(path)
+            except OSError:
+                pass  # read-only configs: the in-process copy still serves this run
+        _compiled[version] = exam
+        return exam
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class GradeCache:
+    """On-disk SQLite cache of validated grading results.
+
+    Entries are keyed by a content hash of everything that determines the LLM
+    output (see `make_key`). Old entries are dropped after `max_age_seconds`
+    and the least recently used ones once the cache holds more than
+    `max_entries`. Safe to share between threads; several processes may use
+    the same file.
+    """
+
+    _EVICT_EVERY = 256
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100_000,
+        max_age_seconds: Optional[float] = 90 * 24 * 3600,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS grades ("
+                " key TEXT PRIMARY KEY,"
+                " result TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS grades_accessed ON grades(accessed_at)")
+        self.evict()
+
+    @staticmethod
+    def make_key(
+        question: str,
+        answer_key: str,
+        student_text: str,
+        max_score: float,
+        model: str,
+        prompt_version: str,
+        temperature: float = 0.0,
+    ) -> str:
+        """Return a stable SHA-256 key for one grading request."""
+        payload = json.dumps(
+            [question, answer_key, student_text, float(max_score), model, prompt_version, float(temperature)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT result, created_at FROM grades WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age_seconds is not None and row[1] < now - self.max_age_seconds:
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE grades SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO grades (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result, ensure_ascii=False), now, now),
+                )
+            self._puts += 1
+            evict = self._puts % self._EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries and trim to `max_entries`; returns rows removed."""
+        removed = 0
+        with self._lock, self._conn:
+            if self.max_age_seconds is not None:
+                cur = self._conn.execute("DELETE FROM grades WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+                removed += cur.rowcount
+            count = self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                cur = self._conn.execute(
+                    "DELETE FROM grades WHERE key IN (SELECT key FROM grades ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                removed += cur.rowcount
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM grades").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": size,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,100 +1,159 @@
 from __future__ import annotations
 
-import json
-from typing import Dict, Any
+import hashlib
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
 
-from openai import OpenAI
+from .grade_cache import GradeCache
+from .metrics import Metrics, timed
+from .retry import REJECTED, TRANSIENT, RetryBudget, RetryPolicy, classify_error, retry_after_seconds
+from .schema import OutputLimits, max_tokens_for_schema, result_schema, schema_response_format, student_schema
+from .utils import repair_json, safe_json_loads
 
-from .utils import safe_json_loads
 
+# Bump whenever the prompt text or request parameters change, so cached
+# grades produced by an older prompt are not reused.
+PROMPT_VERSION = "3"
+# Cache namespace for grades produced by the combined per-student prompt.
+STUDENT_PROMPT_VERSION = f"student-{PROMPT_VERSION}"
 
-def grade_essay(
-    question: str,
-    answer_key: str,
-    student_text: str,
-    max_score: float,
-    api_url: str = "http://localhost:2911/v1",
-    model: str = "Llama-3.1-8B-Instruct",
-    temperature: float = 0.0,
-    timeout: int = 60,
-) -> Dict[str, Any]:
-    """Call local Llama API to grade an essay answer strictly vs answer key.
+# Strictest first; the grader steps down when the server rejects one.
+OUTPUT_FORMATS = ("json_schema", "json_object", "text")
 
-    Returns a dict with the schema specified in the project requirements.
-    """
-    prompt = f"""
+_SYSTEM_PROMPT = "You are a grading engine that outputs strict JSON only."
+
+# Prompts are laid out from most to least shared: fixed instructions, then
+# the question and its key, then the student's answer. Servers that cache
+# the KV state of a prompt prefix (llama.cpp `cache_prompt`) then only
+# evaluate the answer when the same question is graded for the next student.
+_INSTRUCTIONS = """
 You are an automated grading system.
 Grade the student's answer STRICTLY based on the answer key.
 Do NOT use outside knowledge.
 
-QUESTION:
-{question}
-
-ANSWER KEY:
-{answer_key}
-
-STUDENT ANSWER:
-{student_text}
-
 RULES:
-- Score from 0 to {max_score}.
+- Score from 0 to the MAX SCORE given with the question.
 - Correctness levels: correct, partially_correct, incorrect.
 - Match meaning, not wording.
+- Keep each point to a short phrase and the feedback to one or two sentences.
 - Return STRICT JSON only.
 
 JSON FORMAT:
-{{
+{
   "score": <float>,
   "max_score": <float>,
   "correctness": "correct | partially_correct | incorrect",
   "matched_points": [...],
   "missing_points": [...],
   "feedback": "short constructive suggestion"
-}}
+}
 """.strip()
 
-    # Initialize OpenAI-compatible client (llama.cpp server)
-    # Use a dummy API key for local servers that don't require authentication
-    client = OpenAI(base_url=api_url, api_key="api_key")
+_STUDENT_INSTRUCTIONS = """
+You are an automated grading system.
+Grade each of the student's answers STRICTLY based on its own answer key.
+Do NOT use outside knowledge. Grade every question independently.
 
-    # First attempt: request JSON mode
-    try:
-        response = client.chat.completions.create(
-            model=model or "local-model",
-            messages=[
-                {"role": "system", "content": "You are a grading engine that outputs strict JSON only."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=temperature,
-            max_tokens=800,
-            response_format={"type": "json_object"},
-        )
-    except Exception:
-        # Retry without response_format if server doesn't support it
-        response = client.chat.completions.create(
-            model=model or "local-model",
-            messages=[
-                {"role": "system", "content": "You are a grading engine that outputs strict JSON only."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=temperature,
-            max_tokens=800,
-        )
+RULES:
+- Score each question from 0 to its MAX SCORE.
+- Correctness levels: correct, partially_correct, incorrect.
+- Match meaning, not wording.
+- Keep each point to a short phrase and the feedback to one or two sentences.
+- Return STRICT JSON only: one object keyed by question id, with an entry
+  for every question below.
 
-    try:
-        content = response.choices[0].message.content
-    except Exception:
-        raise ValueError(f"Unexpected API response format: {response}")
+JSON FORMAT:
+{
+  "<question id>": {
+    "score": <float>,
+    "max_score": <float>,
+    "correctness": "correct | partially_correct | incorrect",
+    "matched_points": [...],
+    "missing_points": [...],
+    "feedback": "short constructive suggestion"
+  }
+}
+""".strip()
 
-    result = safe_json_loads(content)
 
-    result.setdefault("max_score", max_score)
-    for key in ["score", "max_score"]:
-        if key in result:
-            try:
-                result[key] = float(result[key])
-            except Exception:
-                raise ValueError(f"Field '{key}' must be a float.")
+def rubric(question: str, answer_key: str, max_score: float) -> str:
+    """The question, its maximum score and its answer key as they appear in grading prompts."""
+    return f"""QUESTION:
+{question}
+
+MAX SCORE: {max_score}
+
+ANSWER KEY:
+{answer_key}"""
+
+
+def prompt_prefix(question: str, answer_key: str, max_score: float) -> str:
+    """The part of a per-question prompt that does not depend on the answer."""
+    return f"""{_INSTRUCTIONS}
+
+{rubric(question, answer_key, max_score)}"""
+
+
+def _build_prompt(
+    question: str, answer_key: str, student_text: str, max_score: float, prefix: Optional[str] = None
+) -> str:
+    if prefix is None:
+        prefix = prompt_prefix(question, answer_key, max_score)
+    return f"""{prefix}
+
+STUDENT ANSWER:
+{student_text}"""
+
+
+def _correction_prompt(prompt: str, error: Exception) -> str:
+    """`prompt` with a note on why the previous reply was rejected, for one regeneration."""
+    return f"""{prompt}
+
+YOUR PREVIOUS REPLY WAS REJECTED: {error}
+Reply again with STRICT JSON only, in the JSON FORMAT above."""
+
+
+def _build_student_prompt(
+    items: Dict[str, Tuple[str, str, str, float]], rubrics: Optional[Dict[str, str]] = None
+) -> str:
+    """One prompt grading several questions; the answer is a JSON object keyed by question id.
+
+    All rubrics come before all answers, so the prefix is shared by every
+    student taking the same exam. `rubrics` holds prebuilt `rubric` texts
+    by question id; missing ones are built here.
+    """
+    prebuilt = rubrics or {}
+    rubric_text = "\n\n".join(
+        f"=== QUESTION {qid} ===\n{prebuilt.get(qid) or rubric(question, answer_key, max_score)}"
+        for qid, (question, answer_key, _, max_score) in items.items()
+    )
+    answers = "\n\n".join(
+        f"--- STUDENT ANSWER {qid} ---\n{student_text}" for qid, (_, _, student_text, _) in items.items()
+    )
+    return f"""{_STUDENT_INSTRUCTIONS}
+
+{rubric_text}
+
+=== STUDENT ANSWERS ===
+{answers}"""
+
+
+def validate_result(result: Dict[str, Any], max_score: float) -> Dict[str, Any]:
+    """Check and normalize one parsed grading result in place.
+
+    Raises ValueError if required fields are missing or invalid. The
+    question's configured `max_score` replaces whatever the model echoed,
+    and a score outside [0, max_score] is invalid.
+    """
+    result["max_score"] = float(max_score)
+    if "score" in result:
+        try:
+            result["score"] = float(result["score"])
+        except Exception:
+            raise ValueError("Field 'score' must be a float.")
+        if not 0.0 <= result["score"] <= result["max_score"]:
+            raise ValueError(f"Field 'score' must be between 0 and {result['max_score']}.")
 
     if "correctness" not in result:
         raise ValueError("Missing 'correctness' in LLM result.")
@@ -112,3 +171,554 @@ JSON FORMAT:
         result["feedback"] = ""
 
     return result
+
+
+def _cached_tokens(usage: Any, timings: Any) -> Optional[int]:
+    """Prompt tokens served from the server's prefix cache, if it reports them."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    n = getattr(details, "cached_tokens", None)
+    if isinstance(n, int):
+        return n
+    # llama.cpp reports its own `timings` block with `cache_n`.
+    if isinstance(timings, dict) and isinstance(timings.get("cache_n"), int):
+        return timings["cache_n"]
+    return None
+
+
+# Words in a 400/422 error body that blame the output format or the cache hints.
+_FORMAT_ERROR_WORDS = ("response_format", "json_schema", "json_object", "grammar")
+_HINT_ERROR_WORDS = ("cache_prompt", "id_slot")
+
+
+def _error_text(error: BaseException) -> str:
+    """Message and body of an API error, lowercased, for matching the feature it blames."""
+    parts = [str(error), str(getattr(error, "body", "") or "")]
+    response = getattr(error, "response", None)
+    try:
+        parts.append(response.text)
+    except Exception:
+        pass
+    return " ".join(parts).lower()
+
+
+def _record_usage(metrics: Metrics, usage: Any, timings: Any = None) -> None:
+    metrics.incr("llm.requests")
+    for field in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, field, None)
+        if isinstance(n, int):
+            metrics.incr(f"llm.{field}", n)
+    cached = _cached_tokens(usage, timings)
+    if cached is not None:
+        metrics.incr("llm.cached_prompt_tokens", cached)
+
+
+def _parse_output(content: Optional[str], metrics: Optional[Metrics] = None) -> Dict[str, Any]:
+    """Parse the model's JSON, repairing near misses before giving up."""
+    try:
+        return safe_json_loads(content or "")
+    except ValueError:
+        data = repair_json(content or "")
+        if metrics is not None:
+            metrics.incr("llm.json_repaired")
+        return data
+
+
+class LlamaGrader:
+    """Long-lived grading client for an OpenAI-compatible server.
+
+    Owns one OpenAI client backed by a keep-alive HTTP connection pool, so a
+    single instance can be shared by every question and student (the client
+    is thread-safe). Call `close()` when done, or use it as a context manager.
+
+    With a `cache`, deterministic (temperature 0) results are looked up before
+    and stored after each request.
+
+    `prompt_cache` asks the server to keep the KV cache of each prompt
+    (llama.cpp `cache_prompt`) so the shared instructions + question prefix
+    is not re-evaluated for every student. With `slots` (the server's
+    `--parallel` count), each question is pinned to one server slot so its
+    prefix stays resident there; leave it unset when there are fewer
+    questions than slots, since requests pinned to a busy slot wait for it.
+    `stream` reads responses incrementally and records time-to-first-token
+    as `llm.ttft`.
+
+    Timeouts, connection errors, 429 and 5xx responses are retried with
+    exponential backoff and jitter per `retry_policy`, as long as the shared
+    `retry_budget` allows. JSON mode and cache hints are dropped for good the
+    first time the server rejects them with 400/422 because of them (the
+    error names the feature, or a minimal request with it is rejected too);
+    other 400/422 errors fail only their own request. Output that is not valid JSON gets a local
+    repair (`utils.repair_json`) and, failing that, one regeneration whose
+    prompt quotes the validation error.
+
+    With `structured_output`, requests carry the JSON schema of the result
+    (`schema.result_schema`, bounded by `output_limits`) so servers with
+    constrained decoding cannot ramble or emit invalid enums; the token cap
+    is computed from the same schema. Servers that reject it fall back to
+    JSON mode, then to plain output.
+    """
+
+    def __init__(
+        self,
+        api_url: str = "http://localhost:2911/v1",
+        model: str = "Llama-3.1-8B-Instruct",
+        temperature: float = 0.0,
+        timeout: float = 60.0,
+        connect_timeout: float = 10.0,
+        max_connections: int = 8,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: float = 30.0,
+        api_key: str = "api_key",
+        cache: Optional[GradeCache] = None,
+        prompt_cache: bool = True,
+        slots: Optional[int] = None,
+        stream: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        structured_output: bool = True,
+        output_limits: Optional[OutputLimits] = None,
+    ) -> None:
+        self.api_url = api_url
+        self.model = model
+        self.temperature = temperature
+        self.timeout = timeout
+        self.cache = cache
+        self.prompt_cache = prompt_cache
+        self.slots = slots
+        self.stream = stream
+        self.output_limits = output_limits or OutputLimits()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_budget = retry_budget or RetryBudget()
+        # Server capabilities, learned from the first requests.
+        self._format_level = 0 if structured_output else OUTPUT_FORMATS.index("json_object")
+        self._format_confirmed = False
+        self._hints_accepted: Optional[bool] = None
+        self._capability_lock = threading.Lock()
+        self._client_args = dict(
+            api_key=api_key,
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections or max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: Any = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self):
+        """The OpenAI client, created (and `openai` imported) on the first request.
+
+        A run whose grades all come from the cache or a previous result never
+        pays for importing the SDK.
+        """
+        if self._client is not None:
+            return self._client
+        with self._client_lock:
+            if self._client is None:
+                try:
+                    from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient, OpenAI, Timeout
+                except ImportError as e:
+                    if e.name not in (None, "openai"):
+                        raise  # a dependency of openai is missing; report that, not openai
+                    raise RuntimeError("LLM grading requires the openai package. Install with: pip install openai") from e
+
+                args = self._client_args
+                # Limits and Timeout come from the HTTP library the installed
+                # openai is built on, so it need not be importable by name.
+                limits = type(DEFAULT_CONNECTION_LIMITS)(
+                    max_connections=args["max_connections"],
+                    max_keepalive_connections=args["max_keepalive_connections"],
+                    keepalive_expiry=args["keepalive_expiry"],
+                )
+                http_client = DefaultHttpxClient(
+                    limits=limits, timeout=Timeout(args["timeout"], connect=args["connect_timeout"])
+                )
+                # Use a dummy API key for local servers that don't require authentication
+                # Retries are handled by `retry_policy`; the SDK's own would multiply them.
+                self._client = OpenAI(
+                    base_url=self.api_url,
+                    api_key=args["api_key"],
+                    http_client=http_client,
+                    timeout=args["timeout"],
+                    max_retries=0,
+                )
+            return self._client
+
+    def load(self) -> None:
+        """Import the SDK and create the client now instead of on the first request."""
+        self._get_client()
+
+    def close(self) -> None:
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def __enter__(self) -> "LlamaGrader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def grade(
+        self,
+        question: str,
+        answer_key: str,
+        student_text: str,
+        max_score: float,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        metrics: Optional[Metrics] = None,
+        prefix: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Grade one answer strictly vs the answer key.
+
+        `model`, `temperature` and `timeout` override the instance defaults
+        for this request only. `metrics` receives request timings, token
+        usage, retries and cache hits/misses. `prefix` is the question's
+        precompiled `prompt_prefix`.
+        """
+        model = (model or self.model) or "local-model"
+        temperature = self.temperature if temperature is None else temperature
+        cache_key = None
+        if self.cache is not None and temperature == 0:
+            cache_key = GradeCache.make_key(
+                question, answer_key, student_text, max_score, model, PROMPT_VERSION, temperature
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if metrics is not None:
+                    metrics.incr("grade_cache.hits")
+                return cached
+            if metrics is not None:
+                metrics.incr("grade_cache.misses")
+
+        prompt = _build_prompt(question, answer_key, student_text, max_score, prefix)
+        schema = result_schema(max_score, self.output_limits)
+        for attempt in range(2):
+            content, _ = self._complete(prompt, model, temperature, timeout, schema, metrics, slot_key=question)
+            try:
+                result = validate_result(_parse_output(content, metrics), max_score)
+                break
+            except ValueError as e:
+                if metrics is not None:
+                    metrics.incr("llm.invalid_output")
+                # Regenerate once, if the run can afford it. The same request
+                # at temperature 0 would return the same reply, so this one
+                # says what was wrong with it.
+                if attempt > 0 or not self.retry_budget.try_acquire():
+                    raise
+                if metrics is not None:
+                    metrics.incr("llm.retries")
+                prompt = _correction_prompt(prompt, e)
+
+        if cache_key is not None:
+            self.cache.put(cache_key, result)
+        return result
+
+    def grade_student(
+        self,
+        items: Dict[str, Tuple[str, str, str, float]],
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        metrics: Optional[Metrics] = None,
+        rubrics: Optional[Dict[str, str]] = None,
+    ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        """Grade all of a student's answers with a single request.
+
+        `items` maps question id to (question, answer_key, student_text,
+        max_score). Returns `(results, errors)`: each entry of the model's
+        JSON object is checked with `validate_result`, exactly like `grade`,
+        and every question that is missing or invalid lands in `errors` with
+        the reason, so the caller can regrade it with `grade`. Cached grades
+        are reused and only the remaining questions are sent. `rubrics`
+        holds the questions' precompiled rubric texts.
+
+        `metrics` additionally receives `llm.prompt_tokens_saved`: the
+        estimated prompt tokens that one request per question would have
+        used, minus what the combined request used.
+        """
+        model = (model or self.model) or "local-model"
+        temperature = self.temperature if temperature is None else temperature
+        results: Dict[str, Dict[str, Any]] = {}
+        errors: Dict[str, str] = {}
+
+        cache_keys: Dict[str, str] = {}
+        todo: Dict[str, Tuple[str, str, str, float]] = {}
+        for qid, item in items.items():
+            if self.cache is not None and temperature == 0:
+                cache_keys[qid] = GradeCache.make_key(*item, model, STUDENT_PROMPT_VERSION, temperature)
+                cached = self.cache.get(cache_keys[qid])
+                if cached is not None:
+                    if metrics is not None:
+                        metrics.incr("grade_cache.hits")
+                    results[qid] = cached
+                    continue
+                if metrics is not None:
+                    metrics.incr("grade_cache.misses")
+            todo[qid] = item
+        if not todo:
+            return results, errors
+
+        prompt = _build_student_prompt(todo, rubrics)
+        slot_key = "\n".join(item[0] for item in todo.values())
+        schema = student_schema({qid: item[3] for qid, item in todo.items()}, self.output_limits)
+        content, used = self._complete(prompt, model, temperature, timeout, schema, metrics, slot_key)
+        if metrics is not None and used:
+            # Scale the measured tokens by the ratio of prompt lengths.
+            separate = sum(len(_SYSTEM_PROMPT) + len(_build_prompt(*item)) for item in todo.values())
+            combined = len(_SYSTEM_PROMPT) + len(prompt)
+            metrics.incr("llm.prompt_tokens_saved", round(used * separate / combined) - used)
+
+        try:
+            parsed = _parse_output(content, metrics)
+            reason = "Missing from LLM result."
+        except ValueError as e:
+            parsed, reason = {}, str(e)
+
+        for qid, item in todo.items():
+            entry = parsed.get(qid)
+            if not isinstance(entry, dict):
+                errors[qid] = reason if entry is None else "Expected a JSON object."
+                continue
+            try:
+                results[qid] = validate_result(dict(entry), item[3])
+            except ValueError as e:
+                errors[qid] = str(e)
+                continue
+            if qid in cache_keys:
+                self.cache.put(cache_keys[qid], results[qid])
+        if errors and metrics is not None:
+            metrics.incr("llm.invalid_output", len(errors))
+        return results, errors
+
+    def _complete(
+        self,
+        prompt: str,
+        model: str,
+        temperature: float,
+        timeout: Optional[float],
+        schema: Dict[str, Any],
+        metrics: Optional[Metrics],
+        slot_key: Optional[str] = None,
+    ) -> Tuple[str, Optional[int]]:
+        """Send one chat request whose answer should match `schema`.
+
+        Returns the message content and prompt token count. The token cap
+        is derived from the schema's size bounds.
+        """
+        request: Dict[str, Any] = dict(
+            model=model,
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens_for_schema(schema),
+            timeout=self.timeout if timeout is None else timeout,
+        )
+        hints = self._cache_hints(slot_key)
+        retries = 0
+        while True:
+            # The strictest output format and the cache hints are sent until
+            # the server has rejected them once; after that the next weaker
+            # format is used, or the hints are left out, for good.
+            attempt = dict(request)
+            level = self._format_level
+            if OUTPUT_FORMATS[level] == "json_schema":
+                attempt["response_format"] = schema_response_format(schema)
+            elif OUTPUT_FORMATS[level] == "json_object":
+                attempt["response_format"] = {"type": "json_object"}
+            if hints and self._hints_accepted is not False:
+                attempt["extra_body"] = hints
+            self.retry_budget.record_request()
+            try:
+                content, usage, timings = self._send(attempt, metrics)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == REJECTED and self._drop_capability(attempt, level, e, metrics):
+                    continue
+                if kind != TRANSIENT or retries + 1 >= self.retry_policy.max_attempts:
+                    raise
+                if not self.retry_budget.try_acquire():
+                    if metrics is not None:
+                        metrics.incr("llm.retry_budget_exhausted")
+                    raise
+                retries += 1
+                if metrics is not None:
+                    metrics.incr("llm.retries")
+                time.sleep(self.retry_policy.delay(retries, retry_after_seconds(e)))
+                continue
+            # The request went through, so whatever it carried is supported.
+            if "response_format" in attempt and level == self._format_level:
+                self._format_confirmed = True
+            if "extra_body" in attempt:
+                self._hints_accepted = True
+            break
+        if metrics is not None:
+            _record_usage(metrics, usage, timings)
+
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        return content, prompt_tokens if isinstance(prompt_tokens, int) else None
+
+    def _drop_capability(
+        self, attempt: Dict[str, Any], level: int, error: BaseException, metrics: Optional[Metrics]
+    ) -> bool:
+        """After a 400/422, stop sending an optional feature not yet known to work.
+
+        `level` is the output format the attempt used. A feature is dropped
+        when the error names it; otherwise one small request with the same
+        features tells whether they or this request (e.g. a prompt over the
+        context size) are at fault. Returns True if something was dropped,
+        i.e. the request is worth sending again.
+        """
+        with self._capability_lock:
+            if "response_format" in attempt and level < self._format_level:
+                return True  # another thread already moved on
+            if "extra_body" in attempt and self._hints_accepted is False:
+                return True
+            format_open = "response_format" in attempt and not self._format_confirmed
+            hints_open = "extra_body" in attempt and self._hints_accepted is None
+            if not (format_open or hints_open):
+                return False
+            text = _error_text(error)
+            if format_open and any(word in text for word in _FORMAT_ERROR_WORDS):
+                drop_format = True
+            elif hints_open and any(word in text for word in _HINT_ERROR_WORDS):
+                drop_format = False
+            else:
+                supported = self._probe(attempt, metrics)
+                if supported is None:
+                    return False  # inconclusive; treat the error as the request's own
+                if supported:
+                    if format_open and level == self._format_level:
+                        self._format_confirmed = True
+                    if hints_open:
+                        self._hints_accepted = True
+                    return False
+                drop_format = format_open
+            if drop_format:
+                name = OUTPUT_FORMATS[level]
+                self._format_level = level + 1
+            else:
+                name = "cache_hints"
+                self._hints_accepted = False
+        if metrics is not None:
+            metrics.incr(f"llm.unsupported.{name}")
+        return True
+
+    def _probe(self, attempt: Dict[str, Any], metrics: Optional[Metrics]) -> Optional[bool]:
+        """Send a minimal request with the optional features of `attempt`.
+
+        True if the server accepts it, False if it rejects it (400/422), None
+        if the probe failed otherwise.
+        """
+        probe = {k: v for k, v in attempt.items() if k not in ("messages", "max_tokens")}
+        probe["messages"] = [{"role": "user", "content": "Reply with {}."}]
+        probe["max_tokens"] = 8
+        if metrics is not None:
+            metrics.incr("llm.capability_probes")
+        try:
+            self._send(probe, None)
+        except Exception as e:
+            return False if classify_error(e) == REJECTED else None
+        return True
+
+    def capabilities(self) -> Dict[str, Any]:
+        """What the server was found to support so far.
+
+        `output_format` is the strictest format still in use and
+        `output_format_confirmed` whether a request with it succeeded;
+        `cache_hints` is None until known.
+        """
+        return {
+            "output_format": OUTPUT_FORMATS[self._format_level],
+            "output_format_confirmed": self._format_confirmed,
+            "cache_hints": self._hints_accepted,
+        }
+
+    def _cache_hints(self, slot_key: Optional[str]) -> Dict[str, Any]:
+        """llama.cpp extensions for prompt-prefix reuse; other servers ignore them."""
+        if not self.prompt_cache:
+            return {}
+        hints: Dict[str, Any] = {"cache_prompt": True}
+        if self.slots and slot_key is not None:
+            # Stable across processes, unlike hash().
+            digest = hashlib.sha256(slot_key.encode("utf-8")).digest()
+            hints["id_slot"] = int.from_bytes(digest[:4], "big") % self.slots
+        return hints
+
+    def _send(self, request: Dict[str, Any], metrics: Optional[Metrics]) -> Tuple[str, Any, Any]:
+        """Run one completion; returns (content, usage, llama.cpp timings or None)."""
+        if not self.stream:
+            with timed(metrics, "llm.request"):
+                response = self._get_client().chat.completions.create(**request)
+            try:
+                content = response.choices[0].message.content
+            except Exception:
+                raise ValueError(f"Unexpected API response format: {response}")
+            return content, getattr(response, "usage", None), getattr(response, "timings", None)
+
+        t0 = time.perf_counter()
+        ttft = None
+        parts = []
+        usage = timings = None
+        stream = self._get_client().chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **request
+        )
+        for chunk in stream:
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    parts.append(delta)
+            usage = getattr(chunk, "usage", None) or usage
+            timings = getattr(chunk, "timings", None) or timings
+        if metrics is not None:
+            metrics.observe("llm.request", time.perf_counter() - t0)
+            if ttft is not None:
+                metrics.observe("llm.ttft", ttft)
+        return "".join(parts), usage, timings
+
+
+_default_graders: Dict[str, LlamaGrader] = {}
+_default_graders_lock = threading.Lock()
+
+
+def _get_default_grader(api_url: str) -> LlamaGrader:
+    with _default_graders_lock:
+        grader = _default_graders.get(api_url)
+        if grader is None:
+            grader = LlamaGrader(api_url=api_url)
+            _default_graders[api_url] = grader
+        return grader
+
+
+def grade_essay(
+    question: str,
+    answer_key: str,
+    student_text: str,
+    max_score: float,
+    api_url: str = "http://localhost:2911/v1",
+    model: str = "Llama-3.1-8B-Instruct",
+    temperature: float = 0.0,
+    timeout: int = 60,
+) -> Dict[str, Any]:
+    """Call local Llama API to grade an essay answer strictly vs answer key.
+
+    Reuses a process-wide `LlamaGrader` per `api_url`, so repeated calls share
+    one connection pool. Returns a dict with the schema specified in the
+    project requirements.
+    """
+    return _get_default_grader(api_url).grade(
+        question=question,
+        answer_key=answer_key,
+        student_text=student_text,
+        max_score=max_score,
+        model=model,
+        temperature=temperature,
+        timeout=timeout,
+    )
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from .utils import ensure_dir, load_json_file, save_json_file
+
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable sha256 of JSON-serializable `parts`."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RunManifest:
+    """Content hashes of every stage input of a batch run, per student.
+
+    Stored as `manifest.json` next to the results. For each student it holds
+    the hash of the input image, the key of its OCR output (image + OCR and
+    preprocessing settings), of its corrected answers (OCR key + grouping and
+    corrector settings) and of every question's grade (question, key,
+    answer, max score and grading settings). A later run with the same
+    results directory compares its own keys against these and reuses the
+    stored OCR text, answers and grades whose keys did not change.
+    """
+
+    def __init__(self, results_dir: str, data: Optional[Dict[str, Any]] = None) -> None:
+        self.path = os.path.join(results_dir, MANIFEST_FILENAME)
+        self._data = data or {"version": MANIFEST_VERSION, "settings": {}, "students": {}}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, results_dir: str) -> "RunManifest":
+        """The manifest saved in `results_dir`, or an empty one."""
+        path = os.path.join(results_dir, MANIFEST_FILENAME)
+        data = None
+        if os.path.exists(path):
+            try:
+                data = load_json_file(path)
+            except (OSError, ValueError):
+                data = None
+            if data is not None and data.get("version") != MANIFEST_VERSION:
+                data = None
+        return cls(results_dir, data)
+
+    def student(self, student_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._data["students"].get(student_id, {}))
+
+    def set_student(self, student_id: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data["students"][student_id] = entry
+
+    def set_settings(self, settings: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data["settings"] = settings
+
+    def save(self) -> None:
+        with self._lock:
+            ensure_dir(os.path.dirname(self.path) or ".")
+            save_json_file(self.path, self._data)
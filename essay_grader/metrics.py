@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+
+class Metrics:
+    """Thread-safe collector of stage wall times and counters.
+
+    Stages (e.g. "ocr.predict", "llm.request") accumulate call count, total
+    and max seconds; counters (e.g. "llm.prompt_tokens", "grade_cache.hits")
+    accumulate numbers. A Metrics created with a `parent` also forwards every
+    record to it, which lets each student keep its own numbers while the run
+    aggregates all of them. With `trace_path`, every record is appended to
+    that file as one JSON object per line.
+    """
+
+    def __init__(
+        self,
+        parent: Optional["Metrics"] = None,
+        labels: Optional[Dict[str, Any]] = None,
+        trace_path: Optional[str] = None,
+    ) -> None:
+        self._parent = parent
+        self._labels = dict(labels or {})
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+
+    def observe(self, stage: str, seconds: float, **labels: Any) -> None:
+        """Record one execution of `stage` that took `seconds`."""
+        with self._lock:
+            s = self._stages.setdefault(stage, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            s["count"] += 1
+            s["total_seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+        self._emit({"type": "stage", "name": stage, "seconds": round(seconds, 6)}, labels)
+        if self._parent is not None:
+            self._parent.observe(stage, seconds, **{**self._labels, **labels})
+
+    def incr(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add `value` to counter `name`."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        self._emit({"type": "counter", "name": name, "value": value}, labels)
+        if self._parent is not None:
+            self._parent.incr(name, value, **{**self._labels, **labels})
+
+    @contextmanager
+    def timer(self, stage: str, **labels: Any) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0, **labels)
+
+    def _emit(self, event: Dict[str, Any], labels: Dict[str, Any]) -> None:
+        # Only the root collector writes the trace, so forwarded records are
+        # not duplicated.
+        if self._trace is None:
+            return
+        event = {**event, "ts": round(time.time(), 6), **self._labels, **labels}
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self._trace.write(line + "\n")
+            self._trace.flush()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stages": {
+                    name: {
+                        "count": int(s["count"]),
+                        "total_seconds": round(s["total_seconds"], 4),
+                        "max_seconds": round(s["max_seconds"], 4),
+                    }
+                    for name, s in sorted(self._stages.items())
+                },
+                "counters": {name: v for name, v in sorted(self._counters.items())},
+            }
+
+    def to_prometheus(self, prefix: str = "essay_grader") -> str:
+        """Render the collected numbers in the Prometheus text exposition format."""
+        data = self.to_dict()
+        lines = [
+            f"# TYPE {prefix}_stage_calls_total counter",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+            f"# TYPE {prefix}_stage_seconds_max gauge",
+        ]
+        for name, s in data["stages"].items():
+            label = f'{{stage="{name}"}}'
+            lines.append(f"{prefix}_stage_calls_total{label} {s['count']}")
+            lines.append(f"{prefix}_stage_seconds_total{label} {s['total_seconds']}")
+            lines.append(f"{prefix}_stage_seconds_max{label} {s['max_seconds']}")
+        for name, value in data["counters"].items():
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "essay_grader") -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus(prefix))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+@contextmanager
+def timed(metrics: Optional[Metrics], stage: str, **labels: Any) -> Iterator[None]:
+    """`metrics.timer(stage)` that is a no-op when `metrics` is None."""
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(stage, **labels):
+        yield
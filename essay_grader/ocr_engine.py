@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, asdict
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+@dataclass(frozen=True)
+class OCREngineConfig:
+    """Settings that identify one PaddleOCR pipeline instance."""
+
+    lang: str = "vi"
+    det_limit_side_len: int = 960
+    det_limit_type: str = "max"
+    use_doc_orientation_classify: bool = True
+    use_textline_orientation: bool = True
+    # Intra-op CPU threads for Paddle inference; None keeps Paddle's default.
+    cpu_threads: Optional[int] = None
+
+
+def create_paddle_ocr(cfg: OCREngineConfig):
+    """Create PaddleOCR with explicit resize/orientation defaults.
+
+    Some PaddleOCR versions can default to a very small detector resize
+    (e.g. limit_side_len=64 with limit_type='min'), which destroys Vietnamese
+    diacritics. We set a safer max-side resize.
+    """
+    from paddleocr import PaddleOCR as _POCR
+
+    extra: Dict[str, Any] = {}
+    if cfg.cpu_threads:
+        extra["cpu_threads"] = int(cfg.cpu_threads)
+
+    # PaddleOCR pipeline interface (current package) uses explicit text_det_* args.
+    try:
+        return _POCR(
+            use_doc_orientation_classify=cfg.use_doc_orientation_classify,
+            use_doc_unwarping=False,
+            use_textline_orientation=cfg.use_textline_orientation,
+            lang=cfg.lang,
+            text_det_limit_side_len=cfg.det_limit_side_len,
+            text_det_limit_type=cfg.det_limit_type,
+            **extra,
+        )
+    except (TypeError, ValueError):
+        pass
+
+    # PaddleOCR 2.x style
+    return _POCR(
+        use_angle_cls=cfg.use_textline_orientation,
+        lang=cfg.lang,
+        det_limit_side_len=cfg.det_limit_side_len,
+        det_limit_type=cfg.det_limit_type,
+        **extra,
+    )
+
+
+_engines: Dict[OCREngineConfig, Any] = {}
+_init_seconds: Dict[OCREngineConfig, float] = {}
+_warm_hits: Dict[OCREngineConfig, int] = {}
+_lock = threading.Lock()
+
+
+def get_paddle_ocr(cfg: Optional[OCREngineConfig] = None):
+    """Return the process-wide PaddleOCR instance for `cfg`, creating it once.
+
+    Model loading dominates single-image latency, so every caller in the
+    process (workflow, OCRExtractor, batch mode) should go through here.
+    """
+    cfg = cfg or OCREngineConfig()
+    with _lock:
+        engine = _engines.get(cfg)
+        if engine is not None:
+            _warm_hits[cfg] = _warm_hits.get(cfg, 0) + 1
+            return engine
+        t0 = time.perf_counter()
+        engine = create_paddle_ocr(cfg)
+        _init_seconds[cfg] = time.perf_counter() - t0
+        _engines[cfg] = engine
+        return engine
+
+
+def is_loaded(cfg: Optional[OCREngineConfig] = None) -> bool:
+    with _lock:
+        return (cfg or OCREngineConfig()) in _engines
+
+
+def init_seconds(cfg: Optional[OCREngineConfig] = None) -> Optional[float]:
+    """Cold-start time of the engine for `cfg`, or None if it was never built."""
+    with _lock:
+        return _init_seconds.get(cfg or OCREngineConfig())
+
+
+def engine_stats() -> Dict[str, Any]:
+    """Snapshot of loaded engines with their cold init time and warm reuse count."""
+    with _lock:
+        return {
+            "engines": [
+                {
+                    "config": asdict(cfg),
+                    "init_seconds": round(_init_seconds.get(cfg, 0.0), 4),
+                    "warm_hits": _warm_hits.get(cfg, 0),
+                }
+                for cfg in _engines
+            ]
+        }
+
+
+def clear_engines() -> None:
+    """Drop all cached engines (mainly to free memory or re-measure cold start)."""
+    with _lock:
+        _engines.clear()
+        _init_seconds.clear()
+        _warm_hits.clear()
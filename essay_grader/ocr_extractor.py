@@ -1,35 +1,54 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
 from pathlib import Path
 import json
-import glob
 
-class OCRExtractor:
-    """Extract text from essay images using PaddleOCR and group by question."""
+from .metrics import Metrics, timed
+from .ocr_engine import OCREngineConfig, get_paddle_ocr
+from .segmentation import (
+    OCRLine,
+    QuestionSegment,
+    SegmentConfig,
+    is_page_marker,
+    lines_from_fields,
+    segment_pages,
+    stacked_lines,
+)
 
-    def __init__(self, lang: str = "en") -> None:
-        self._lang = lang
 
-    def _create_paddle_ocr(self):
-        from paddleocr import PaddleOCR as _POCR
+def ocr_field(res: Any, name: str) -> Optional[List[Any]]:
+    """Read a list field such as rec_texts from a PaddleOCR result.
 
+    Accepts result objects, dicts, and objects exposing `to_dict()`; numpy
+    arrays are converted to plain lists. Returns None if the field is missing.
+    """
+    value = res.get(name) if isinstance(res, dict) else getattr(res, name, None)
+    if value is None and not isinstance(res, dict):
         try:
-            return _POCR(
-                use_doc_orientation_classify=True,
-                use_doc_unwarping=False,
-                use_textline_orientation=True,
-                lang=self._lang,
-                text_det_limit_side_len=960,
-                text_det_limit_type="max",
-            )
-        except (TypeError, ValueError):
-            return _POCR(
-                use_angle_cls=True,
-                lang=self._lang,
-                det_limit_side_len=960,
-                det_limit_type="max",
-            )
+            value = res.to_dict().get(name)
+        except Exception:
+            value = None
+    if value is not None and hasattr(value, "tolist"):
+        value = value.tolist()
+    return value if isinstance(value, list) else None
+
+
+class OCRExtractor:
+    """Extract text from essay images using PaddleOCR and group by question.
+
+    Uses the process-wide engine from `ocr_engine.get_paddle_ocr` unless an
+    engine is injected via `ocr`.
+    """
+
+    def __init__(self, lang: str = "en", ocr=None) -> None:
+        self._lang = lang
+        self._ocr = ocr
+
+    def _get_ocr(self):
+        if self._ocr is None:
+            self._ocr = get_paddle_ocr(OCREngineConfig(lang=self._lang))
+        return self._ocr
 
     @staticmethod
     def _is_question_header(text: str) -> bool:
@@ -40,8 +59,30 @@ class OCRExtractor:
             or t.split()[0].rstrip(".)").isdigit()
         )
 
-    def group_by_question(self, lines: List[str]) -> Dict[str, str]:
-        """Group OCR lines into question answers using simple heuristics."""
+    @staticmethod
+    def _drop_page_markers(pages: List[List[str]]) -> List[str]:
+        lines: List[str] = []
+        for page_no, page in enumerate(pages, 1):
+            page = list(page)
+            if page and is_page_marker(page[-1], page_no, last=True):
+                page.pop()
+            if page and is_page_marker(page[0], page_no, last=False):
+                page.pop(0)
+            lines.extend(page)
+        return lines
+
+    def group_by_question(self, lines: Union[Sequence[str], Sequence[Sequence[str]]]) -> Dict[str, str]:
+        """Group OCR lines into question answers using simple heuristics.
+
+        `lines` is either one page's lines or, for a multi-page submission, a
+        list of pages (each a list of lines). Pages are read in order and the
+        current question carries over from one page to the next, so an
+        answer may continue on the following page; page numbers at the top
+        or bottom of a page are dropped.
+        """
+        if lines and not isinstance(lines[0], str):
+            pages = [list(page) for page in lines]
+            lines = self._drop_page_markers(pages) if len(pages) > 1 else (pages[0] if pages else [])
         grouped: Dict[str, List[str]] = {}
         current_q = "1"
         grouped.setdefault(current_q, [])
@@ -66,82 +107,133 @@ class OCRExtractor:
         merged: Dict[str, str] = {k: " ".join(v).strip() for k, v in grouped.items()}
         return merged
 
-    def extract_answers(self, image_path: str, results_dir: Optional[str] = None) -> Dict[str, str]:
-        """Group student answers by question, preferring saved JSON when provided.
+    @staticmethod
+    def pages_from_results(result_objs: Iterable[Any]) -> List[List[str]]:
+        """rec_texts of in-memory PaddleOCR results (objects or dicts), one list per page."""
+        return [[str(t) for t in ocr_field(res, "rec_texts") or []] for res in result_objs]
+
+    @staticmethod
+    def geometry_from_results(result_objs: Iterable[Any]) -> List[List[OCRLine]]:
+        """OCR lines with boxes and scores, one list per page.
 
-        If `results_dir` is set and contains a JSON for `image_path`, reads rec_texts
-        from that file. Otherwise, runs live PaddleOCR.predict on `image_path`.
+        Boxes come from `rec_boxes`, else from the bounds of `rec_polys`. A
+        page without geometry (e.g. only `rec_texts` were saved) is laid out
+        one line per row in recognition order.
         """
-        lines: List[str] = []
+        pages: List[List[OCRLine]] = []
+        for page_no, res in enumerate(result_objs, 1):
+            texts = ocr_field(res, "rec_texts") or []
+            scores = ocr_field(res, "rec_scores")
+            lines = lines_from_fields(texts, scores, ocr_field(res, "rec_boxes"), ocr_field(res, "rec_polys"), page_no)
+            pages.append(lines if lines is not None else stacked_lines(texts, scores, page_no))
+        return pages
+
+    @classmethod
+    def lines_from_results(cls, result_objs: Iterable[Any]) -> List[str]:
+        """Collect rec_texts from in-memory PaddleOCR results (objects or dicts)."""
+        return [line for page in cls.pages_from_results(result_objs) for line in page]
+
+    @staticmethod
+    def _lines_from_saved_json(image_path: str, results_dir: str) -> List[str]:
+        try:
+            base = Path(image_path).stem
+            candidates = sorted(Path(results_dir).glob(f"{base}*_res.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+            json_path = candidates[0] if candidates else None
+            if json_path:
+                with json_path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                rec_texts = data.get("rec_texts") or []
+                if isinstance(rec_texts, list):
+                    return [str(t) for t in rec_texts]
+        except Exception:
+            pass
+        return []
+
+    def _pages(
+        self,
+        image_path: Optional[str],
+        results_dir: Optional[str],
+        ocr_results: Optional[Iterable[Any]],
+        metrics: Optional[Metrics] = None,
+    ) -> List[List[str]]:
+        """Recognized lines, one list per page (each OCR result is one page)."""
+        if ocr_results is not None:
+            return self.pages_from_results(ocr_results)
+
+        pages: List[List[str]] = []
         # Prefer saved JSON when available and specified
-        if results_dir:
-            try:
-                base = Path(image_path).stem
-                candidates = sorted(Path(results_dir).glob(f"{base}*_res.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-                json_path = candidates[0] if candidates else None
-                if json_path:
-                    with json_path.open("r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    rec_texts = data.get("rec_texts") or []
-                    if isinstance(rec_texts, list):
-                        lines = [str(t) for t in rec_texts]
-            except Exception:
-                lines = []
+        if results_dir and image_path:
+            with timed(metrics, "ocr.load_saved_json"):
+                lines = self._lines_from_saved_json(image_path, results_dir)
+            if lines:
+                pages = [lines]
 
         # Fallback to live OCR if no lines were loaded
-        if not lines:
-            ocr = self._create_paddle_ocr()
-            result = list(ocr.predict(input=image_path))
-            for res in result:
-                txts = getattr(res, "rec_texts", None)
-                if isinstance(txts, list) and txts:
-                    lines.extend([str(t) for t in txts])
-                else:
-                    try:
-                        d = res.to_dict()
-                        rec_texts = d.get("rec_texts")
-                        if isinstance(rec_texts, list) and rec_texts:
-                            lines.extend([str(t) for t in rec_texts])
-                    except Exception:
-                        pass
+        if not pages and image_path:
+            ocr = self._get_ocr()
+            with timed(metrics, "ocr.predict"):
+                pages = self.pages_from_results(ocr.predict(input=image_path))
+        return pages
 
-        return self.group_by_question(lines)
+    def extract_segments(
+        self,
+        image_path: Optional[str] = None,
+        results_dir: Optional[str] = None,
+        ocr_results: Optional[Iterable[Any]] = None,
+        metrics: Optional[Metrics] = None,
+        question_ids: Optional[Sequence[str]] = None,
+        cfg: Optional[SegmentConfig] = None,
+    ) -> Dict[str, QuestionSegment]:
+        """Per-question answers with a confidence, segmented by line geometry.
+
+        Sources are tried as in `extract_answers`. Lines are put in reading
+        order from their boxes (rows, two-column pages) and a question starts
+        at a header line at the left edge of its column; with
+        `question_ids`, only those ids start a question. See
+        `segmentation.segment_pages`.
+        """
+        pages: Optional[List[List[OCRLine]]] = None
+        if ocr_results is None and results_dir and image_path:
+            with timed(metrics, "ocr.load_saved_json"):
+                saved = self._lines_from_saved_json(image_path, results_dir)
+            if saved:
+                # Saved JSON keeps only the texts.
+                pages = [stacked_lines(saved, page=1)]
+        if pages is None and ocr_results is None and image_path:
+            with timed(metrics, "ocr.predict"):
+                ocr_results = list(self._get_ocr().predict(input=image_path))
+        if pages is None:
+            pages = self.geometry_from_results(ocr_results or [])
+        with timed(metrics, "ocr.group"):
+            return segment_pages(pages, question_ids, cfg)
 
-    def extract_full_text(self, image_path: str, results_dir: Optional[str] = None) -> str:
-        """Return concatenated text, preferring saved JSON when provided.
+    def extract_answers(
+        self,
+        image_path: Optional[str] = None,
+        results_dir: Optional[str] = None,
+        ocr_results: Optional[Iterable[Any]] = None,
+        metrics: Optional[Metrics] = None,
+        question_ids: Optional[Sequence[str]] = None,
+    ) -> Dict[str, str]:
+        """Group student answers by question.
 
-        If `results_dir` contains a JSON for `image_path`, uses its rec_texts.
-        Otherwise, runs live predict and concatenates rec_texts.
+        With `ocr_results` (the objects returned by PaddleOCR.predict, one
+        per page), uses them directly; grouping continues across pages.
+        Otherwise, if `results_dir` is set and contains a JSON for
+        `image_path`, reads rec_texts from that file, and as a last resort
+        runs live PaddleOCR.predict on `image_path`. Answers are segmented
+        by `extract_segments`.
         """
-        # Try saved JSON first
-        if results_dir:
-            try:
-                base = Path(image_path).stem
-                candidates = sorted(Path(results_dir).glob(f"{base}*_res.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-                json_path = candidates[0] if candidates else None
-                if json_path:
-                    with json_path.open("r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    rec_texts = data.get("rec_texts") or []
-                    if isinstance(rec_texts, list):
-                        return " ".join(str(t) for t in rec_texts).strip()
-            except Exception:
-                pass
-
-        # Fallback to live OCR
-        lines: List[str] = []
-        ocr = self._create_paddle_ocr()
-        result = list(ocr.predict(input=image_path))
-        for res in result:
-            txts = getattr(res, "rec_texts", None)
-            if isinstance(txts, list) and txts:
-                lines.extend([str(t) for t in txts])
-            else:
-                try:
-                    d = res.to_dict()
-                    rec_texts = d.get("rec_texts")
-                    if isinstance(rec_texts, list) and rec_texts:
-                        lines.extend([str(t) for t in rec_texts])
-                except Exception:
-                    pass
-        return " ".join(lines).strip()
\ No newline at end of file
+        segments = self.extract_segments(image_path, results_dir, ocr_results, metrics, question_ids)
+        return {qid: seg.text for qid, seg in segments.items()}
+
+    def extract_full_text(
+        self,
+        image_path: Optional[str] = None,
+        results_dir: Optional[str] = None,
+        ocr_results: Optional[Iterable[Any]] = None,
+        metrics: Optional[Metrics] = None,
+    ) -> str:
+        """Return concatenated text; sources are tried as in `extract_answers`."""
+        pages = self._pages(image_path, results_dir, ocr_results, metrics)
+        return " ".join(line for page in pages for line in page).strip()
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, replace
+import multiprocessing
+import os
+import time
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .ocr_engine import OCREngineConfig, get_paddle_ocr
+from .ocr_extractor import ocr_field
+
+
+# Environment variables read by the BLAS/OpenMP runtimes Paddle and OpenCV
+# link against. They must be set before those libraries are imported.
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+_worker_cfg: Optional[OCREngineConfig] = None
+_worker_preprocess: Optional[Dict[str, Any]] = None
+
+
+def _init_worker(cfg: OCREngineConfig, threads: int, preprocess: Optional[Dict[str, Any]]) -> None:
+    global _worker_cfg, _worker_preprocess
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    try:
+        import cv2
+
+        cv2.setNumThreads(threads)
+    except Exception:
+        pass
+    _worker_cfg = cfg
+    _worker_preprocess = preprocess
+    # Load the model up front so the first page does not pay for it.
+    get_paddle_ocr(cfg)
+
+
+def page_payload(result_objs: Iterable[Any]) -> Dict[str, List[Any]]:
+    """Flatten PaddleOCR results of one image into plain, picklable lists."""
+    payload: Dict[str, List[Any]] = {"rec_texts": [], "rec_scores": [], "rec_boxes": []}
+    for res in result_objs:
+        texts = ocr_field(res, "rec_texts") or []
+        payload["rec_texts"].extend(str(t) for t in texts)
+        scores = ocr_field(res, "rec_scores") or []
+        boxes = ocr_field(res, "rec_boxes") or []
+        # Keep the three lists aligned even if a field is missing.
+        payload["rec_scores"].extend(list(scores)[: len(texts)] + [None] * (len(texts) - len(scores)))
+        payload["rec_boxes"].extend(list(boxes)[: len(texts)] + [None] * (len(texts) - len(boxes)))
+    return payload
+
+
+def _ocr_image(image_path: str, page: int = 0) -> Dict[str, Any]:
+    # Imported here so cv2 is only loaded after _init_worker set thread limits.
+    from .document import is_pdf, release_documents
+    from .reader import PreprocessConfig, preprocess_image
+
+    ocr = get_paddle_ocr(_worker_cfg)
+    cfg = PreprocessConfig(**_worker_preprocess) if _worker_preprocess is not None else None
+    # Only this page is rendered, in the worker, so pages of one document
+    # are spread over the pool and never all decoded at once.
+    try:
+        pre = preprocess_image(image_path, cfg, page=page)
+    finally:
+        release_documents()
+    t0 = time.perf_counter()
+    try:
+        result_objs = list(ocr.predict(input=pre.ocr_image))
+    except Exception:
+        if page or is_pdf(image_path):
+            raise
+        result_objs = list(ocr.predict(input=image_path))
+    payload = page_payload(result_objs)
+    payload["predict_seconds"] = time.perf_counter() - t0
+    payload["preprocess_timings"] = pre.timings
+    return payload
+
+
+class OCRWorkerPool:
+    """Process pool for CPU-bound OCR where each worker keeps a warm engine.
+
+    Every worker process builds its own PaddleOCR instance once (at start-up)
+    and limits its intra-op threads to `threads_per_worker`, so `workers`
+    pages are recognized in parallel without oversubscribing the CPU. Results
+    come back as plain dicts with `rec_texts`, `rec_scores` and `rec_boxes`,
+    which `OCRExtractor` accepts as `ocr_results`, plus the worker's
+    `preprocess_timings` and `predict_seconds`. Pages are preprocessed in the worker according to
+    `preprocess` (a `reader.PreprocessConfig`); `submit(path, page)` renders
+    only that page of a PDF or multi-page TIFF.
+    """
+
+    def __init__(
+        self,
+        cfg: Optional[OCREngineConfig] = None,
+        workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        preprocess=None,
+    ) -> None:
+        cpus = os.cpu_count() or 1
+        self.workers = max(1, workers or cpus)
+        self.threads_per_worker = max(1, threads_per_worker or cpus // self.workers)
+        self._cfg = cfg or OCREngineConfig()
+        if self._cfg.cpu_threads is None:
+            # Also pass the limit to Paddle itself, not only to OpenMP/BLAS.
+            self._cfg = replace(self._cfg, cpu_threads=self.threads_per_worker)
+        # "spawn" gives each worker a clean interpreter: forking a process that
+        # already loaded Paddle or OpenMP thread pools is not safe.
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            # Sent as a dict so workers do not import reader (and cv2) before
+            # _init_worker has applied the thread limits.
+            initargs=(self._cfg, self.threads_per_worker, asdict(preprocess) if preprocess is not None else None),
+        )
+
+    def submit(self, image_path: str, page: int = 0) -> "Future[Dict[str, List[Any]]]":
+        return self._executor.submit(_ocr_image, image_path, page)
+
+    def imap(
+        self, image_paths: Iterable[str], prefetch: Optional[int] = None
+    ) -> Iterator[Tuple[str, Union[Dict[str, List[Any]], BaseException]]]:
+        """Stream `(path, payload)` pairs in input order.
+
+        At most `prefetch` images (default: twice the worker count) are queued
+        ahead of the consumer, so a slow consumer throttles OCR instead of
+        letting results pile up. Failures are yielded as the exception
+        instead of a payload so one bad scan does not stop the stream.
+        """
+        window = max(1, prefetch or 2 * self.workers)
+        queued: Deque[Tuple[str, Future]] = deque()
+        it = iter(image_paths)
+        exhausted = False
+        while True:
+            while not exhausted and len(queued) < window:
+                try:
+                    path = next(it)
+                except StopIteration:
+                    exhausted = True
+                    break
+                queued.append((path, self.submit(path)))
+            if not queued:
+                return
+            path, future = queued.popleft()
+            try:
+                yield path, future.result()
+            except Exception as e:
+                yield path, e
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "OCRWorkerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import Metrics
+
+
+@dataclass
+class StudentJob:
+    """One student's submission as it moves through the pipeline stages.
+
+    `pages` (start, end) selects the student's pages when `input` is a
+    document shared by several students, such as a class PDF.
+    """
+
+    index: int
+    student_id: str
+    input: str
+    results_dir: str
+    image: Any = None
+    preprocess: Optional[Dict[str, Any]] = None
+    ocr_results: Optional[List[Any]] = None
+    student_answers: Optional[Dict[str, str]] = None
+    segmentation: Optional[Dict[str, Any]] = None
+    final: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    metrics: Optional[Metrics] = None
+    pages: Optional[Tuple[int, int]] = None
+    keys: Dict[str, Any] = field(default_factory=dict)
+    previous: Optional[Dict[str, Any]] = None
+    started: float = field(default_factory=time.perf_counter)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A pipeline step run by `workers` threads reading from a bounded queue."""
+
+    name: str
+    fn: Callable[[StudentJob], None]
+    workers: int = 1
+
+
+_DONE = object()
+
+
+@dataclass
+class _StageState:
+    stage: Stage
+    inbox: "queue.Queue[Any]"
+    remaining: int
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def run_stages(jobs: Iterable[StudentJob], stages: List[Stage], queue_size: int = 2) -> Iterator[StudentJob]:
+    """Push `jobs` through `stages` concurrently and yield each job once it is done.
+
+    Consecutive stages are connected by queues holding at most `queue_size`
+    jobs, so a slow stage (typically LLM grading) blocks the ones before it
+    instead of letting decoded images and OCR results pile up in memory.
+    Jobs are yielded in completion order. A stage that raises marks the job's
+    `error` and later stages skip it; the job is still yielded.
+    """
+    stop = threading.Event()
+    states = [_StageState(s, queue.Queue(maxsize=max(1, queue_size)), max(1, s.workers)) for s in stages]
+    outbox: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, queue_size))
+
+    def put(q: "queue.Queue[Any]", item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed() -> None:
+        for job in jobs:
+            if not put(states[0].inbox if states else outbox, job):
+                return
+        put(states[0].inbox if states else outbox, _DONE)
+
+    def work(i: int) -> None:
+        state = states[i]
+        downstream = states[i + 1].inbox if i + 1 < len(states) else outbox
+        while not stop.is_set():
+            try:
+                job = state.inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if job is _DONE:
+                # Let sibling workers see the sentinel too; the last one to
+                # leave forwards it downstream.
+                state.inbox.put(_DONE)
+                with state.lock:
+                    state.remaining -= 1
+                    last = state.remaining == 0
+                if last:
+                    put(downstream, _DONE)
+                return
+            if job.error is None:
+                try:
+                    state.stage.fn(job)
+                except Exception as e:
+                    job.error = f"{state.stage.name}: {e}"
+                    if job.metrics is not None:
+                        job.metrics.incr(f"stage.{state.stage.name}.errors")
+            if not put(downstream, job):
+                return
+
+    threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+    for i, state in enumerate(states):
+        for n in range(state.remaining):
+            threads.append(threading.Thread(target=work, args=(i,), name=f"pipeline-{state.stage.name}-{n}", daemon=True))
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            job = outbox.get()
+            if job is _DONE:
+                return
+            yield job
+    finally:
+        stop.set()
+
+
+def prefetch(items: Iterable[Any], size: int = 1) -> Iterator[Any]:
+    """Iterate `items` in a background thread, keeping up to `size` ready ahead.
+
+    The producer starts right away, so e.g. the next page is rendered and
+    preprocessed while the caller recognizes the current one. Exceptions of
+    the producer are re-raised to the caller; abandoning the iterator stops
+    the producer.
+    """
+    q: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, size))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+        except BaseException as e:
+            put((False, e))
+        else:
+            put((False, None))
+        finally:
+            # Run a generator's cleanup here, in the thread that ran it.
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+
+    def consume() -> Iterator[Any]:
+        try:
+            while True:
+                ok, item = q.get()
+                if ok:
+                    yield item
+                elif item is not None:
+                    raise item
+                else:
+                    return
+        finally:
+            stop.set()
+
+    return consume()
+
+
+class MemoryBudget:
+    """Bytes of decoded pages that may be held at once, shared by the threads decoding them.
+
+    `acquire(n)` blocks until `n` more bytes fit under `limit_bytes`. A
+    request larger than the whole budget is admitted once nothing else is
+    held, so an oversized page runs alone instead of waiting forever. A
+    request whose `urgent()` returns true is admitted at once: pages a stage
+    is idle waiting for must not queue behind pages only decoded ahead, or
+    the read-ahead, itself waiting for that stage, never gives its share
+    back. Call `notify()` when an `urgent` condition turns true.
+    """
+
+    def __init__(self, limit_bytes: int) -> None:
+        self.limit_bytes = max(1, int(limit_bytes))
+        self.in_use = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, urgent: Optional[Callable[[], bool]] = None) -> int:
+        nbytes = max(0, int(nbytes))
+        with self._cond:
+            while self.in_use > 0 and self.in_use + nbytes > self.limit_bytes and not (urgent and urgent()):
+                self._cond.wait()
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self.in_use = max(0, self.in_use - int(nbytes))
+            self._cond.notify_all()
+
+    def notify(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit_mb": round(self.limit_bytes / 2**20, 1),
+                "in_use_mb": round(self.in_use / 2**20, 1),
+                "peak_mb": round(self.peak / 2**20, 1),
+            }
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+import math
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+# Words, common multi-character operators, then any other single symbol, so
+# "a+b;" and "a + b ;" tokenize the same.
+_TOKEN = re.compile(r"\w+|\+\+|--|<<|>>|[<>=!]=|&&|\|\||->|::|\*\*|//|[^\w\s]")
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def normalize_text(text: str, strip_diacritics: bool = True) -> str:
+    """Canonical form used for matching: lowercase, diacritics removed, code
+    operators split from identifiers, whitespace collapsed.
+
+    "Kết quả: x++" and "ket qua : x ++" both become "ket qua : x ++".
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    if strip_diacritics:
+        text = text.replace("đ", "d")
+        text = "".join(ch for ch in unicodedata.normalize("NFD", text) if not unicodedata.combining(ch))
+    return " ".join(_TOKEN.findall(text))
+
+
+def word_tokens(normalized: str) -> List[str]:
+    """Tokens that carry content: words and numbers, not punctuation."""
+    return [t for t in normalized.split() if t[0].isalnum() or t[0] == "_"]
+
+
+def _char_ngrams(normalized: str, sizes: Iterable[int]) -> Counter:
+    padded = f" {normalized} "
+    grams: Counter = Counter()
+    for n in sizes:
+        grams.update(padded[i : i + n] for i in range(max(0, len(padded) - n + 1)))
+    return grams
+
+
+@dataclass(frozen=True)
+class PreGradeConfig:
+    """Thresholds of the deterministic pre-grader.
+
+    Answers whose similarity to the key is at least `accept_threshold` get
+    full marks, answers at most `reject_threshold` that also share no word
+    with the key get 0; everything in between goes to the LLM. Full marks
+    additionally require the answer to contain the key's numbers in order,
+    since "5 7" and "7 5" look alike to n-grams.
+    """
+
+    accept_threshold: float = 0.95
+    reject_threshold: float = 0.05
+    ngram_sizes: tuple = (3, 4, 5)
+    min_answer_chars: int = 1
+
+
+class PreGrader:
+    """Scores blank, (near-)exact and unrelated answers without the LLM.
+
+    Similarity is the cosine of character n-gram TF-IDF vectors of the
+    normalized answer and key; IDF weights are fitted on `corpus` (the
+    exam's questions and keys), so boilerplate shared by every question
+    counts less than the distinctive parts of a key.
+    """
+
+    def __init__(self, corpus: Iterable[str] = (), cfg: Optional[PreGradeConfig] = None) -> None:
+        self.cfg = cfg or PreGradeConfig()
+        docs = [set(_char_ngrams(normalize_text(t), self.cfg.ngram_sizes)) for t in corpus]
+        df: Counter = Counter()
+        for grams in docs:
+            df.update(grams)
+        self._n_docs = len(docs)
+        self._df = df
+        self._key_vectors: Dict[str, Dict[str, float]] = {}
+        self._key_info: Dict[str, Tuple[str, Set[str], List[str]]] = {}
+
+    @classmethod
+    def for_exam(cls, exam, cfg: Optional[PreGradeConfig] = None) -> "PreGrader":
+        """A pre-grader fitted on an exam: a `CompiledExam` or a (questions, answer_key) pair.
+
+        A compiled exam brings its IDF statistics and key vectors, so
+        nothing is refitted when `cfg` uses the n-gram sizes it was
+        compiled with.
+        """
+        if isinstance(exam, tuple):
+            questions, answer_key = exam
+            return cls(list(questions.values()) + list(answer_key.values()), cfg)
+        pregrader = cls((), cfg)
+        compiled = list(exam.questions.values())
+        if tuple(pregrader.cfg.ngram_sizes) == tuple(exam.ngram_sizes):
+            pregrader._df = Counter(exam.document_frequency)
+            pregrader._n_docs = exam.n_docs
+            for q in compiled:
+                pregrader._key_vectors[q.key] = q.key_vector
+        else:
+            pregrader = cls([q.text for q in compiled] + [q.key for q in compiled], cfg)
+        for q in compiled:
+            pregrader._key_info[q.key] = (q.normalized_key, set(q.key_words), list(q.key_numbers))
+        return pregrader
+
+    def idf_stats(self) -> Tuple[Dict[str, int], int]:
+        """Document frequency of each n-gram and the number of documents fitted."""
+        return dict(self._df), self._n_docs
+
+    def key_vector(self, key: str) -> Dict[str, float]:
+        """TF-IDF vector of an answer key, computed once per key."""
+        vec = self._key_vectors.get(key)
+        if vec is None:
+            vec = self._key_vectors[key] = self._vector(normalize_text(key))
+        return vec
+
+    def _key(self, key: str) -> Tuple[str, Set[str], List[str]]:
+        info = self._key_info.get(key)
+        if info is None:
+            norm_key = normalize_text(key)
+            info = self._key_info[key] = (norm_key, set(word_tokens(norm_key)), NUMBER_RE.findall(norm_key))
+        return info
+
+    def _idf(self, gram: str) -> float:
+        return math.log((1 + self._n_docs) / (1 + self._df.get(gram, 0))) + 1.0
+
+    def _vector(self, normalized: str) -> Dict[str, float]:
+        tf = _char_ngrams(normalized, self.cfg.ngram_sizes)
+        vec = {g: (1 + math.log(c)) * self._idf(g) for g, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {g: v / norm for g, v in vec.items()}
+
+    def similarity(self, answer: str, key: str) -> float:
+        """Cosine similarity of the TF-IDF vectors of `answer` and `key`, in [0, 1]."""
+        key_vec = self.key_vector(key)
+        ans_vec = self._vector(normalize_text(answer))
+        if len(ans_vec) > len(key_vec):
+            ans_vec, key_vec = key_vec, ans_vec
+        return sum(v * key_vec.get(g, 0.0) for g, v in ans_vec.items())
+
+    def grade(
+        self, answer: str, key: str, max_score: float, points: Sequence[str] = ()
+    ) -> Optional[Dict[str, Any]]:
+        """A grading result if the answer can be scored without the LLM, else None.
+
+        `points` are the key's rubric points, reported as matched or missing;
+        without them the key itself counts as the single point.
+        """
+        cfg = self.cfg
+        points = list(points) or [key]
+        norm_answer = normalize_text(answer)
+        if len(norm_answer.replace(" ", "")) < cfg.min_answer_chars:
+            return _result(0.0, max_score, "incorrect", [], "No answer was given.", 0.0, points)
+        norm_key, key_words, key_numbers = self._key(key)
+        if not norm_key:
+            return None
+
+        if norm_answer == norm_key:
+            return _result(max_score, max_score, "correct", points, "Matches the answer key.", 1.0)
+
+        sim = self.similarity(answer, key)
+        if sim >= cfg.accept_threshold and NUMBER_RE.findall(norm_answer) == key_numbers:
+            return _result(max_score, max_score, "correct", points, "Matches the answer key.", sim)
+        if sim <= cfg.reject_threshold and not set(word_tokens(norm_answer)) & key_words:
+            return _result(
+                0.0, max_score, "incorrect", [], "The answer is unrelated to the expected answer.", sim, points
+            )
+        return None
+
+
+def _result(
+    score: float,
+    max_score: float,
+    correctness: str,
+    matched: List[str],
+    feedback: str,
+    similarity: float,
+    missing: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    return {
+        "score": float(score),
+        "max_score": float(max_score),
+        "correctness": correctness,
+        "matched_points": matched,
+        "missing_points": missing or [],
+        "feedback": feedback,
+        "graded_by": "pregrader",
+        "similarity": round(similarity, 4),
+    }
@@ -1,12 +1,121 @@
 from __future__ import annotations
 
-import cv2
-import numpy as np
-from typing import Tuple
+from dataclasses import dataclass, field
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+# cv2 and numpy are imported by the functions that touch pixels, so the
+# configs here can be used (e.g. to hash run settings) without loading them.
+if TYPE_CHECKING:
+    import numpy as np
+
+from .document import decode_reduction, image_size, is_pdf, load_page
+from .metrics import Metrics
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """Which preprocessing steps run before OCR.
+
+    `denoise` is "nlmeans" (slow, strongest), "median" (cheap) or "none".
+    `deskew_max_side` estimates the skew angle on a copy downscaled to that
+    size; the rotation itself is still applied at full resolution.
+    `memory_budget_mb` caps the estimated peak memory of decoding and
+    preprocessing one page (see `estimate_page_bytes`); a page that would
+    exceed it is processed at a smaller `max_side`.
+    """
+
+    max_side: int = 1600
+    denoise: str = "nlmeans"
+    equalize: bool = True
+    deskew: bool = True
+    deskew_max_side: Optional[int] = None
+    enabled: bool = True
+    memory_budget_mb: Optional[float] = None
+
+    @classmethod
+    def profile(cls, name: str) -> "PreprocessConfig":
+        """Return a named profile: "full", "fast" or "none"."""
+        if name == "full":
+            return cls()
+        if name == "fast":
+            return cls(denoise="median", deskew_max_side=800)
+        if name == "none":
+            return cls(enabled=False)
+        raise ValueError(f"Unknown preprocess profile: {name!r} (expected one of {PREPROCESS_PROFILES})")
+
+
+PREPROCESS_PROFILES = ("full", "fast", "none")
+
+
+@dataclass
+class PreprocessResult:
+    """Output of `preprocess_image`.
+
+    `ocr_image` is what OCR should consume: the processed page as 3-channel
+    BGR, or the resized original when preprocessing is disabled. The
+    intermediate `original_bgr` and `gray` are only kept when asked for.
+    `timings` maps each step to its wall time in seconds and `max_side` is
+    the longest side the page was processed at.
+    """
+
+    original_bgr: Optional[np.ndarray]
+    gray: Optional[np.ndarray]
+    ocr_image: np.ndarray
+    timings: Dict[str, float] = field(default_factory=dict)
+    max_side: Optional[int] = None
+
+
+# Smallest page side a memory budget may shrink a page to; below this
+# handwriting is no longer legible to OCR.
+_MIN_BUDGET_SIDE = 640
+
+
+def estimate_page_bytes(
+    path: str, page: int = 0, cfg: Optional[PreprocessConfig] = None, max_side: Optional[int] = None
+) -> int:
+    """Estimated peak bytes of decoding and preprocessing one page, from its header only.
+
+    Counts the decoded bitmap (reduced as in `document.load_page`) and its
+    resized copy, or the resized page with its gray and 3-channel output
+    when preprocessing is enabled, whichever is larger. Pages whose size is
+    unknown are assumed square at `max_side`.
+    """
+    cfg = cfg or PreprocessConfig()
+    side = max_side or cfg.max_side
+    size = image_size(path, page)
+    if size is None:
+        decoded = out = side * side
+    else:
+        width, height = size
+        factor = 1 if is_pdf(path) else decode_reduction(size, side)
+        width, height = max(1, width // factor), max(1, height // factor)
+        scale = min(1.0, side / float(max(width, height)))
+        out = int(width * scale) * int(height * scale)
+        # PDF pages are rendered at the final size.
+        decoded = out if is_pdf(path) else width * height
+    peak = 3 * decoded + (3 * out if out != decoded else 0)
+    if cfg.enabled:
+        peak = max(peak, 5 * out)
+    return peak
+
+
+def budget_max_side(path: str, page: int = 0, cfg: Optional[PreprocessConfig] = None) -> int:
+    """The largest `max_side` at which the page fits `cfg.memory_budget_mb`."""
+    cfg = cfg or PreprocessConfig()
+    side = cfg.max_side
+    if not cfg.memory_budget_mb:
+        return side
+    budget = cfg.memory_budget_mb * 1024 * 1024
+    while side > _MIN_BUDGET_SIDE and estimate_page_bytes(path, page, cfg, side) > budget:
+        side = max(_MIN_BUDGET_SIDE, int(side * 0.8))
+    return side
 
 
 def _resize_max(img: np.ndarray, max_side: int = 1600) -> np.ndarray:
     """Resize keeping aspect ratio so the longest side <= max_side."""
+    import cv2
+
     h, w = img.shape[:2]
     scale = min(max_side / float(max(h, w)), 1.0)
     if scale < 1.0:
@@ -14,16 +123,28 @@ def _resize_max(img: np.ndarray, max_side: int = 1600) -> np.ndarray:
     return img
 
 
-def _deskew(img_gray: np.ndarray) -> np.ndarray:
-    """Attempt to deskew an image using the text angle estimated via Hough lines.
+def _estimate_skew_angle(img_gray: np.ndarray, max_side: Optional[int] = None) -> float:
+    """Estimate the text tilt in degrees from Hough lines; 0.0 if unknown.
 
-    This is a heuristic suitable for simple scanned pages.
+    With `max_side`, the estimate runs on a downscaled copy, which is much
+    cheaper and accurate enough for the small angles we correct.
     """
+    import cv2
+    import numpy as np
+
+    h, w = img_gray.shape[:2]
+    threshold = 200
+    if max_side is not None and max(h, w) > max_side:
+        scale = max_side / float(max(h, w))
+        img_gray = cv2.resize(img_gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        # Lines get shorter with the image, so fewer votes are needed.
+        threshold = max(50, int(threshold * scale))
+
     # Edge detection
     edges = cv2.Canny(img_gray, 50, 150)
-    lines = cv2.HoughLines(edges, 1, np.pi / 180, threshold=200)
+    lines = cv2.HoughLines(edges, 1, np.pi / 180, threshold=threshold)
     if lines is None:
-        return img_gray
+        return 0.0
 
     # Collect angles near horizontal
     angles = []
@@ -36,38 +157,120 @@ def _deskew(img_gray: np.ndarray) -> np.ndarray:
             angles.append(angle)
 
     if not angles:
-        return img_gray
+        return 0.0
+    return float(np.median(angles))
+
 
-    median_angle = float(np.median(angles))
+def _rotate(img: np.ndarray, angle: float) -> np.ndarray:
+    import cv2
+
+    h, w = img.shape[:2]
+    center = (w // 2, h // 2)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def _deskew(img_gray: np.ndarray, max_side: Optional[int] = None) -> np.ndarray:
+    """Attempt to deskew an image using the text angle estimated via Hough lines.
+
+    This is a heuristic suitable for simple scanned pages.
+    """
+    median_angle = _estimate_skew_angle(img_gray, max_side)
     if abs(median_angle) < 0.5:
         return img_gray
 
     # Rotate to correct skew
-    h, w = img_gray.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
-    rotated = cv2.warpAffine(img_gray, M, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
-    return rotated
+    return _rotate(img_gray, median_angle)
 
 
-def load_and_preprocess(path: str) -> Tuple[np.ndarray, np.ndarray]:
-    """Load image, convert to grayscale, deskew, resize.
+def preprocess_image(
+    path: str,
+    cfg: Optional[PreprocessConfig] = None,
+    metrics: Optional[Metrics] = None,
+    page: int = 0,
+    keep_intermediates: bool = False,
+) -> PreprocessResult:
+    """Load an image (or page `page` of a PDF/multi-page TIFF) and run the
+    preprocessing steps selected by `cfg`.
 
-    Returns a tuple of (original_bgr, processed_gray).
-    Raises FileNotFoundError if image cannot be loaded.
+    Step timings are returned in the result and, with `metrics`, recorded as
+    `preprocess.<step>` stages. Intermediate images are released as soon as
+    the next step has run unless `keep_intermediates` is set. Raises
+    FileNotFoundError if image cannot be loaded.
     """
-    img = cv2.imread(path)
-    if img is None:
-        raise FileNotFoundError(f"Could not load image: {path}")
+    cfg = cfg or PreprocessConfig()
+    res = _preprocess_image(path, cfg, page, keep_intermediates)
+    if metrics is not None:
+        for step, seconds in res.timings.items():
+            metrics.observe(f"preprocess.{step}", seconds)
+        if res.max_side is not None and res.max_side < cfg.max_side:
+            metrics.incr("preprocess.budget_downscaled")
+    return res
+
 
-    img = _resize_max(img)
+def _preprocess_image(
+    path: str, cfg: PreprocessConfig, page: int = 0, keep_intermediates: bool = False
+) -> PreprocessResult:
+    import cv2
+
+    timings: Dict[str, float] = {}
+    max_side = budget_max_side(path, page, cfg)
+
+    t0 = time.perf_counter()
+    img = load_page(path, page, max_side=max_side)
+    timings["load"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    img = _resize_max(img, max_side)
+    timings["resize"] = time.perf_counter() - t0
+
+    if not cfg.enabled:
+        return PreprocessResult(original_bgr=img, gray=None, ocr_image=img, timings=timings, max_side=max_side)
+
+    t0 = time.perf_counter()
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    original = img if keep_intermediates else None
+    del img
+    timings["grayscale"] = time.perf_counter() - t0
+
+    # Normalize contrast and reduce noise; the cheap filters run in place.
+    t0 = time.perf_counter()
+    if cfg.denoise == "nlmeans":
+        gray = cv2.fastNlMeansDenoising(gray, h=7)
+    elif cfg.denoise == "median":
+        cv2.medianBlur(gray, 3, dst=gray)
+    timings["denoise"] = time.perf_counter() - t0
 
-    # Normalize contrast and reduce noise
-    gray = cv2.fastNlMeansDenoising(gray, h=7)
-    gray = cv2.equalizeHist(gray)
+    if cfg.equalize:
+        t0 = time.perf_counter()
+        cv2.equalizeHist(gray, dst=gray)
+        timings["equalize"] = time.perf_counter() - t0
 
     # Deskew
-    gray = _deskew(gray)
+    if cfg.deskew:
+        t0 = time.perf_counter()
+        gray = _deskew(gray, cfg.deskew_max_side)
+        timings["deskew"] = time.perf_counter() - t0
+
+    # PaddleOCR expects 3-channel input.
+    t0 = time.perf_counter()
+    ocr_image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    timings["to_bgr"] = time.perf_counter() - t0
+
+    return PreprocessResult(
+        original_bgr=original,
+        gray=gray if keep_intermediates else None,
+        ocr_image=ocr_image,
+        timings=timings,
+        max_side=max_side,
+    )
 
-    return img, gray
+
+def load_and_preprocess(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Load image, convert to grayscale, deskew, resize.
+
+    Returns a tuple of (original_bgr, processed_gray).
+    Raises FileNotFoundError if image cannot be loaded.
+    """
+    res = preprocess_image(path, PreprocessConfig(), keep_intermediates=True)
+    return res.original_bgr, res.gray
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import random
+import threading
+from typing import Optional
+
+
+# Error classes returned by `classify_error`.
+TRANSIENT = "transient"  # timeouts, dropped connections, 429 and 5xx: retry later
+REJECTED = "rejected"  # 400/422: the server refused the request as sent
+FATAL = "fatal"  # everything else (auth, 404, programming errors): do not retry
+
+
+def classify_error(exc: BaseException) -> str:
+    """Sort an exception from an LLM request into TRANSIENT, REJECTED or FATAL."""
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        if status in (408, 409, 429) or status >= 500:
+            return TRANSIENT
+        if status in (400, 422):
+            return REJECTED
+        return FATAL
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    try:
+        import openai
+    except Exception:
+        return FATAL
+    # Covers APITimeoutError as well; raised without a status code.
+    if isinstance(exc, openai.APIConnectionError):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """The server's `Retry-After` header (in seconds) from an HTTP error, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often and how patiently transient LLM errors are retried.
+
+    `max_attempts` counts the first try. The wait before retry n (1-based) is
+    drawn uniformly from [0, min(max_delay, base_delay * 2**(n-1))] ("full
+    jitter"), so clients that failed together do not retry together; a
+    server's `Retry-After` takes precedence when it is longer.
+    """
+
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, retry: int, retry_after: Optional[float] = None) -> float:
+        cap = min(self.max_delay, self.base_delay * (2 ** max(0, retry - 1)))
+        wait = random.uniform(0.0, cap)
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, self.max_delay))
+        return wait
+
+
+class RetryBudget:
+    """Caps retries at `ratio` of all requests (plus `min_retries`) for one run.
+
+    When the server is overloaded most requests fail; without a budget every
+    one of them would be retried and the load would multiply. Thread-safe.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 10) -> None:
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.requests = 0
+        self.retries = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def try_acquire(self) -> bool:
+        """Take one retry from the budget; False if none is left."""
+        with self._lock:
+            if self.retries < self.min_retries + self.ratio * self.requests:
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "retries": self.retries, "exhausted": self.exhausted}
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import math
+from typing import Any, Dict
+
+
+# Conservative average for the output we expect; Vietnamese with diacritics
+# tokenizes worse than English, so this errs towards a larger cap.
+CHARS_PER_TOKEN = 2.0
+
+CORRECTNESS_LEVELS = ("correct", "partially_correct", "incorrect")
+
+
+@dataclass(frozen=True)
+class OutputLimits:
+    """Size bounds for one grading result, enforced through the JSON schema.
+
+    Servers with constrained decoding (llama.cpp grammars, vLLM guided
+    decoding) cannot produce more than this, which caps generation time and
+    rules out invalid `correctness` values.
+    """
+
+    max_points: int = 4
+    max_point_chars: int = 80
+    max_feedback_chars: int = 200
+
+
+def result_schema(max_score: float, limits: OutputLimits = OutputLimits()) -> Dict[str, Any]:
+    """JSON schema of one grading result (see `llama_grader.validate_result`)."""
+    points = {
+        "type": "array",
+        "items": {"type": "string", "maxLength": limits.max_point_chars},
+        "maxItems": limits.max_points,
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "score": {"type": "number", "minimum": 0, "maximum": max_score},
+            "max_score": {"type": "number"},
+            "correctness": {"type": "string", "enum": list(CORRECTNESS_LEVELS)},
+            "matched_points": points,
+            "missing_points": points,
+            "feedback": {"type": "string", "maxLength": limits.max_feedback_chars},
+        },
+        "required": ["score", "max_score", "correctness", "matched_points", "missing_points", "feedback"],
+        "additionalProperties": False,
+    }
+
+
+def student_schema(max_scores: Dict[str, float], limits: OutputLimits = OutputLimits()) -> Dict[str, Any]:
+    """JSON schema of a per-student answer: one result per question id."""
+    return {
+        "type": "object",
+        "properties": {qid: result_schema(max_score, limits) for qid, max_score in max_scores.items()},
+        "required": list(max_scores),
+        "additionalProperties": False,
+    }
+
+
+def _max_chars(schema: Dict[str, Any]) -> int:
+    """Upper bound on the compact JSON length of a value matching `schema`."""
+    kind = schema.get("type")
+    if "enum" in schema:
+        return max(len(str(v)) for v in schema["enum"]) + 2
+    if kind == "string":
+        return schema.get("maxLength", 200) + 2
+    if kind in ("number", "integer"):
+        return 12
+    if kind == "array":
+        return schema.get("maxItems", 8) * (_max_chars(schema.get("items", {})) + 2) + 2
+    if kind == "object":
+        props = schema.get("properties", {})
+        return sum(len(k) + 4 + _max_chars(v) for k, v in props.items()) + 2
+    return 16
+
+
+def max_tokens_for_schema(schema: Dict[str, Any], slack: int = 32) -> int:
+    """Token cap that fits the largest output `schema` allows (plus whitespace slack)."""
+    return int(math.ceil(_max_chars(schema) / CHARS_PER_TOKEN)) + slack
+
+
+def schema_response_format(schema: Dict[str, Any], name: str = "grading_result") -> Dict[str, Any]:
+    """OpenAI-style `response_format` asking the server to enforce `schema`."""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
@@ -0,0 +1,403 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+import re
+import statistics
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Bump when the segmentation changes, so stored answers are regrouped.
+SEGMENTATION_VERSION = "1"
+
+# "Câu 1", "Bài 2", "Question 3", "Q4" (optionally followed by ".", ")" or ":"),
+# "5." / "6)" / "7:" but not "2.5", and a line holding only "8".
+_HEADER = re.compile(
+    r"(?:c[aâ]u|b[aà]i|question|q)\s*(\d{1,3})(?:\s*[.):])?(?!\d)|(\d{1,3})\s*[.):](?!\d)|(\d{1,3})$",
+    re.IGNORECASE,
+)
+# Page furniture: "2", "- 2 -", "2/5", "2 of 5", "Page 2", "Trang 2".
+PAGE_MARKER = re.compile(r"(?:page|trang|p\.)?\s*(\d{1,3})(?:\s*(?:/|of|trên)\s*\d{1,3})?")
+
+
+@dataclass(frozen=True)
+class SegmentConfig:
+    """Tuning of geometry-aware question segmentation.
+
+    Distances are in multiples of the page's median line height, so they
+    do not depend on scan resolution. A header must start within
+    `header_indent` of its column's left edge. A vertical gap free of text
+    at least `min_gutter` of the text width wide, with `min_column_lines`
+    lines on each side, splits the page into two columns. Questions whose
+    confidence falls below `low_confidence` are reported for review.
+    """
+
+    header_indent: float = 1.5
+    row_overlap: float = 0.5
+    min_gutter: float = 0.03
+    min_column_lines: int = 3
+    spanning_width: float = 0.6
+    missing_header_penalty: float = 0.8
+    low_confidence: float = 0.6
+
+
+@dataclass
+class OCRLine:
+    """One recognized text fragment with its box (x0, y0, x1, y1) in page pixels."""
+
+    text: str
+    box: Tuple[float, float, float, float]
+    score: Optional[float] = None
+    page: int = 0
+
+    @property
+    def height(self) -> float:
+        return max(1.0, self.box[3] - self.box[1])
+
+    @property
+    def cy(self) -> float:
+        return (self.box[1] + self.box[3]) / 2.0
+
+
+@dataclass
+class QuestionSegment:
+    """The answer text of one question and how much the segmentation trusts it.
+
+    `confidence` is the length-weighted mean OCR score of its lines, reduced
+    when the question had no header found by position (`header` False).
+    """
+
+    text: str
+    confidence: float
+    header: bool
+    lines: int = 0
+    pages: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "confidence": round(self.confidence, 4),
+            "header": self.header,
+            "lines": self.lines,
+            "pages": self.pages,
+        }
+
+
+def _to_box(box: Any = None, poly: Any = None) -> Optional[Tuple[float, float, float, float]]:
+    """(x0, y0, x1, y1) from a rec_boxes entry, or from the bounds of a rec_polys polygon."""
+    try:
+        if box is not None and len(box) == 4 and not isinstance(box[0], (list, tuple)):
+            x0, y0, x1, y1 = (float(v) for v in box)
+            return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        points = poly if poly is not None else box
+        if points is not None and len(points) >= 2:
+            xs = [float(p[0]) for p in points]
+            ys = [float(p[1]) for p in points]
+            return (min(xs), min(ys), max(xs), max(ys))
+    except (TypeError, ValueError, IndexError):
+        pass
+    return None
+
+
+def lines_from_fields(
+    texts: Sequence[Any],
+    scores: Optional[Sequence[Any]] = None,
+    boxes: Optional[Sequence[Any]] = None,
+    polys: Optional[Sequence[Any]] = None,
+    page: int = 0,
+) -> Optional[List[OCRLine]]:
+    """OCR lines of one page from PaddleOCR's parallel lists; None if any line has no geometry."""
+    lines: List[OCRLine] = []
+    for i, text in enumerate(texts):
+        box = _to_box(
+            boxes[i] if boxes is not None and i < len(boxes) else None,
+            polys[i] if polys is not None and i < len(polys) else None,
+        )
+        if box is None:
+            return None
+        score = scores[i] if scores is not None and i < len(scores) else None
+        lines.append(OCRLine(str(text), box, float(score) if score is not None else None, page))
+    return lines
+
+
+def stacked_lines(texts: Sequence[Any], scores: Optional[Sequence[Any]] = None, page: int = 0) -> List[OCRLine]:
+    """Lines without geometry laid out one per row in their given order, all at the left edge.
+
+    Lets text-only OCR output (e.g. saved `rec_texts`) go through
+    `segment_pages`; headers are then recognized by text alone.
+    """
+    return [
+        OCRLine(
+            str(text),
+            (0.0, 10.0 * i, 1000.0, 10.0 * i + 8.0),
+            float(scores[i]) if scores is not None and i < len(scores) and scores[i] is not None else None,
+            page,
+        )
+        for i, text in enumerate(texts)
+    ]
+
+
+def _rows(lines: List[OCRLine], overlap: float) -> List[List[OCRLine]]:
+    """Group fragments into rows (top to bottom), each row sorted left to right.
+
+    One sweep over the lines sorted by vertical center: a fragment joins the
+    current row when its center is within `overlap` line heights of the
+    row's center.
+    """
+    rows: List[List[OCRLine]] = []
+    row_cy = row_h = 0.0
+    for line in sorted(lines, key=lambda l: (l.cy, l.box[0])):
+        if rows and abs(line.cy - row_cy) <= overlap * max(row_h, line.height):
+            rows[-1].append(line)
+            n = len(rows[-1])
+            row_cy += (line.cy - row_cy) / n
+            row_h = max(row_h, line.height)
+        else:
+            rows.append([line])
+            row_cy, row_h = line.cy, line.height
+    for row in rows:
+        row.sort(key=lambda l: l.box[0])
+    return rows
+
+
+def _find_gutter(lines: List[OCRLine], cfg: SegmentConfig) -> Optional[Tuple[float, float]]:
+    """x-range of the empty vertical strip between two columns, if the page has two.
+
+    Coverage is counted on a fixed number of bins across the text width, so
+    this is linear in the number of lines. Full-width lines (titles,
+    instructions) are ignored, since they cross the gutter.
+    """
+    x_min = min(l.box[0] for l in lines)
+    x_max = max(l.box[2] for l in lines)
+    width = x_max - x_min
+    if width <= 0:
+        return None
+    bins = 200
+    scale = bins / width
+    # Difference array: +1 where a line starts, -1 after it ends.
+    delta = [0] * (bins + 1)
+    for l in lines:
+        if l.box[2] - l.box[0] >= cfg.spanning_width * width:
+            continue
+        delta[max(0, int((l.box[0] - x_min) * scale))] += 1
+        delta[min(bins - 1, int((l.box[2] - x_min) * scale)) + 1] -= 1
+    cover = []
+    running = 0
+    for d in delta[:bins]:
+        running += d
+        cover.append(running)
+
+    # Longest run of empty bins in the middle half of the text width.
+    best: Optional[Tuple[int, int]] = None
+    run_start: Optional[int] = None
+    for b in range(bins // 4, 3 * bins // 4 + 1):
+        empty = b < 3 * bins // 4 and cover[b] == 0
+        if empty and run_start is None:
+            run_start = b
+        elif not empty and run_start is not None:
+            if best is None or b - run_start > best[1] - best[0]:
+                best = (run_start, b)
+            run_start = None
+    if best is None or (best[1] - best[0]) < cfg.min_gutter * bins:
+        return None
+
+    left, right = x_min + best[0] / scale, x_min + best[1] / scale
+    n_left = sum(1 for l in lines if l.box[2] <= left)
+    n_right = sum(1 for l in lines if l.box[0] >= right)
+    if n_left < cfg.min_column_lines or n_right < cfg.min_column_lines:
+        return None
+    return left, right
+
+
+def _left_edge(lines: List[OCRLine], tolerance: float) -> float:
+    """Left edge of a column: the leftmost cluster of line starts shared by several lines.
+
+    A stray mark in the margin starts a cluster of its own and is skipped.
+    """
+    starts = sorted(l.box[0] for l in lines)
+    needed = max(2, len(starts) // 5) if len(starts) > 2 else 1
+    i = 0
+    while i < len(starts):
+        j = i
+        while j + 1 < len(starts) and starts[j + 1] - starts[i] <= tolerance:
+            j += 1
+        if j - i + 1 >= needed:
+            return starts[i]
+        i = j + 1
+    return starts[0]
+
+
+def _blocks(lines: List[OCRLine], cfg: SegmentConfig) -> List[Tuple[List[List[OCRLine]], float]]:
+    """Runs of rows in reading order, each with the left edge of the column it belongs to."""
+    tolerance = cfg.header_indent * statistics.median(l.height for l in lines)
+    gutter = _find_gutter(lines, cfg)
+    if gutter is None:
+        return [(_rows(lines, cfg.row_overlap), _left_edge(lines, tolerance))]
+
+    left, right = gutter
+    mid = (left + right) / 2.0
+    spanning = sorted((l for l in lines if l.box[0] < left and l.box[2] > right), key=lambda l: l.cy)
+    columns = [l for l in lines if not (l.box[0] < left and l.box[2] > right)]
+    left_col = [l for l in columns if (l.box[0] + l.box[2]) / 2.0 < mid]
+    right_col = [l for l in columns if (l.box[0] + l.box[2]) / 2.0 >= mid]
+    edges = (_left_edge(left_col, tolerance), _left_edge(right_col, tolerance))
+    page_edge = min(l.box[0] for l in lines)
+
+    # Full-width lines cut the page into bands; each band is read left
+    # column first, then right column.
+    cuts = [l.cy for l in spanning]
+    bands: List[Tuple[List[OCRLine], List[OCRLine]]] = [([], []) for _ in range(len(spanning) + 1)]
+    for l in left_col:
+        bands[bisect_right(cuts, l.cy)][0].append(l)
+    for l in right_col:
+        bands[bisect_right(cuts, l.cy)][1].append(l)
+
+    blocks: List[Tuple[List[List[OCRLine]], float]] = []
+    for i, (band_left, band_right) in enumerate(bands):
+        if band_left:
+            blocks.append((_rows(band_left, cfg.row_overlap), edges[0]))
+        if band_right:
+            blocks.append((_rows(band_right, cfg.row_overlap), edges[1]))
+        if i < len(spanning):
+            blocks.append(([[spanning[i]]], page_edge))
+    return blocks
+
+
+def reading_order(lines: List[OCRLine], cfg: Optional[SegmentConfig] = None) -> List[List[OCRLine]]:
+    """Rows of one page in reading order.
+
+    On a two-column page, text between two full-width lines is read as the
+    whole left column, then the whole right column; full-width lines are
+    read where they stand.
+    """
+    if not lines:
+        return []
+    return [row for rows, _ in _blocks(lines, cfg or SegmentConfig()) for row in rows]
+
+
+def _row_text(row: List[OCRLine]) -> str:
+    return " ".join(l.text.strip() for l in row if l.text.strip())
+
+
+def is_page_marker(text: str, page_no: int, last: bool = True) -> bool:
+    """True for a page number printed at the top or bottom of page `page_no`.
+
+    A bare number could also be a question header, so it only counts when
+    it is the page's `last` line and equals `page_no`.
+    """
+    t = text.strip().lower()
+    if PAGE_MARKER.fullmatch(t.strip("-–— ")) is None:
+        return False
+    return not t.isdigit() or (last and int(t) == page_no)
+
+
+def _header(text: str) -> Optional[Tuple[str, str]]:
+    """(question id, rest of the line) if `text` starts like a question header."""
+    m = _HEADER.match(text.strip())
+    if m is None:
+        return None
+    number = next(g for g in m.groups() if g is not None)
+    return str(int(number)), text.strip()[m.end() :].strip()
+
+
+def segment_pages(
+    pages: Iterable[List[OCRLine]],
+    question_ids: Optional[Sequence[str]] = None,
+    cfg: Optional[SegmentConfig] = None,
+) -> Dict[str, QuestionSegment]:
+    """Split the OCR lines of a submission's pages into per-question answers.
+
+    Each page is put into reading order (rows, columns). A row is a question
+    header when its text starts like one ("1.", "Câu 2", "Q3", ...) and it
+    starts at the left edge of its column; an indented "1." is a numbered
+    point inside an answer. With `question_ids`, only those ids (each once)
+    start a question. The current question carries over page breaks, and
+    page numbers at the top or bottom of a page are dropped.
+    """
+    cfg = cfg or SegmentConfig()
+    known = {str(q) for q in question_ids} if question_ids is not None else None
+    texts: Dict[str, List[str]] = {}
+    weights: Dict[str, List[Tuple[float, float]]] = {}
+    headers: Dict[str, bool] = {}
+    seen_pages: Dict[str, List[int]] = {}
+    counts: Dict[str, int] = {}
+    # Text before the first header (name, class, exam title) is kept aside:
+    # it becomes question 1's answer only if no "1" header turns up.
+    preamble: List[Tuple[str, Optional[float], int]] = []
+    current: Optional[str] = None
+
+    def add(qid: str, text: str, score: Optional[float], page: int) -> None:
+        texts.setdefault(qid, [])
+        weights.setdefault(qid, [])
+        seen_pages.setdefault(qid, [])
+        if text:
+            texts[qid].append(text)
+            counts[qid] = counts.get(qid, 0) + 1
+            if score is not None:
+                weights[qid].append((score, float(len(text))))
+        if page not in seen_pages[qid]:
+            seen_pages[qid].append(page)
+
+    for page_no, lines in enumerate(pages, 1):
+        lines = list(lines)
+        if not lines:
+            continue
+        rows = [(row, edge) for block, edge in _blocks(lines, cfg) for row in block]
+        # Page numbers sit above or below all other text.
+        if len(rows) > 1 and is_page_marker(_row_text(rows[-1][0]), page_no):
+            rows = rows[:-1]
+        if len(rows) > 1 and is_page_marker(_row_text(rows[0][0]), page_no, last=False):
+            rows = rows[1:]
+        tolerance = cfg.header_indent * statistics.median(l.height for l in lines)
+
+        for row, edge in rows:
+            text = _row_text(row)
+            score = _row_score(row)
+            header = _header(text)
+            at_edge = abs(row[0].box[0] - edge) <= tolerance
+            if (
+                header is not None
+                and at_edge
+                and (known is None or header[0] in known)
+                and not headers.get(header[0])
+            ):
+                current, rest = header
+                headers[current] = True
+                add(current, rest, score, page_no)
+            elif current is None:
+                preamble.append((text, score, page_no))
+            else:
+                add(current, text, score, page_no)
+
+    if "1" not in headers and (preamble or not texts):
+        # Without a "1" header, whatever came before the first header is
+        # the answer to question 1 (e.g. a single-question sheet).
+        ordered = {"1": []}
+        ordered.update(texts)
+        texts = ordered
+        add("1", "", None, 0)
+        for text, score, page_no in preamble:
+            add("1", text, score, page_no)
+
+    segments: Dict[str, QuestionSegment] = {}
+    for qid, parts in texts.items():
+        pairs = weights[qid]
+        total = sum(w for _, w in pairs)
+        confidence = sum(s * w for s, w in pairs) / total if total else (1.0 if parts else 0.0)
+        if not headers.get(qid):
+            confidence *= cfg.missing_header_penalty
+        segments[qid] = QuestionSegment(
+            text=" ".join(parts).strip(),
+            confidence=max(0.0, min(1.0, confidence)),
+            header=bool(headers.get(qid)),
+            lines=counts.get(qid, 0),
+            pages=[p for p in seen_pages[qid] if p],
+        )
+    return segments
+
+
+def _row_score(row: List[OCRLine]) -> Optional[float]:
+    """Length-weighted OCR score of a row's fragments, None if none has a score."""
+    pairs = [(l.score, max(1, len(l.text))) for l in row if l.score is not None]
+    if not pairs:
+        return None
+    return sum(s * w for s, w in pairs) / sum(w for _, w in pairs)
@@ -0,0 +1,712 @@
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+import email.parser
+import email.policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .document import DOCUMENT_EXTENSIONS, page_refs, release_documents
+from .grade_cache import GradeCache
+from .exam import load_exam
+from .llama_grader import LlamaGrader
+from .metrics import Metrics, timed
+from .ocr_pool import OCRWorkerPool, page_payload
+from .pregrader import PreGradeConfig, PreGrader
+from .reader import PreprocessConfig, budget_max_side, estimate_page_bytes, preprocess_image
+from .retry import RetryPolicy
+from .ocr_engine import OCREngineConfig
+from .workflow import (
+    acquire_ocr,
+    answers_from_ocr,
+    create_corrector,
+    fallback_path,
+    finalize_result,
+    predict_page,
+    pregrade_report,
+    preprocess_report,
+    submit_grading,
+)
+
+
+_CONTENT_TYPES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/bmp": ".bmp",
+    "image/tiff": ".tiff",
+    "image/webp": ".webp",
+    "application/pdf": ".pdf",
+}
+
+
+class ServiceBusy(RuntimeError):
+    """The OCR queue is full; the client should retry later."""
+
+
+@dataclass
+class Job:
+    """One uploaded submission tracked by the service."""
+
+    job_id: str
+    input: str
+    results_dir: str
+    metrics: Metrics
+    status: str = "queued"  # queued -> ocr -> grading -> done | failed
+    submitted: float = field(default_factory=time.time)
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+    ocr_results: Optional[List[Any]] = None
+    preprocess: Optional[Dict[str, Any]] = None
+    student_answers: Optional[Dict[str, str]] = None
+    segmentation: Optional[Dict[str, Any]] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"job_id": self.job_id, "status": self.status, "submitted": round(self.submitted, 3)}
+        if self.finished is not None:
+            out["seconds"] = round(self.finished - self.submitted, 4)
+        if self.error is not None:
+            out["error"] = self.error
+        if self.result is not None:
+            out["result"] = self.result
+        return out
+
+
+class GradingService:
+    """Long-running grader that keeps OCR, corrector and LLM client warm.
+
+    Uploads are queued for OCR. One OCR thread takes them in micro-batches:
+    it waits up to `batch_wait` seconds after the first job for up to
+    `batch_size` jobs. It recognizes their pages `batch_size` at a time in
+    one engine call (or spreads them over `ocr_workers` processes) and
+    corrects all their answers in one corrector call. Grading requests of
+    all jobs then share one pool of `max_concurrency` LLM connections, which
+    the server batches over its parallel slots. Results are written to
+    `results_dir/<job_id>/result.json` and kept in memory for `job_ttl`
+    seconds. More than `max_queue` jobs waiting for OCR raise ServiceBusy.
+    `memory_budget_mb` bounds the decoded pages of one engine call (or of
+    one OCR worker): a chunk ends early when its next page would not fit.
+
+    The other arguments mean the same as in `workflow.run_batch`.
+    """
+
+    def __init__(
+        self,
+        configs_dir: str = "configs",
+        results_dir: str = os.path.join("results", "service"),
+        ocr_lang: str = "vi",
+        api_url: str = "http://localhost:2911/v1",
+        model: str = "Llama-3.1-8B-Instruct",
+        ocr_mode: str = "grouped",
+        vn_corrector: str = "none",
+        vn_model: str = "protonx-models/distilled-protonx-legal-tc",
+        vn_top_k: int = 1,
+        max_concurrency: int = 4,
+        llm_timeout: float = 60.0,
+        grade_cache: Optional[str] = None,
+        preprocess: str = "fast",
+        grade_mode: str = "question",
+        prompt_cache: bool = True,
+        llm_slots: Optional[int] = None,
+        llm_stream: bool = False,
+        llm_retries: int = 2,
+        structured_output: bool = True,
+        pregrade: Optional[PreGradeConfig] = None,
+        ocr_workers: int = 0,
+        ocr_threads: Optional[int] = None,
+        memory_budget_mb: Optional[float] = None,
+        batch_size: int = 4,
+        batch_wait: float = 0.02,
+        max_queue: int = 64,
+        job_ttl: float = 3600.0,
+        keep_uploads: bool = False,
+        trace_path: Optional[str] = None,
+    ) -> None:
+        self.configs_dir = configs_dir
+        self.results_dir = results_dir
+        self.ocr_lang = ocr_lang
+        self.ocr_mode = ocr_mode
+        self.preprocess = preprocess
+        self.pre_cfg = replace(PreprocessConfig.profile(preprocess), memory_budget_mb=memory_budget_mb)
+        self.grade_mode = grade_mode
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = max(0.0, batch_wait)
+        self.max_queue = max(1, max_queue)
+        self.job_ttl = job_ttl
+        self.keep_uploads = keep_uploads
+        self.metrics = Metrics(trace_path=trace_path)
+
+        self._vn = (vn_corrector, vn_model, vn_top_k)
+        self._ocr_workers = ocr_workers
+        self._ocr_threads = ocr_threads
+        self._pregrade = pregrade
+        self._max_concurrency = max(1, max_concurrency)
+        self._grader_kwargs = dict(
+            api_url=api_url,
+            model=model,
+            timeout=llm_timeout,
+            max_connections=self._max_concurrency,
+            prompt_cache=prompt_cache,
+            slots=llm_slots,
+            stream=llm_stream,
+            retry_policy=RetryPolicy(max_attempts=1 + max(0, llm_retries)),
+            structured_output=structured_output,
+        )
+        self._grade_cache_path = grade_cache
+
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._ocr_queue: "queue.Queue[Job]" = queue.Queue()
+        self._grading = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._stop = threading.Event()
+        self._started = False
+        self._ocr_thread: Optional[threading.Thread] = None
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self) -> "GradingService":
+        """Load the exam and warm every model, then start the OCR thread."""
+        if self._started:
+            return self
+        t0 = time.perf_counter()
+        self.exam = load_exam(self.configs_dir)
+        self.pool: Optional[OCRWorkerPool] = None
+        self.ocr = None
+        if self._ocr_workers > 1:
+            self.pool = OCRWorkerPool(
+                OCREngineConfig(lang=self.ocr_lang),
+                workers=self._ocr_workers,
+                threads_per_worker=self._ocr_threads,
+                preprocess=self.pre_cfg,
+            )
+        else:
+            self.ocr, _ = acquire_ocr(self.ocr_lang, self.metrics)
+        self.corrector = create_corrector(*self._vn)
+        if self.corrector is not None:
+            self.corrector.load()
+        cache = GradeCache(self._grade_cache_path) if self._grade_cache_path else None
+        self.grader = LlamaGrader(cache=cache, **self._grader_kwargs)
+        self.grader.load()
+        self.pregrader = PreGrader.for_exam(self.exam, self._pregrade) if self._pregrade is not None else None
+        # LLM requests of all jobs share this pool; `finishers` wait for a
+        # job's grades and write its result.
+        self.executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix="llm")
+        self.finishers = ThreadPoolExecutor(max_workers=max(2, self._max_concurrency), thread_name_prefix="grade")
+        self.metrics.observe("service.start", time.perf_counter() - t0)
+        self._ocr_thread = threading.Thread(target=self._ocr_loop, name="service-ocr", daemon=True)
+        self._ocr_thread.start()
+        self._started = True
+        return self
+
+    def close(self) -> None:
+        if not self._started:
+            return
+        self._stop.set()
+        if self._ocr_thread is not None:
+            self._ocr_thread.join()
+        self.finishers.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+        if self.pool is not None:
+            self.pool.close()
+        self.grader.close()
+        if self.grader.cache is not None:
+            self.grader.cache.close()
+        self.metrics.close()
+        self._started = False
+
+    def __enter__(self) -> "GradingService":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- jobs ----------------------------------------------------------
+
+    def submit(self, data: bytes, filename: str = "upload.png") -> Job:
+        """Store an uploaded image or PDF and queue it; raises ServiceBusy when the queue is full."""
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in DOCUMENT_EXTENSIONS:
+            raise ValueError(f"Unsupported file type: {filename!r} (expected one of {DOCUMENT_EXTENSIONS})")
+        if self._ocr_queue.qsize() >= self.max_queue:
+            self.metrics.incr("service.jobs.rejected")
+            raise ServiceBusy(f"{self._ocr_queue.qsize()} jobs are waiting for OCR")
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.results_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        path = os.path.join(job_dir, "upload" + ext)
+        with open(path, "wb") as f:
+            f.write(data)
+        job = Job(job_id, path, job_dir, Metrics(parent=self.metrics, labels={"job": job_id}))
+        with self._jobs_lock:
+            self._evict()
+            self._jobs[job_id] = job
+        self.metrics.incr("service.jobs.submitted")
+        self._ocr_queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's status (and result once done); falls back to a result on disk after eviction."""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        path = os.path.join(self.results_dir, os.path.basename(job_id), "result.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return {"job_id": job_id, "status": "done", "result": json.load(f)}
+        return None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return self.get(job_id)
+
+    def _evict(self) -> None:
+        # Jobs are ordered by submission; drop finished ones past their TTL.
+        now = time.time()
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if now - job.submitted < self.job_ttl:
+                break
+            if job.done.is_set():
+                del self._jobs[job_id]
+
+    def _fail(self, job: Job, error: str) -> None:
+        job.error = error
+        job.status = "failed"
+        self.metrics.incr("service.jobs.failed")
+        self._finish(job)
+
+    def _finish(self, job: Job) -> None:
+        job.finished = time.time()
+        self._latencies.append(job.finished - job.submitted)
+        self.metrics.observe("service.job", job.finished - job.submitted)
+        job.ocr_results = None
+        if not self.keep_uploads:
+            try:
+                os.remove(job.input)
+            except OSError:
+                pass
+        job.done.set()
+
+    # -- OCR stage -----------------------------------------------------
+
+    def _next_batch(self) -> List[Job]:
+        """Block for one job, then collect more for up to `batch_wait` seconds."""
+        while not self._stop.is_set():
+            try:
+                first = self._ocr_queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        else:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._ocr_queue.get(timeout=remaining) if remaining > 0 else self._ocr_queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _ocr_loop(self) -> None:
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._process_batch(batch)
+            except Exception as e:  # never let one batch stop the service
+                for job in batch:
+                    if not job.done.is_set() and job.status != "grading":
+                        self._fail(job, f"ocr: {e}")
+            finally:
+                release_documents()
+
+    def _process_batch(self, batch: List[Job]) -> None:
+        t0 = time.perf_counter()
+        for job in batch:
+            job.status = "ocr"
+            job.metrics.observe("service.queue_wait", time.time() - job.submitted)
+        pages: List[Tuple[Job, Tuple[str, int]]] = []
+        for job in batch:
+            try:
+                refs = page_refs(job.input)
+                if not refs:
+                    raise ValueError("Submission has no pages")
+            except Exception as e:
+                self._fail(job, f"ocr: {e}")
+                continue
+            job.ocr_results = [None] * len(refs)
+            job.preprocess = {"timings": {}, "pages": len(refs)}
+            pages.extend((job, (ref, i)) for i, ref in enumerate(refs))
+
+        with timed(self.metrics, "service.ocr_batch"):
+            if self.pool is not None:
+                self._ocr_with_pool(pages)
+            else:
+                for chunk in self._chunks(pages):
+                    self._ocr_chunk(chunk)
+        self.metrics.incr("service.ocr_batches")
+        self.metrics.incr("service.ocr_batch_jobs", len(batch))
+        self.metrics.incr("service.ocr_batch_pages", len(pages))
+
+        ready = [job for job in batch if not job.done.is_set()]
+        for job in ready:
+            job.preprocess = preprocess_report(self.preprocess, job.preprocess["timings"], job.preprocess["pages"])
+            job.segmentation = {}
+            job.student_answers = answers_from_ocr(
+                job.ocr_results,
+                self.ocr_lang,
+                self.ocr_mode,
+                None,
+                job.metrics,
+                self.exam.question_ids,
+                job.segmentation,
+            )
+        if self.corrector is not None and ready:
+            self._correct(ready)
+        for job in ready:
+            job.status = "grading"
+            self.finishers.submit(self._grade, job)
+        self.metrics.observe("service.batch", time.perf_counter() - t0)
+
+    def _page_bytes(self, ref: Tuple[str, int]) -> int:
+        try:
+            return estimate_page_bytes(ref[0], ref[1], self.pre_cfg, budget_max_side(ref[0], ref[1], self.pre_cfg))
+        except Exception:
+            return 0
+
+    def _chunks(self, pages: List[Tuple[Job, Tuple[str, int]]]) -> List[List[Tuple[Job, Tuple[str, int]]]]:
+        """Split pages into engine calls of at most `batch_size` pages within the memory budget."""
+        budget = self.pre_cfg.memory_budget_mb * 2**20 if self.pre_cfg.memory_budget_mb else None
+        chunks: List[List[Tuple[Job, Tuple[str, int]]]] = []
+        used = 0
+        for item in pages:
+            nbytes = self._page_bytes(item[1][0]) if budget else 0
+            if not chunks or len(chunks[-1]) >= self.batch_size or (budget and used + nbytes > budget):
+                chunks.append([])
+                used = 0
+            chunks[-1].append(item)
+            used += nbytes
+        return chunks
+
+    def _ocr_chunk(self, chunk: List[Tuple[Job, Tuple[str, int]]]) -> None:
+        """Preprocess a few pages and recognize them in one engine call.
+
+        A page that fails to decode or recognize fails only its own job; the
+        other jobs' pages carry on.
+        """
+        items = []
+        for job, ((path, index), i) in chunk:
+            if job.done.is_set():
+                continue
+            try:
+                pre = preprocess_image(path, self.pre_cfg, job.metrics, page=index)
+            except Exception as e:
+                self._fail(job, f"ocr: {e}")
+                continue
+            for step, seconds in pre.timings.items():
+                job.preprocess["timings"][step] = job.preprocess["timings"].get(step, 0.0) + seconds
+            items.append((job, (path, index), i, pre.ocr_image))
+        results: Optional[List[Any]] = None
+        if len(items) > 1:
+            try:
+                with timed(self.metrics, "ocr.predict_batch"):
+                    results = list(self.ocr.predict(input=[item[3] for item in items]))
+            except Exception:
+                results = None
+            if results is not None and len(results) != len(items):
+                results = None
+        if results is None:
+            # One page at a time, so a page the engine rejects is pinned on its job.
+            results = []
+            for job, ref, _, image in items:
+                if job.done.is_set():
+                    results.append(None)
+                    continue
+                try:
+                    results.extend(predict_page(self.ocr, image, fallback_path(ref), job.metrics)[:1] or [{}])
+                except Exception as e:
+                    self._fail(job, f"ocr: {e}")
+                    results.append(None)
+        items = [item[:3] for item in items]  # drop the page images
+        for (job, _, i), res in zip(items, results):
+            if job.done.is_set():
+                continue
+            # Plain payloads do not keep the page images PaddleOCR attaches.
+            job.ocr_results[i] = page_payload([res])
+            job.metrics.incr("ocr.pages")
+
+    def _ocr_with_pool(self, pages: List[Tuple[Job, Tuple[str, int]]]) -> None:
+        futures = [(job, i, self.pool.submit(path, index)) for job, ((path, index), i) in pages]
+        for job, i, future in futures:
+            if job.done.is_set():
+                future.cancel()
+                continue
+            try:
+                payload = future.result()
+            except Exception as e:
+                self._fail(job, f"ocr: {e}")
+                continue
+            for step, seconds in payload.pop("preprocess_timings", {}).items():
+                job.metrics.observe(f"preprocess.{step}", seconds)
+                job.preprocess["timings"][step] = job.preprocess["timings"].get(step, 0.0) + seconds
+            job.metrics.observe("ocr.predict", payload.pop("predict_seconds", 0.0))
+            job.metrics.incr("ocr.pages")
+            job.ocr_results[i] = payload
+
+    def _correct(self, jobs: List[Job]) -> None:
+        """Correct the answers of every job in the batch with one corrector call."""
+        slots = [(job, qid) for job in jobs for qid in job.student_answers]
+        with timed(self.metrics, "correct"):
+            corrected = self.corrector.correct_many(
+                [job.student_answers[qid] for job, qid in slots], metrics=self.metrics
+            )
+        for (job, qid), text in zip(slots, corrected):
+            job.student_answers[qid] = text
+
+    # -- grading stage -------------------------------------------------
+
+    def _grade(self, job: Job) -> None:
+        with self._jobs_lock:
+            self._grading += 1
+        try:
+            pending = submit_grading(
+                self.executor, self.grader, self.exam, job.student_answers, job.metrics, self.grade_mode, self.pregrader
+            )
+            for _, _, future in pending:
+                future.result()
+            job.metrics.observe("student.total", time.perf_counter() - job.started)
+            extra: Dict[str, Any] = {"job_id": job.job_id, "preprocess": job.preprocess}
+            if job.segmentation:
+                extra["segmentation"] = job.segmentation
+            if self.pregrader is not None:
+                extra["pregrader"] = pregrade_report(job.metrics)
+            job.result = finalize_result(
+                job.student_answers,
+                pending,
+                job.results_dir,
+                extra=extra,
+                metrics=job.metrics,
+                weights=self.exam.weights,
+            )
+            job.status = "done"
+            self.metrics.incr("service.jobs.done")
+            self._finish(job)
+        except Exception as e:
+            self._fail(job, f"grade: {e}")
+        finally:
+            with self._jobs_lock:
+                self._grading -= 1
+
+    # -- metrics -------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depths, recent job latency percentiles and the collected metrics."""
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))], 4)
+
+        with self._jobs_lock:
+            grading = self._grading
+            tracked = len(self._jobs)
+        return {
+            "queue": {"ocr": self._ocr_queue.qsize(), "grading": grading, "max_queue": self.max_queue},
+            "jobs_tracked": tracked,
+            "exam": self.exam.summary(),
+            "latency_seconds": {"n": len(latencies), "p50": pct(50), "p95": pct(95), "p99": pct(99)},
+            "llm": {"capabilities": self.grader.capabilities(), "retry_budget": self.grader.retry_budget.stats()},
+            "metrics": self.metrics.to_dict(),
+        }
+
+    def to_prometheus(self, prefix: str = "essay_grader") -> str:
+        stats = self.stats()
+        lines = [
+            f"# TYPE {prefix}_service_queue_depth gauge",
+            f'{prefix}_service_queue_depth{{stage="ocr"}} {stats["queue"]["ocr"]}',
+            f'{prefix}_service_queue_depth{{stage="grading"}} {stats["queue"]["grading"]}',
+            f"# TYPE {prefix}_service_job_latency_seconds summary",
+        ]
+        for q in ("p50", "p95", "p99"):
+            quantile = int(q[1:]) / 100.0
+            lines.append(f'{prefix}_service_job_latency_seconds{{quantile="{quantile}"}} {stats["latency_seconds"][q]}')
+        return "\n".join(lines) + "\n" + self.metrics.to_prometheus(prefix)
+
+
+def _wait_seconds(query: Dict[str, List[str]]) -> float:
+    """The `wait` query parameter; ValueError unless it is a finite number >= 0."""
+    raw = (query.get("wait") or ["0"])[0]
+    try:
+        wait = float(raw)
+    except ValueError:
+        raise ValueError(f"wait must be a number of seconds, got {raw!r}") from None
+    if not math.isfinite(wait) or wait < 0:
+        raise ValueError(f"wait must be a finite number of seconds >= 0, got {raw!r}")
+    return wait
+
+
+def _read_upload(handler: BaseHTTPRequestHandler, body: bytes, query: Dict[str, List[str]]) -> Tuple[bytes, str]:
+    """(file bytes, file name) from a raw body or the first file of a multipart form."""
+    ctype = handler.headers.get("Content-Type", "")
+    if ctype.startswith("multipart/form-data"):
+        msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + ctype.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        for part in msg.iter_parts():
+            if part.get_filename():
+                return part.get_payload(decode=True) or b"", part.get_filename()
+        raise ValueError("multipart upload has no file part")
+    name = (query.get("filename") or [""])[0]
+    if not name:
+        name = "upload" + _CONTENT_TYPES.get(ctype.split(";")[0].strip().lower(), ".png")
+    return body, name
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, code: int, payload: Any, content_type: str = "application/json", headers: Optional[Dict[str, str]] = None) -> None:
+        body = payload if isinstance(payload, bytes) else (
+            payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        )
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        service = self.server.service
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/health":
+            self._send(200, {"status": "ok", "queue": service.stats()["queue"]})
+        elif url.path == "/metrics":
+            if (query.get("format") or [""])[0] == "json":
+                self._send(200, service.stats())
+            else:
+                self._send(200, service.to_prometheus(), "text/plain; version=0.0.4")
+        elif url.path.startswith("/jobs/"):
+            job_id = url.path[len("/jobs/") :]
+            try:
+                wait = _wait_seconds(query)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            job = service.wait(job_id, wait) if wait > 0 else service.get(job_id)
+            if job is None:
+                self._send(404, {"error": f"unknown job: {job_id}"})
+            else:
+                self._send(200, job)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        query = parse_qs(url.query)
+        # Checked before anything is read or queued, so a bad request leaves no job behind.
+        try:
+            wait = _wait_seconds(query)
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        if length <= 0:
+            self._send(400, {"error": "empty upload"})
+            return
+        if length > self.server.max_upload_bytes:
+            self._send(413, {"error": f"upload larger than {self.server.max_upload_bytes} bytes"})
+            return
+        body = self.rfile.read(length)
+        try:
+            data, name = _read_upload(self, body, query)
+            job = service.submit(data, name)
+        except ServiceBusy as e:
+            self._send(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        if wait > 0:
+            # Synchronous mode for simple clients: answer with the result if
+            # it is ready in time, else with the job id as usual.
+            status = service.wait(job.job_id, wait)
+            if status is not None and status["status"] in ("done", "failed"):
+                self._send(200, status)
+                return
+        self._send(202, {"job_id": job.job_id, "status": job.status}, headers={"Location": f"/jobs/{job.job_id}"})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: GradingService, max_upload_bytes: int, verbose: bool) -> None:
+        super().__init__(address, _Handler)
+        self.service = service
+        self.max_upload_bytes = max_upload_bytes
+        self.verbose = verbose
+
+
+def make_server(
+    service: GradingService,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    max_upload_bytes: int = 50 << 20,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    """HTTP front end for a started `service`.
+
+    Endpoints:
+      POST /jobs[?filename=x.pdf&wait=S]  upload an image/PDF (raw body or
+                                          multipart); 202 with a job id, or
+                                          the result if done within S seconds
+      GET  /jobs/<id>[?wait=S]            status and, once done, the result
+      GET  /metrics[?format=json]         queue depths, latency, counters
+      GET  /health
+    """
+    return _Server((host, port), service, max_upload_bytes, verbose)
+
+
+def serve(service: GradingService, host: str = "127.0.0.1", port: int = 8080, verbose: bool = False) -> None:
+    """Start `service` and answer HTTP requests until interrupted."""
+    with service:
+        server = make_server(service, host, port, verbose=verbose)
+        print(f"Serving on http://{host}:{server.server_address[1]}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
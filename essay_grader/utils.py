@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import json
 import os
+import re
+import stat
+import uuid
 from typing import Any, Dict
 
 
@@ -19,6 +22,48 @@ def safe_json_loads(s: str) -> Dict[str, Any]:
     return data
 
 
+_CODE_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def repair_json(s: str) -> Dict[str, Any]:
+    """Parse LLM output that is almost a JSON object.
+
+    Handles the usual near misses: Markdown code fences, prose around the
+    object, trailing commas, and output cut off before the closing
+    brackets. Raises ValueError if the result still is not a JSON object.
+    """
+    text = _CODE_FENCE.sub("", s.strip())
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in LLM output.")
+    text = text[start:]
+    closers = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+            if not closers:
+                # End of the first complete object; drop whatever follows.
+                text = text[: i + 1]
+                break
+    else:
+        # Truncated: close the open string and brackets.
+        text = text + ('"' if in_string else "") + "".join(reversed(closers))
+    return safe_json_loads(_TRAILING_COMMA.sub(r"\1", text))
+
+
 def ensure_dir(path: str) -> None:
     """Create directory if it does not exist."""
     os.makedirs(path, exist_ok=True)
@@ -31,6 +76,30 @@ def load_json_file(path: str) -> Dict[str, Any]:
 
 
 def save_json_file(path: str, data: Dict[str, Any]) -> None:
-    """Save dict as JSON file with UTF-8 encoding."""
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """Save dict as JSON file with UTF-8 encoding.
+
+    Written atomically: the data goes to a temporary file in the same
+    directory, which then replaces `path`, so readers and crashes never see
+    a half-written file and concurrent writers cannot interleave. The file
+    keeps the mode of the one it replaces; a new one is created with the
+    current umask applied, like `open` would.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            try:
+                os.fchmod(f.fileno(), stat.S_IMODE(os.stat(path).st_mode))
+            except FileNotFoundError:
+                pass
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
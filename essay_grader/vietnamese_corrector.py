@@ -1,75 +1,230 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from dataclasses import dataclass
 import importlib.util
-from typing import Optional
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from .metrics import Metrics, timed
 
 
 @dataclass(frozen=True)
 class ProtonXOfflineConfig:
     model: str = "protonx-models/distilled-protonx-legal-tc"
     top_k: int = 1
+    # Sentences sent to the model per call, and corrected sentences memoized.
+    batch_size: int = 16
+    cache_size: int = 4096
 
 
 class ProtonXOfflineCorrector:
+    """Vietnamese spelling/diacritics correction with an offline ProtonX model.
+
+    The model is loaded on first use and kept for the lifetime of the
+    instance, so one corrector should be reused across students.
+    """
+
     def __init__(self, cfg: Optional[ProtonXOfflineConfig] = None):
         self._cfg = cfg or ProtonXOfflineConfig()
         self._client = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # None until the first multi-sentence call tells us whether the
+        # client accepts a list of inputs.
+        self._batch_supported: Optional[bool] = None
+        self.stats: Dict[str, int] = {"sentences": 0, "cache_hits": 0, "batches": 0, "model_calls": 0}
 
     def _get_client(self):
-        if self._client is None:
-            if not importlib.util.find_spec("torch"):
-                raise RuntimeError(
-                    "ProtonX offline correction requires PyTorch. "
-                    "Install CPU PyTorch in this venv, e.g.: "
-                    "pip install torch --index-url https://download.pytorch.org/whl/cpu"
-                )
+        if self._client is not None:
+            return self._client
+        # Handler threads of the service may arrive together; load the model once.
+        with self._load_lock:
+            if self._client is None:
+                if not importlib.util.find_spec("torch"):
+                    raise RuntimeError(
+                        "ProtonX offline correction requires PyTorch. "
+                        "Install CPU PyTorch in this venv, e.g.: "
+                        "pip install torch --index-url https://download.pytorch.org/whl/cpu"
+                    )
 
-            try:
-                import transformers  # type: ignore
+                try:
+                    import transformers  # type: ignore
 
-                major = int(str(transformers.__version__).split(".")[0])
-                if major >= 5:
+                    major = int(str(transformers.__version__).split(".")[0])
+                    if major >= 5:
+                        raise RuntimeError(
+                            "Your environment has transformers>=5, which is currently incompatible with "
+                            "ProtonX offline tokenizer loading (KeyError: 0). "
+                            "Please downgrade: pip install -U 'transformers<5'"
+                        )
+                except RuntimeError:
+                    raise
+                except Exception:
+                    # If transformers isn't importable, ProtonX will fail anyway.
                     raise RuntimeError(
-                        "Your environment has transformers>=5, which is currently incompatible with "
-                        "ProtonX offline tokenizer loading (KeyError: 0). "
-                        "Please downgrade: pip install -U 'transformers<5'"
+                        "ProtonX offline correction requires the 'transformers' package. "
+                        "Install it with: pip install -U 'transformers<5'"
                     )
-            except RuntimeError:
-                raise
-            except Exception:
-                # If transformers isn't importable, ProtonX will fail anyway.
-                raise RuntimeError(
-                    "ProtonX offline correction requires the 'transformers' package. "
-                    "Install it with: pip install -U 'transformers<5'"
-                )
 
-            try:
-                from protonx import ProtonX
-            except Exception as e:
-                raise RuntimeError(
-                    "ProtonX is not installed. Install it with: pip install --upgrade protonx"
-                ) from e
-            self._client = ProtonX(mode="offline")
-        return self._client
+                try:
+                    from protonx import ProtonX
+                except Exception as e:
+                    raise RuntimeError(
+                        "ProtonX is not installed. Install it with: pip install --upgrade protonx"
+                    ) from e
+                self._client = ProtonX(mode="offline")
+            return self._client
 
-    def correct(self, text: str) -> str:
-        text = text or ""
-        if not text.strip():
-            return text
+    def load(self) -> None:
+        """Load the model now instead of on the first correction."""
+        self._get_client()
 
-        client = self._get_client()
-        result = client.text.correct(
-            input=text,
-            top_k=int(self._cfg.top_k),
-            model=str(self._cfg.model),
-        )
+    def _client_for(self, metrics: Optional[Metrics]):
+        if self._client is None:
+            with timed(metrics, "correct.model_load"):
+                return self._get_client()
+        return self._client
+
+    def _call(self, client, text_input) -> Any:
+        with self._lock:
+            return client.text.correct(
+                input=text_input,
+                top_k=int(self._cfg.top_k),
+                model=str(self._cfg.model),
+            )
 
+    @staticmethod
+    def _best(item: Any) -> Optional[str]:
         try:
-            candidates = result["data"][0]["candidates"]
+            candidates = item["candidates"]
             if candidates:
                 return str(candidates[0]["output"])
         except Exception:
             pass
+        return None
+
+    def _correct_batch(self, client, sentences: List[str]) -> List[str]:
+        """Correct many sentences, in one model call when the client supports list input."""
+        if self._batch_supported is not False and len(sentences) > 1:
+            data = None
+            rejected = False
+            try:
+                data = self._call(client, list(sentences))["data"]
+            except (TypeError, ValueError, KeyError):
+                rejected = True
+            except Exception:
+                pass  # e.g. a timeout or out of memory: only this batch goes one by one
+            if isinstance(data, list) and len(data) == len(sentences):
+                self._batch_supported = True
+                self._count(model_calls=1)
+                return [self._best(item) or src for item, src in zip(data, sentences)]
+            if (rejected or data is not None) and self._batch_supported is None:
+                # The first list input was refused or misread: the client does
+                # not take lists, so go one by one from now on.
+                self._batch_supported = False
+
+        out = []
+        for sentence in sentences:
+            result = self._call(client, sentence)
+            self._count(model_calls=1)
+            try:
+                out.append(self._best(result["data"][0]) or sentence)
+            except Exception:
+                out.append(sentence)
+        return out
+
+    def correct_many(self, texts: List[str], metrics: Optional[Metrics] = None) -> List[str]:
+        """Correct several texts at once.
+
+        Texts are split into sentences; sentences seen before are served from
+        an LRU cache (boilerplate repeats across students) and the remaining
+        unique ones are sent to the model in batches of `cfg.batch_size`.
+        """
+        split = [split_sentences(t or "") for t in texts]
+        # This call's corrections; the shared cache is only consulted and
+        # filled, so evictions by other calls cannot undo a correction.
+        corrected: Dict[str, str] = {}
+        todo: List[str] = []
+        pending = set()
+        hits = 0
+        for parts in split:
+            for sentence in parts[0::2]:
+                if not sentence.strip() or sentence in corrected or sentence in pending:
+                    continue
+                cached = self._cache_get(sentence)
+                if cached is None:
+                    todo.append(sentence)
+                    pending.add(sentence)
+                else:
+                    corrected[sentence] = cached
+                    hits += 1
+
+        if todo:
+            client = self._client_for(metrics)
+            size = max(1, int(self._cfg.batch_size))
+            for i in range(0, len(todo), size):
+                chunk = todo[i : i + size]
+                with timed(metrics, "correct.infer"):
+                    fixed = self._correct_batch(client, chunk)
+                for src, dst in zip(chunk, fixed):
+                    corrected[src] = dst
+                    self._cache_put(src, dst)
+                self._count(batches=1)
+                if metrics is not None:
+                    metrics.incr("correct.batches")
+
+        self._count(sentences=len(corrected), cache_hits=hits)
+        if metrics is not None:
+            metrics.incr("correct.sentences", len(corrected))
+            metrics.incr("correct.cache_hits", hits)
+
+        out = []
+        for parts in split:
+            pieces = []
+            for i, piece in enumerate(parts):
+                # Odd positions are separators.
+                if i % 2 == 0:
+                    piece = corrected.get(piece, piece)
+                pieces.append(piece)
+            out.append("".join(pieces))
+        return out
+
+    def correct(self, text: str, metrics: Optional[Metrics] = None) -> str:
+        text = text or ""
+        if not text.strip():
+            return text
+        return self.correct_many([text], metrics)[0]
+
+    def _count(self, **counts: int) -> None:
+        # Service threads share one corrector.
+        with self._cache_lock:
+            for name, n in counts.items():
+                self.stats[name] += n
+
+    def _cache_get(self, sentence: str) -> Optional[str]:
+        with self._cache_lock:
+            value = self._cache.get(sentence)
+            if value is not None:
+                self._cache.move_to_end(sentence)
+            return value
+
+    def _cache_put(self, sentence: str, corrected: str) -> None:
+        with self._cache_lock:
+            self._cache[sentence] = corrected
+            self._cache.move_to_end(sentence)
+            while len(self._cache) > max(0, int(self._cfg.cache_size)):
+                self._cache.popitem(last=False)
+
+
+# Split after sentence-final punctuation or at line breaks; the separators are
+# captured so the text can be reassembled exactly.
+_SENTENCE_SPLIT = re.compile(r"((?<=[.!?…])\s+|\n+)")
+
 
-        return text
+def split_sentences(text: str) -> List[str]:
+    """Split text into alternating [sentence, separator, sentence, ...] pieces."""
+    return _SENTENCE_SPLIT.split(text)
@@ -1,119 +1,565 @@
 from __future__ import annotations
 
+import glob
+import logging
 import os
-from typing import Dict, Any
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import Callable, Dict, Any, Iterator, List, Optional, Sequence, Tuple, Union
 
-from .reader import load_and_preprocess
+from .document import (
+    DOCUMENT_EXTENSIONS,
+    IMAGE_EXTENSIONS,
+    PageRef,
+    is_pdf,
+    page_count,
+    page_refs,
+    release_documents,
+)
+from .reader import PreprocessConfig, budget_max_side, estimate_page_bytes, preprocess_image
+from .ocr_engine import OCREngineConfig, engine_stats, get_paddle_ocr, init_seconds, is_loaded
 from .ocr_extractor import OCRExtractor
+from .ocr_pool import OCRWorkerPool, page_payload
+from .pipeline import MemoryBudget, Stage, StudentJob, prefetch, run_stages
 from .vietnamese_corrector import ProtonXOfflineConfig, ProtonXOfflineCorrector
-from .llama_grader import grade_essay
+from .grade_cache import GradeCache
+from .llama_grader import PROMPT_VERSION, STUDENT_PROMPT_VERSION, LlamaGrader
+from .checkpoint import JOURNAL_FILENAME, SCORES_FILENAME, RunJournal, ScoreSheet
+from .exam import CompiledExam, ExamLike, as_compiled, load_exam
+from .manifest import RunManifest, content_hash, file_hash
+from .pregrader import PreGradeConfig, PreGrader
+from .segmentation import SEGMENTATION_VERSION, QuestionSegment, SegmentConfig
+from .retry import RetryPolicy
+from .metrics import Metrics, timed
 from .utils import ensure_dir, load_json_file, save_json_file
 
 
-def _create_paddle_ocr(lang: str):
-    """Create PaddleOCR with explicit resize/orientation defaults.
+logger = logging.getLogger(__name__)
 
-    Some PaddleOCR versions can default to a very small detector resize
-    (e.g. limit_side_len=64 with limit_type='min'), which destroys Vietnamese
-    diacritics. We set a safer max-side resize.
-    """
-    from paddleocr import PaddleOCR as _POCR
+# Heavy dependencies load with the stage that needs them: cv2 and numpy when
+# a page is decoded, PaddleOCR when an engine is acquired, openai on the first
+# LLM request and the corrector's model on first use. A run served from
+# cached OCR and grades imports none of them.
 
-    # PaddleOCR pipeline interface (current package) uses explicit text_det_* args.
-    try:
-        return _POCR(
-            use_doc_orientation_classify=True,
-            use_doc_unwarping=False,
-            use_textline_orientation=True,
-            lang=lang,
-            text_det_limit_side_len=960,
-            text_det_limit_type="max",
+
+def acquire_ocr(ocr_lang: str, metrics: Optional[Metrics] = None) -> Tuple[Any, Dict[str, Any]]:
+    """Get the shared OCR engine and report whether it was already warm."""
+    cfg = OCREngineConfig(lang=ocr_lang)
+    warm = is_loaded(cfg)
+    t0 = time.perf_counter()
+    ocr = get_paddle_ocr(cfg)
+    info = {"warm": warm, "acquire_seconds": round(time.perf_counter() - t0, 4)}
+    cold = init_seconds(cfg)
+    if cold is not None:
+        info["cold_init_seconds"] = round(cold, 4)
+        if not warm and metrics is not None:
+            metrics.observe("ocr.init", cold)
+    return ocr, info
+
+
+_correctors: Dict[ProtonXOfflineConfig, ProtonXOfflineCorrector] = {}
+_correctors_lock = threading.Lock()
+
+
+def create_corrector(vn_corrector: str, vn_model: str, vn_top_k: int) -> Optional[ProtonXOfflineCorrector]:
+    """Return the process-wide corrector for these settings, so the model stays loaded."""
+    if vn_corrector != "protonx_offline":
+        return None
+    cfg = ProtonXOfflineConfig(model=vn_model, top_k=vn_top_k)
+    with _correctors_lock:
+        corrector = _correctors.get(cfg)
+        if corrector is None:
+            corrector = ProtonXOfflineCorrector(cfg)
+            _correctors[cfg] = corrector
+        return corrector
+
+
+def collect_inputs(source: str) -> List[str]:
+    """Resolve a batch source into an ordered list of submissions.
+
+    `source` may be a directory (all images and PDFs inside, sorted by name;
+    each subdirectory holding images or PDFs is one multi-page submission),
+    a glob pattern, or a manifest file: `.json` holding a list of paths, or
+    a text file with one path per line. Relative manifest entries are
+    resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        return sorted(
+            str(p)
+            for p in Path(source).iterdir()
+            if (p.is_file() and p.suffix.lower() in DOCUMENT_EXTENSIONS)
+            or (p.is_dir() and any(f.is_file() and f.suffix.lower() in DOCUMENT_EXTENSIONS for f in p.iterdir()))
         )
-    except (TypeError, ValueError):
-        pass
-
-    # PaddleOCR 2.x style
-    return _POCR(
-        use_angle_cls=True,
-        lang=lang,
-        det_limit_side_len=960,
-        det_limit_type="max",
-    )
 
+    if os.path.isfile(source) and Path(source).suffix.lower() not in DOCUMENT_EXTENSIONS:
+        base = os.path.dirname(os.path.abspath(source))
+        if source.lower().endswith(".json"):
+            entries = load_json_file(source)
+            if not isinstance(entries, list):
+                raise ValueError(f"Manifest must be a JSON list of paths: {source}")
+        else:
+            with open(source, "r", encoding="utf-8") as f:
+                entries = [line.strip() for line in f]
+        paths = []
+        for entry in entries:
+            entry = str(entry).strip()
+            if not entry or entry.startswith("#"):
+                continue
+            paths.append(entry if os.path.isabs(entry) else os.path.join(base, entry))
+        return paths
 
-def run_pipeline(
-    image_path: str,
-    configs_dir: str = "configs",
-    results_dir: str = "results",
-    ocr_lang: str = "vi",
-    api_url: str = "http://localhost:2911/v1",
-    model: str = "Llama-3.1-8B-Instruct",
-    ocr_mode: str = "grouped",
-    vn_corrector: str = "none",
-    vn_model: str = "protonx-models/distilled-protonx-legal-tc",
-    vn_top_k: int = 1,
-) -> Dict[str, Any]:
-    img_bgr, img_gray = load_and_preprocess(image_path)
-    # Use original image path for OCR; preprocessed array is available if needed.
-    ocr_input_path = image_path
+    if os.path.isfile(source):
+        return [source]
 
-    ocr = _create_paddle_ocr(ocr_lang)
-    try:
-        result_objs = ocr.predict(input=img_bgr)
-    except Exception:
-        result_objs = ocr.predict(input=ocr_input_path)
+    return sorted(p for p in glob.glob(source, recursive=True) if os.path.isfile(p))
+
+
+def _split_submissions(
+    paths: List[str], pages_per_student: Optional[int] = None
+) -> List[Tuple[str, Optional[Tuple[int, int]], str]]:
+    """Pair each input with its page range and a name for its student id.
+
+    With `pages_per_student`, a document with more pages than that (e.g. one
+    scanned PDF per class) is split into consecutive runs of that many
+    pages, one per student, named `<stem>_001`, `<stem>_002`, ...
+    """
+    submissions: List[Tuple[str, Optional[Tuple[int, int]], str]] = []
+    for path in paths:
+        n = len(page_refs(path)) if pages_per_student and os.path.isfile(path) else 0
+        if not pages_per_student or n <= pages_per_student:
+            submissions.append((path, None, Path(path).stem))
+            continue
+        for k, start in enumerate(range(0, n, pages_per_student), 1):
+            submissions.append((path, (start, min(n, start + pages_per_student)), f"{Path(path).stem}_{k:03d}"))
+    return submissions
+
+
+def _student_ids(names: List[str]) -> List[str]:
+    """Derive unique, filesystem-safe student ids from file stems (or names)."""
+    seen: Dict[str, int] = {}
+    ids: List[str] = []
+    for name in names:
+        stem = name
+        n = seen.get(stem, 0)
+        seen[stem] = n + 1
+        ids.append(stem if n == 0 else f"{stem}_{n + 1}")
+    return ids
+
+
+def _save_ocr_json(result_objs: List[Any], results_dir: str, stem: str) -> None:
     ensure_dir(results_dir)
-    for res in result_objs:
+    for page, res in enumerate(result_objs, 1):
+        try:
+            # PaddleOCR result objects are dicts too; only worker payloads lack save_to_json.
+            if hasattr(res, "save_to_json"):
+                res.save_to_json(results_dir)
+            else:
+                # Payload from an OCR worker process, one per page
+                name = f"{stem}_res.json" if len(result_objs) == 1 else f"{stem}_p{page}_res.json"
+                save_json_file(os.path.join(results_dir, name), res)
+        except Exception as e:
+            logger.warning("Could not save OCR JSON for %s (page %d): %s", stem, page, e)
+
+
+def predict_page(ocr, img_bgr, image_path: Optional[str], metrics: Optional[Metrics] = None) -> List[Any]:
+    """Recognize one page image; PaddleOCR reads `image_path` itself if it refuses the array."""
+    with timed(metrics, "ocr.predict"):
+        try:
+            return list(ocr.predict(input=img_bgr))
+        except Exception:
+            if image_path is None:
+                raise
+            return list(ocr.predict(input=image_path))
+
+
+def fallback_path(ref: PageRef) -> Optional[str]:
+    """The file PaddleOCR may read itself if the in-memory page is refused: plain images only."""
+    path, index = ref
+    return path if index == 0 and not is_pdf(path) and page_count(path) == 1 else None
+
+
+def preprocess_report(profile: str, timings: Dict[str, float], pages: int = 1) -> Dict[str, Any]:
+    """The `preprocess` section of `result.json`."""
+    return {"profile": profile, "pages": pages, "timings": {k: round(v, 4) for k, v in timings.items()}}
+
+
+class _PageStream:
+    """The pages of one submission, rendered and preprocessed one at a time.
+
+    Iterating yields `(page_ref, ocr_image)`; the next page is prepared in
+    the background while the caller recognizes the current one, so at most
+    a couple of decoded pages exist at once. `prepare_first` does the first
+    page up front (in the preprocess stage of a batch). Step timings are
+    summed over pages in `timings`.
+
+    With a `budget`, each page reserves its estimated peak memory before it
+    is decoded, keeps the size of its OCR image reserved until the caller
+    asks for the next page, and releases the rest after preprocessing. A
+    page the caller is already waiting for is admitted even over budget.
+    """
+
+    def __init__(
+        self,
+        refs: List[PageRef],
+        cfg: PreprocessConfig,
+        metrics: Optional[Metrics] = None,
+        budget: Optional[MemoryBudget] = None,
+    ) -> None:
+        if not refs:
+            raise ValueError("Submission has no pages")
+        self.refs = refs
+        self.cfg = cfg
+        self.metrics = metrics
+        self.budget = budget
+        self.timings: Dict[str, float] = {}
+        self._first: Optional[Tuple[PageRef, Any, int]] = None
+        self._held = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        # Set while the consumer waits for the next page; that page is then
+        # no longer read-ahead and skips the budget queue.
+        self._wanted = threading.Event()
+
+    def _reserve(self, ref: PageRef) -> int:
+        if self.budget is None:
+            return 0
         try:
-            res.save_to_json(results_dir)
+            side = budget_max_side(ref[0], ref[1], self.cfg)
+            nbytes = estimate_page_bytes(ref[0], ref[1], self.cfg, side)
         except Exception:
-            pass
+            nbytes = 0  # unreadable header; load_page reports the real error
+        nbytes = self.budget.acquire(nbytes, urgent=self._wanted.is_set)
+        self._wanted.clear()
+        with self._lock:
+            if self._closed:
+                self.budget.release(nbytes)
+                raise RuntimeError("page stream closed")
+            self._held += nbytes
+        return nbytes
 
+    def _release(self, nbytes: int) -> None:
+        if self.budget is None or nbytes <= 0:
+            return
+        with self._lock:
+            nbytes = min(nbytes, self._held)
+            self._held -= nbytes
+        self.budget.release(nbytes)
+
+    def _load(self, ref: PageRef) -> Tuple[PageRef, Any, int]:
+        held = self._reserve(ref)
+        try:
+            pre = preprocess_image(ref[0], self.cfg, self.metrics, page=ref[1])
+        except BaseException:
+            self._release(held)
+            raise
+        for step, seconds in pre.timings.items():
+            self.timings[step] = self.timings.get(step, 0.0) + seconds
+        # Only the OCR image outlives preprocessing.
+        kept = min(held, pre.ocr_image.nbytes) if held else 0
+        self._release(held - kept)
+        return ref, pre.ocr_image, kept
+
+    def _load_all(self, refs: List[PageRef]) -> Iterator[Tuple[PageRef, Any, int]]:
+        try:
+            for ref in refs:
+                yield self._load(ref)
+        finally:
+            release_documents()
+
+    def prepare_first(self) -> None:
+        if self._first is None:
+            try:
+                self._first = self._load(self.refs[0])
+            finally:
+                release_documents()
+
+    def __iter__(self) -> Iterator[Tuple[PageRef, Any]]:
+        first, self._first = self._first, None
+        rest = self.refs[1:] if first is not None else self.refs
+        # Started before the first page is handed out, so it overlaps its OCR.
+        pages = prefetch(self._load_all(rest), size=1)
+        try:
+            if first is not None:
+                yield first[0], first[1]
+                self._release(first[2])
+            while True:
+                self._wanted.set()
+                if self.budget is not None:
+                    self.budget.notify()
+                try:
+                    ref, img, held = next(pages)
+                except StopIteration:
+                    break
+                self._wanted.clear()
+                yield ref, img
+                self._release(held)
+        finally:
+            # Pages decoded ahead but never consumed give back their share.
+            with self._lock:
+                self._closed = True
+                held, self._held = self._held, 0
+            if self.budget is not None:
+                self.budget.release(held)
+
+
+def _ocr_pages(
+    stream: _PageStream, ocr, profile: str, metrics: Optional[Metrics] = None, keep_raw: bool = False
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """Recognize every page of `stream`; returns one OCR result per page and the preprocess report.
+
+    Results are reduced to plain text/score/box payloads right away, which
+    drops the page images PaddleOCR keeps in its result objects. `keep_raw`
+    keeps the original objects (e.g. for `_save_ocr_json`).
+    """
+    result_objs: List[Any] = []
+    for ref, img in stream:
+        page = predict_page(ocr, img, fallback_path(ref), metrics)
+        result_objs.extend(page if keep_raw else [page_payload([res]) for res in page])
+    if metrics is not None:
+        metrics.incr("ocr.pages", len(stream.refs))
+    return result_objs, preprocess_report(profile, stream.timings, len(stream.refs))
+
+
+def _run_ocr(
+    image_path: Union[str, Sequence[str]],
+    ocr,
+    preprocess: str = "fast",
+    metrics: Optional[Metrics] = None,
+    memory_budget_mb: Optional[float] = None,
+    keep_raw: bool = False,
+) -> Tuple[List[Any], Dict[str, Any]]:
+    """Preprocess a submission page by page and run each page through an in-process OCR engine.
+
+    `image_path` is anything `document.page_refs` accepts: an image, a PDF,
+    a multi-page TIFF, a directory of pages or a list of page files.
+    Returns the OCR results (one per page) and a `preprocess` report with
+    per-step timings summed over pages. `memory_budget_mb` bounds the
+    decoded pages held at once (see `_PageStream`).
+    """
+    cfg = replace(PreprocessConfig.profile(preprocess), memory_budget_mb=memory_budget_mb)
+    budget = MemoryBudget(memory_budget_mb * 2**20) if memory_budget_mb else None
+    stream = _PageStream(page_refs(image_path), cfg, metrics, budget)
+    return _ocr_pages(stream, ocr, preprocess, metrics, keep_raw)
+
+
+def answers_from_ocr(
+    result_objs: List[Any],
+    ocr_lang: str,
+    ocr_mode: str,
+    corrector: Optional[ProtonXOfflineCorrector],
+    metrics: Optional[Metrics] = None,
+    question_ids: Optional[List[str]] = None,
+    report: Optional[Dict[str, Any]] = None,
+) -> Dict[str, str]:
+    """Group in-memory OCR results by question and apply optional correction.
+
+    With `report`, the per-question segmentation confidence is stored in it
+    (see `_segmentation_report`).
+    """
     extractor = OCRExtractor(lang=ocr_lang)
     if ocr_mode == "raw":
-        raw_text = extractor.extract_full_text(image_path=ocr_input_path, results_dir=results_dir)
+        raw_text = extractor.extract_full_text(ocr_results=result_objs, metrics=metrics)
         student_answers = {"1": raw_text}
     else:
-        student_answers = extractor.extract_answers(image_path=ocr_input_path, results_dir=results_dir)
+        segments = extractor.extract_segments(ocr_results=result_objs, metrics=metrics, question_ids=question_ids)
+        student_answers = {qid: seg.text for qid, seg in segments.items()}
+        if report is not None:
+            report.update(_segmentation_report(segments, metrics))
 
-    if vn_corrector == "protonx_offline":
-        corrector = ProtonXOfflineCorrector(ProtonXOfflineConfig(model=vn_model, top_k=vn_top_k))
-        student_answers = {qid: corrector.correct(txt) for qid, txt in student_answers.items()}
-    # Load questions and answer key
-    questions = load_json_file(os.path.join(configs_dir, "questions.json"))
-    answer_key = load_json_file(os.path.join(configs_dir, "answer_key.json"))
+    if corrector is not None:
+        # All answers of the student go through the corrector in one batched call.
+        with timed(metrics, "correct"):
+            qids = list(student_answers)
+            corrected = corrector.correct_many([student_answers[q] for q in qids], metrics=metrics)
+            student_answers = dict(zip(qids, corrected))
+    return student_answers
 
-    grading: Dict[str, Any] = {}
-    total_score = 0.0
-    max_total_score = 0.0
 
-    for qid, question_text in questions.items():
-        key_text = answer_key.get(qid, "")
-        student_text = student_answers.get(qid, "")
-        max_score = 10.0  # default per question; can be customized per qid
-        max_total_score += max_score
+def _segmentation_report(
+    segments: Dict[str, QuestionSegment], metrics: Optional[Metrics] = None, cfg: SegmentConfig = SegmentConfig()
+) -> Dict[str, Any]:
+    """Confidence of each question's segmentation and the questions worth a manual look."""
+    low = [qid for qid, seg in segments.items() if seg.confidence < cfg.low_confidence]
+    if metrics is not None and low:
+        metrics.incr("segment.low_confidence", len(low))
+    return {"questions": {qid: seg.to_dict() for qid, seg in segments.items()}, "low_confidence": low}
 
-        try:
-            result = grade_essay(
+
+def _grade_question(
+    grader: LlamaGrader,
+    question_text: str,
+    key_text: str,
+    student_text: str,
+    max_score: float,
+    metrics: Optional[Metrics] = None,
+    prefix: Optional[str] = None,
+) -> Dict[str, Any]:
+    try:
+        with timed(metrics, "grade.question"):
+            return grader.grade(
                 question=question_text,
                 answer_key=key_text,
                 student_text=student_text,
                 max_score=max_score,
-                api_url=api_url,
-                model=model,
+                metrics=metrics,
+                prefix=prefix,
             )
-        except Exception as e:
-            result = {
-                "score": 0.0,
-                "max_score": max_score,
-                "correctness": "incorrect",
-                "matched_points": [],
-                "missing_points": [],
-                "feedback": f"Grading failed: {e}",
-            }
+    except Exception as e:
+        if metrics is not None:
+            metrics.incr("grade.failed")
+        return {
+            "score": 0.0,
+            "max_score": max_score,
+            "correctness": "incorrect",
+            "matched_points": [],
+            "missing_points": [],
+            "feedback": f"Grading failed: {e}",
+            "error": str(e),
+        }
+
+
+def submit_grading(
+    executor: Executor,
+    grader: LlamaGrader,
+    exam: CompiledExam,
+    student_answers: Dict[str, str],
+    metrics: Optional[Metrics] = None,
+    grade_mode: str = "question",
+    pregrader: Optional[PreGrader] = None,
+    reuse: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[Tuple[str, float, "Future[Dict[str, Any]]"]]:
+    """Queue grading for every question; returns futures in question order.
+
+    `grade_mode` "question" sends one request per question, "student" one
+    request for all of them (see `_submit_student_grading`). With a
+    `pregrader`, answers it can score with confidence never reach the LLM.
+    Results in `reuse` (question id -> earlier result) are returned as is.
+    Max scores and prompt prefixes come precompiled with `exam`.
+    """
+    if grade_mode not in ("question", "student"):
+        raise ValueError(f"Unknown grade mode: {grade_mode!r} (expected 'question' or 'student')")
+    items: Dict[str, Tuple[str, str, str, float]] = {}
+    futures: Dict[str, "Future[Dict[str, Any]]"] = {}
+    for qid, q in exam.questions.items():
+        item = (q.text, q.key, student_answers.get(qid, ""), q.max_score)
+        result = (reuse or {}).get(qid)
+        if result is None and pregrader is not None:
+            with timed(metrics, "pregrade"):
+                result = pregrader.grade(item[2], q.key, q.max_score, q.points)
+            if metrics is not None:
+                metrics.incr("pregrade.auto_scored" if result is not None else "pregrade.sent_to_llm")
+        if result is not None:
+            futures[qid] = Future()
+            futures[qid].set_result(result)
+        else:
+            items[qid] = item
+
+    if grade_mode == "student" and items:
+        futures.update(_submit_student_grading(executor, grader, items, metrics, exam))
+    else:
+        for qid, item in items.items():
+            futures[qid] = executor.submit(_grade_question, grader, *item, metrics, exam.questions[qid].prompt_prefix)
+    return [(qid, q.max_score, futures[qid]) for qid, q in exam.questions.items()]
+
+
+def pregrade_report(metrics: Metrics) -> Dict[str, Any]:
+    """How many answers the pre-grader scored itself instead of the LLM."""
+    counters = metrics.to_dict()["counters"]
+    auto = int(counters.get("pregrade.auto_scored", 0))
+    sent = int(counters.get("pregrade.sent_to_llm", 0))
+    return {
+        "auto_scored": auto,
+        "sent_to_llm": sent,
+        "llm_calls_avoided": round(auto / (auto + sent), 4) if auto + sent else 0.0,
+    }
+
+
+def _grade_student(
+    grader: LlamaGrader,
+    items: Dict[str, Tuple[str, str, str, float]],
+    metrics: Optional[Metrics] = None,
+    rubrics: Optional[Dict[str, str]] = None,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    try:
+        with timed(metrics, "grade.student"):
+            return grader.grade_student(items, metrics=metrics, rubrics=rubrics)
+    except Exception as e:
+        return {}, {qid: str(e) for qid in items}
+
+
+def _submit_student_grading(
+    executor: Executor,
+    grader: LlamaGrader,
+    items: Dict[str, Tuple[str, str, str, float]],
+    metrics: Optional[Metrics] = None,
+    exam: Optional[CompiledExam] = None,
+) -> Dict[str, "Future[Dict[str, Any]]"]:
+    """Grade all `items` in one LLM request, regrading failures one by one.
+
+    `items` maps question id to (question, answer_key, student_text,
+    max_score); returns one future per question id. Questions the combined
+    answer misses or gets wrong (per `validate_result`) are queued as
+    ordinary per-question requests once the combined one is done; nothing
+    here blocks an executor thread on another task. With `exam`, its
+    precompiled rubrics and prompt prefixes are used.
+    """
+    slots: Dict[str, "Future[Dict[str, Any]]"] = {qid: Future() for qid in items}
+    rubrics = {qid: exam.questions[qid].rubric for qid in items} if exam is not None else None
+    prefixes = {qid: exam.questions[qid].prompt_prefix for qid in items} if exam is not None else {}
+
+    def relay(src: "Future[Dict[str, Any]]", dst: "Future[Dict[str, Any]]") -> None:
+        dst.set_result(src.result())
+
+    def on_combined(done: "Future[Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]]") -> None:
+        results, errors = done.result()
+        for qid, result in results.items():
+            slots[qid].set_result(result)
+        for qid in errors:
+            if metrics is not None:
+                metrics.incr("grade.student_fallbacks")
+            try:
+                fallback = executor.submit(_grade_question, grader, *items[qid], metrics, prefixes.get(qid))
+            except RuntimeError:  # executor shut down
+                slots[qid].set_result(_grade_question(grader, *items[qid], metrics, prefixes.get(qid)))
+                continue
+            fallback.add_done_callback(lambda f, dst=slots[qid]: relay(f, dst))
+
+    executor.submit(_grade_student, grader, items, metrics, rubrics).add_done_callback(on_combined)
+    return slots
+
 
+def finalize_result(
+    student_answers: Dict[str, str],
+    pending: List[Tuple[str, float, "Future[Dict[str, Any]]"]],
+    results_dir: str,
+    extra: Optional[Dict[str, Any]] = None,
+    metrics: Optional[Metrics] = None,
+    weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """Wait for grading futures, aggregate scores in question order and save `result.json`.
+
+    The file is replaced atomically, so a crash never leaves a partial result.
+
+    With `metrics`, its snapshot is included in the result as `metrics`.
+    If any of the per-question `weights` is not 1, the weighted total and
+    its maximum are included as `weighted_score` and `max_weighted_score`.
+    """
+    grading: Dict[str, Any] = {}
+    total_score = 0.0
+    max_total_score = 0.0
+    weighted_score = 0.0
+    max_weighted_score = 0.0
+    for qid, max_score, future in pending:
+        result = future.result()
         grading[qid] = result
+        weight = (weights or {}).get(qid, 1.0)
         total_score += float(result.get("score", 0.0))
+        max_total_score += max_score
+        weighted_score += weight * float(result.get("score", 0.0))
+        max_weighted_score += weight * max_score
 
     final = {
         "student_answers": student_answers,
@@ -121,9 +567,598 @@ def run_pipeline(
         "total_score": round(total_score, 2),
         "max_total_score": round(max_total_score, 2),
     }
+    if weights and any(w != 1.0 for w in weights.values()):
+        final["weighted_score"] = round(weighted_score, 2)
+        final["max_weighted_score"] = round(max_weighted_score, 2)
+    if extra:
+        final.update(extra)
+    if metrics is not None:
+        final["metrics"] = metrics.to_dict()
 
     ensure_dir(results_dir)
     out_path = os.path.join(results_dir, "result.json")
-    save_json_file(out_path, final)
-
+    with timed(metrics, "write_result"):
+        save_json_file(out_path, final)
     return final
+
+
+def _ocr_payload_path(results_dir: str) -> str:
+    return os.path.join(results_dir, "ocr.json")
+
+
+def _save_ocr_payload(result_objs: List[Any], results_dir: str) -> None:
+    """Keep the recognized lines, per page, so a later `regrade` run can skip OCR."""
+    ensure_dir(results_dir)
+    save_json_file(_ocr_payload_path(results_dir), {"pages": [page_payload([res]) for res in result_objs]})
+
+
+def _load_ocr_payload(results_dir: str) -> List[Dict[str, Any]]:
+    data = load_json_file(_ocr_payload_path(results_dir))
+    # Files written before multi-page support hold a single page payload.
+    return data["pages"] if isinstance(data.get("pages"), list) else [data]
+
+
+def _load_previous_result(results_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(results_dir, "result.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        return load_json_file(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _question_keys(exam: CompiledExam, student_answers: Dict[str, str], grade_settings: str) -> Dict[str, str]:
+    """Content key of every question's grade: question, key, answer, max score and grading settings."""
+    return {
+        qid: content_hash(q.text, q.key, student_answers.get(qid, ""), q.max_score, grade_settings)
+        for qid, q in exam.questions.items()
+    }
+
+
+def run_pipeline(
+    image_path: Union[str, Sequence[str]],
+    configs_dir: str = "configs",
+    results_dir: str = "results",
+    ocr_lang: str = "vi",
+    api_url: str = "http://localhost:2911/v1",
+    model: str = "Llama-3.1-8B-Instruct",
+    ocr_mode: str = "grouped",
+    vn_corrector: str = "none",
+    vn_model: str = "protonx-models/distilled-protonx-legal-tc",
+    vn_top_k: int = 1,
+    max_concurrency: int = 4,
+    llm_timeout: float = 60.0,
+    grade_cache: Optional[str] = None,
+    save_ocr_json: bool = False,
+    preprocess: str = "fast",
+    grade_mode: str = "question",
+    prompt_cache: bool = True,
+    llm_slots: Optional[int] = None,
+    llm_stream: bool = False,
+    llm_retries: int = 2,
+    structured_output: bool = True,
+    pregrade: Optional[PreGradeConfig] = None,
+    memory_budget_mb: Optional[float] = None,
+    metrics: Optional[Metrics] = None,
+    trace_path: Optional[str] = None,
+    ocr=None,
+    corrector: Optional[ProtonXOfflineCorrector] = None,
+    grader: Optional[LlamaGrader] = None,
+    exam: Optional[ExamLike] = None,
+) -> Dict[str, Any]:
+    """Grade a single submission and write `results_dir/<image stem>/result.json`.
+
+    `image_path` is an image, a PDF, a multi-page TIFF, a directory of page
+    images or a list of page files. Pages are rendered and preprocessed
+    lazily, one ahead of OCR, and question grouping continues across page
+    boundaries.
+
+    Questions are graded concurrently with at most `max_concurrency` LLM
+    requests in flight; results keep the question order of `questions.json`.
+    With `grade_cache` (path to an SQLite file), unchanged answers reuse
+    earlier grades instead of calling the LLM. `save_ocr_json` additionally
+    writes PaddleOCR's raw JSON next to the result in the background.
+    `preprocess` selects the image preprocessing profile fed to OCR ("full",
+    "fast" or "none", see `reader.PreprocessConfig`); its per-step timings are
+    reported in `result["preprocess"]`. `grade_mode` "student" grades all
+    questions in one LLM request and falls back to per-question requests for
+    any answer that fails validation; "question" (default) sends one request
+    per question. `prompt_cache`, `llm_slots` and `llm_stream` are passed to
+    `LlamaGrader` (prompt-prefix reuse on the server and time-to-first-token
+    measurement). `memory_budget_mb` caps the memory of decoded pages: pages
+    are processed at a lower resolution if one alone would exceed it, and
+    the next page is not rendered ahead until it fits.
+    Wall time per stage, LLM token usage, retries and cache hits are
+    reported in `result["metrics"]` and also forwarded to `metrics` if given;
+    `trace_path` appends every record to a JSON-lines trace file.
+    `ocr`, `corrector`, `grader` and `exam` (a `CompiledExam` or a
+    (questions, answer_key) pair) may be passed in to reuse warm objects across calls; otherwise the process-wide
+    OCR engine is used and `result["ocr_engine"]` reports whether it was warm.
+    """
+    student_id = Path(image_path if isinstance(image_path, (str, os.PathLike)) else image_path[0]).stem
+    # One directory per image, so grading several images into the same
+    # results directory never overwrites an earlier result.
+    out_dir = os.path.join(results_dir, student_id)
+    student_metrics = Metrics(
+        parent=metrics,
+        labels={"student": student_id},
+        trace_path=trace_path if metrics is None else None,
+    )
+    t_start = time.perf_counter()
+    ocr_info: Dict[str, Any] = {"injected": True}
+    if ocr is None:
+        ocr, ocr_info = acquire_ocr(ocr_lang, student_metrics)
+    if corrector is None:
+        corrector = create_corrector(vn_corrector, vn_model, vn_top_k)
+    # Compiled questions, answer key and rubric
+    exam = load_exam(configs_dir) if exam is None else as_compiled(exam)
+
+    owns_grader = grader is None
+    if grader is None:
+        grader = LlamaGrader(
+            api_url=api_url,
+            model=model,
+            timeout=llm_timeout,
+            max_connections=max(1, max_concurrency),
+            cache=GradeCache(grade_cache) if grade_cache else None,
+            prompt_cache=prompt_cache,
+            slots=llm_slots,
+            stream=llm_stream,
+            retry_policy=RetryPolicy(max_attempts=1 + max(0, llm_retries)),
+            structured_output=structured_output,
+        )
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            # OCR results are handed to the extractor in memory; raw JSON
+            # artifacts are optional and written while grading runs.
+            result_objs, preprocess_info = _run_ocr(
+                image_path, ocr, preprocess, student_metrics, memory_budget_mb, keep_raw=save_ocr_json
+            )
+            if save_ocr_json:
+                executor.submit(_save_ocr_json, result_objs, out_dir, student_id)
+            segmentation: Dict[str, Any] = {}
+            student_answers = answers_from_ocr(
+                result_objs, ocr_lang, ocr_mode, corrector, student_metrics, exam.question_ids, segmentation
+            )
+            pregrader = PreGrader.for_exam(exam, pregrade) if pregrade is not None else None
+            pending = submit_grading(
+                executor, grader, exam, student_answers, student_metrics, grade_mode, pregrader
+            )
+            for _, _, future in pending:
+                future.result()
+            student_metrics.observe("student.total", time.perf_counter() - t_start)
+            extra = {"ocr_engine": ocr_info, "preprocess": preprocess_info}
+            if segmentation:
+                extra["segmentation"] = segmentation
+            if pregrader is not None:
+                extra["pregrader"] = pregrade_report(student_metrics)
+            return finalize_result(
+                student_answers, pending, out_dir, extra=extra, metrics=student_metrics, weights=exam.weights
+            )
+    finally:
+        student_metrics.close()
+        if owns_grader:
+            grader.close()
+            if grader.cache is not None:
+                grader.cache.close()
+
+
+def run_batch(
+    source: str,
+    configs_dir: str = "configs",
+    results_dir: str = "results",
+    ocr_lang: str = "vi",
+    api_url: str = "http://localhost:2911/v1",
+    model: str = "Llama-3.1-8B-Instruct",
+    ocr_mode: str = "grouped",
+    vn_corrector: str = "none",
+    vn_model: str = "protonx-models/distilled-protonx-legal-tc",
+    vn_top_k: int = 1,
+    max_concurrency: int = 4,
+    llm_timeout: float = 60.0,
+    grade_cache: Optional[str] = None,
+    save_ocr_json: bool = False,
+    ocr_workers: int = 0,
+    ocr_threads: Optional[int] = None,
+    preprocess: str = "fast",
+    grade_mode: str = "question",
+    prompt_cache: bool = True,
+    llm_slots: Optional[int] = None,
+    llm_stream: bool = False,
+    llm_retries: int = 2,
+    structured_output: bool = True,
+    pregrade: Optional[PreGradeConfig] = None,
+    regrade: bool = False,
+    resume: bool = False,
+    pages_per_student: Optional[int] = None,
+    memory_budget_mb: Optional[float] = None,
+    queue_size: int = 2,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    trace_path: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Grade every submission referenced by `source` in a single process.
+
+    `source` is a directory, glob pattern or manifest file (see
+    `collect_inputs`); a submission is an image, a PDF, a multi-page TIFF or
+    a directory of page images. With `pages_per_student`, longer documents
+    (one scanned PDF per class) are split into that many pages per student.
+    Pages are rendered one at a time as OCR needs them. One OCR engine, one corrector, one pooled LLM client
+    and one copy of the exam configs are shared by all students.
+
+    Students flow through a staged pipeline (preprocess -> OCR -> group and
+    correct -> grade, see `pipeline.run_stages`) whose stages run
+    concurrently and are connected by queues of `queue_size`, so OCR of later
+    students overlaps with grading of earlier ones and a lagging LLM throttles
+    OCR. LLM requests of all students share one pool of `max_concurrency`
+    workers. With `ocr_workers` > 1, OCR runs in an `OCRWorkerPool` of that
+    many processes (each limited to `ocr_threads` intra-op threads).
+    `memory_budget_mb` is the memory each OCR worker (or, in-process, the
+    preprocess and OCR stages together) may spend on decoded pages: a page
+    that alone would exceed it is processed at a lower resolution, and
+    in-process the next page waits until the current ones fit.
+    `preprocess` picks the image preprocessing profile and `grade_mode` the
+    LLM request layout, both as in `run_pipeline`, as do the `prompt_cache`,
+    `llm_slots`, `llm_stream`, `llm_retries` and `structured_output` grader
+    options and `pregrade`; the summary's `pregrader` block then reports the
+    share of LLM calls avoided over the run. The
+    summary's `llm` block reports the detected server capabilities and how
+    much of the run's retry budget was used.
+
+    Each student's result is written atomically to
+    `results_dir/<student_id>/result.json` as soon as it is graded, then
+    recorded in the append-only journal `results_dir/journal.jsonl` and as a
+    row of per-question scores in `results_dir/scores.csv`, and `on_result`
+    is called with the student's summary entry. With `resume`, students the
+    journal lists as done (with an unchanged image) are skipped and their
+    earlier entries reused (marked `resumed`); new rows are appended to the
+    CSV. An overview of the batch, in input order, is written to
+    `results_dir/summary.json` and returned. With `grade_cache`,
+    the summary includes the cache hit/miss counters.
+
+    Every run records content hashes of each stage's inputs in
+    `results_dir/manifest.json` (see `manifest.RunManifest`) and keeps each
+    student's recognized lines in `ocr.json`. With `regrade`, a run over the
+    same results directory recomputes only what changed: OCR when the image
+    or OCR/preprocessing settings differ, grouping and correction when the
+    OCR text or corrector settings differ, and a question's grade when its
+    text, answer key, the student's answer or the grading settings (model,
+    prompt version, grade mode, schema, pre-grader) differ. Everything else
+    is taken from the previous results; the summary's `regrade` block counts
+    what was reused.
+
+    Every result carries its student's `metrics`; the summary aggregates them
+    for the whole run. `trace_path` appends each record to a JSON-lines
+    trace and `metrics_path` receives the run totals in Prometheus text
+    format when the batch ends.
+    """
+    paths = collect_inputs(source)
+    if not paths:
+        raise FileNotFoundError(f"No input images found for batch source: {source}")
+    submissions = _split_submissions(paths, pages_per_student)
+
+    run_metrics = Metrics(trace_path=trace_path)
+    t_start = time.perf_counter()
+    exam = load_exam(configs_dir)
+    corrector = create_corrector(vn_corrector, vn_model, vn_top_k)
+    pre_cfg = replace(PreprocessConfig.profile(preprocess), memory_budget_mb=memory_budget_mb)
+    ocr_cfg = OCREngineConfig(lang=ocr_lang)
+
+    # Content keys of each stage's settings; per-student keys add the inputs.
+    # Without a memory budget the key is what it was before budgets existed,
+    # so earlier results stay reusable by --regrade.
+    pre_settings = asdict(pre_cfg)
+    if memory_budget_mb is None:
+        del pre_settings["memory_budget_mb"]
+    ocr_settings = content_hash("ocr", asdict(ocr_cfg), pre_settings)
+    correct_settings = content_hash(
+        "correct", ocr_lang, ocr_mode, vn_corrector, vn_model, vn_top_k, SEGMENTATION_VERSION, exam.question_ids
+    )
+    grade_settings = content_hash(
+        "grade",
+        model,
+        STUDENT_PROMPT_VERSION if grade_mode == "student" else PROMPT_VERSION,
+        structured_output,
+        asdict(pregrade) if pregrade is not None else None,
+    )
+    manifest = RunManifest.load(results_dir) if regrade or resume else RunManifest(results_dir)
+    manifest.set_settings(
+        {"ocr": ocr_settings, "correct": correct_settings, "grade": grade_settings, "model": model}
+    )
+
+    file_hashes: Dict[str, str] = {}
+    hashes_lock = threading.Lock()
+
+    def input_hash(path: str, pages: Optional[Tuple[int, int]]) -> str:
+        """Content hash of a submission: its file(s) and, if split, its page range."""
+        files = [f for f, _ in page_refs(path)] if os.path.isdir(path) else [path]
+        digests = []
+        for f in dict.fromkeys(files):
+            with hashes_lock:
+                digest = file_hashes.get(f)
+            if digest is None:
+                # A class PDF is hashed once, not once per student.
+                digest = file_hash(f)
+                with hashes_lock:
+                    file_hashes[f] = digest
+            digests.append(digest)
+        if len(digests) == 1 and pages is None:
+            return digests[0]
+        return content_hash(digests, list(pages) if pages is not None else None)
+
+    def prepare(job: StudentJob) -> bool:
+        """Compute the job's OCR and correction keys; True if stored OCR lines were reused."""
+        job.keys["image"] = input_hash(job.input, job.pages)
+        job.keys["ocr"] = content_hash(job.keys["image"], ocr_settings)
+        job.keys["correct"] = content_hash(job.keys["ocr"], correct_settings)
+        if not regrade:
+            return False
+        job.previous = _load_previous_result(job.results_dir)
+        entry = manifest.student(job.student_id)
+        payload_path = _ocr_payload_path(job.results_dir)
+        if entry.get("ocr") != job.keys["ocr"] or not os.path.exists(payload_path):
+            return False
+        job.ocr_results = _load_ocr_payload(job.results_dir)
+        job.keys["ocr_reused"] = True
+        job.preprocess = (job.previous or {}).get("preprocess") or {"profile": preprocess}
+        job.metrics.incr("regrade.reused.ocr")
+        return True
+
+    pool: Optional[OCRWorkerPool] = None
+    budget: Optional[MemoryBudget] = None
+    stages: List[Stage] = []
+    if ocr_workers > 1:
+        pool = OCRWorkerPool(ocr_cfg, workers=ocr_workers, threads_per_worker=ocr_threads, preprocess=pre_cfg)
+        ocr_info: Dict[str, Any] = {"workers": pool.workers, "threads_per_worker": pool.threads_per_worker}
+        if memory_budget_mb:
+            ocr_info["memory_budget_mb_per_worker"] = memory_budget_mb
+
+        def ocr_stage(job: StudentJob) -> None:
+            if prepare(job):
+                return
+            # Workers render, preprocess and recognize one page each; each
+            # payload stands in for the PaddleOCR result of one page.
+            refs = page_refs(job.input, job.pages)
+            if not refs:
+                raise ValueError("Submission has no pages")
+            with timed(job.metrics, "ocr.worker_roundtrip"):
+                payloads = [f.result() for f in [pool.submit(path, index) for path, index in refs]]
+            timings: Dict[str, float] = {}
+            for payload in payloads:
+                for step, seconds in payload.pop("preprocess_timings", {}).items():
+                    job.metrics.observe(f"preprocess.{step}", seconds)
+                    timings[step] = timings.get(step, 0.0) + seconds
+                job.metrics.observe("ocr.predict", payload.pop("predict_seconds", 0.0))
+            job.metrics.incr("ocr.pages", len(payloads))
+            job.preprocess = preprocess_report(preprocess, timings, len(payloads))
+            job.ocr_results = payloads
+
+        stages.append(Stage("ocr", ocr_stage, workers=pool.workers))
+    else:
+        ocr_info = {}
+        if memory_budget_mb:
+            budget = MemoryBudget(memory_budget_mb * 2**20)
+        ocr_lock = threading.Lock()
+        ocr_holder: List[Any] = []
+
+        def get_ocr():
+            # Loaded on first use, so a regrade that reuses every student's
+            # OCR lines never pays for the model.
+            with ocr_lock:
+                if not ocr_holder:
+                    engine, info = acquire_ocr(ocr_lang, run_metrics)
+                    ocr_holder.append(engine)
+                    ocr_info.update(info)
+                return ocr_holder[0]
+
+        if not regrade:
+            get_ocr()
+
+        def preprocess_stage(job: StudentJob) -> None:
+            if prepare(job):
+                return
+            # The first page is preprocessed here; later pages of a multi-page
+            # submission are rendered while OCR reads the earlier ones.
+            stream = _PageStream(page_refs(job.input, job.pages), pre_cfg, job.metrics, budget)
+            stream.prepare_first()
+            job.image = stream
+
+        def ocr_stage(job: StudentJob) -> None:
+            if job.ocr_results is not None:
+                return
+            job.ocr_results, job.preprocess = _ocr_pages(
+                job.image, get_ocr(), preprocess, job.metrics, keep_raw=save_ocr_json
+            )
+            job.image = None
+
+        stages.append(Stage("preprocess", preprocess_stage))
+        stages.append(Stage("ocr", ocr_stage))
+
+    max_concurrency = max(1, max_concurrency)
+    cache = GradeCache(grade_cache) if grade_cache else None
+    grader = LlamaGrader(
+        api_url=api_url,
+        model=model,
+        timeout=llm_timeout,
+        max_connections=max_concurrency,
+        cache=cache,
+        prompt_cache=prompt_cache,
+        slots=llm_slots,
+        stream=llm_stream,
+        retry_policy=RetryPolicy(max_attempts=1 + max(0, llm_retries)),
+        structured_output=structured_output,
+    )
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    pregrader = PreGrader.for_exam(exam, pregrade) if pregrade is not None else None
+
+    def correct_stage(job: StudentJob) -> None:
+        if not job.keys.get("ocr_reused"):
+            _save_ocr_payload(job.ocr_results, job.results_dir)
+            if save_ocr_json:
+                executor.submit(_save_ocr_json, job.ocr_results, job.results_dir, job.student_id)
+        previous = job.previous or {}
+        if (
+            regrade
+            and manifest.student(job.student_id).get("correct") == job.keys["correct"]
+            and isinstance(previous.get("student_answers"), dict)
+        ):
+            job.student_answers = previous["student_answers"]
+            job.segmentation = previous.get("segmentation")
+            job.metrics.incr("regrade.reused.answers")
+        else:
+            job.segmentation = {}
+            job.student_answers = answers_from_ocr(
+                job.ocr_results, ocr_lang, ocr_mode, corrector, job.metrics, exam.question_ids, job.segmentation
+            )
+        job.ocr_results = None
+
+    def grade_stage(job: StudentJob) -> None:
+        question_keys = _question_keys(exam, job.student_answers, grade_settings)
+        reuse: Dict[str, Dict[str, Any]] = {}
+        if regrade:
+            old_keys = manifest.student(job.student_id).get("questions", {})
+            old_grading = (job.previous or {}).get("grading", {})
+            for qid, key in question_keys.items():
+                old = old_grading.get(qid)
+                if old_keys.get(qid) == key and isinstance(old, dict) and "error" not in old:
+                    reuse[qid] = old
+            job.metrics.incr("regrade.reused.questions", len(reuse))
+            job.metrics.incr("regrade.regraded.questions", len(question_keys) - len(reuse))
+        pending = submit_grading(
+            executor, grader, exam, job.student_answers, job.metrics, grade_mode, pregrader, reuse
+        )
+        for _, _, future in pending:
+            future.result()
+        job.metrics.observe("student.total", time.perf_counter() - job.started)
+        extra: Dict[str, Any] = {"preprocess": job.preprocess}
+        if job.segmentation:
+            extra["segmentation"] = job.segmentation
+        job.final = finalize_result(
+            job.student_answers, pending, job.results_dir, extra=extra, metrics=job.metrics, weights=exam.weights
+        )
+        manifest.set_student(
+            job.student_id,
+            {
+                "input": job.input,
+                "image": job.keys["image"],
+                "ocr": job.keys["ocr"],
+                "correct": job.keys["correct"],
+                # Failed grades must not be reused, so they get no key.
+                "questions": {
+                    qid: key for qid, key in question_keys.items() if "error" not in job.final["grading"][qid]
+                },
+            },
+        )
+
+    stages.append(Stage("correct", correct_stage))
+    # Enough students in grading to keep `max_concurrency` requests in flight.
+    stages.append(Stage("grade", grade_stage, workers=max(2, max_concurrency)))
+
+    journal = RunJournal(os.path.join(results_dir, JOURNAL_FILENAME), resume=resume)
+    done = journal.completed() if resume else {}
+    scores = ScoreSheet(os.path.join(results_dir, SCORES_FILENAME), exam.question_ids, append=resume)
+    students: List[Dict[str, Any]] = []
+    jobs: List[StudentJob] = []
+    student_ids = _student_ids([name for _, _, name in submissions])
+    for i, (sid, (path, pages, _)) in enumerate(zip(student_ids, submissions)):
+        previous = done.get(sid)
+        if (
+            previous is not None
+            and os.path.abspath(previous.get("input", "")) == os.path.abspath(path)
+            and previous.get("image") == input_hash(path, pages)
+        ):
+            # Finished by an earlier run and the image is unchanged.
+            entry = {k: v for k, v in previous.items() if k not in ("status", "image", "ts")}
+            entry["input"] = path
+            students.append(dict(entry, resumed=True))
+            run_metrics.incr("students.resumed")
+            if on_result is not None:
+                on_result(students[-1])
+            continue
+        students.append({})
+        jobs.append(
+            StudentJob(
+                index=i,
+                student_id=sid,
+                input=path,
+                pages=pages,
+                results_dir=os.path.join(results_dir, sid),
+                metrics=Metrics(parent=run_metrics, labels={"student": sid}),
+            )
+        )
+    try:
+        with grader, executor:
+            for n, job in enumerate(run_stages(jobs, stages, queue_size=queue_size), 1):
+                entry: Dict[str, Any] = {"student_id": job.student_id, "input": job.input}
+                if job.pages is not None:
+                    entry["pages"] = [job.pages[0] + 1, job.pages[1]]
+                if job.error is not None:
+                    entry["error"] = job.error
+                    run_metrics.incr("students.failed")
+                    journal.append(dict(entry, status="failed"))
+                else:
+                    entry.update(
+                        {
+                            "result": os.path.abspath(os.path.join(job.results_dir, "result.json")),
+                            "total_score": job.final["total_score"],
+                            "max_total_score": job.final["max_total_score"],
+                        }
+                    )
+                    if "weighted_score" in job.final:
+                        entry["weighted_score"] = job.final["weighted_score"]
+                    low = (job.segmentation or {}).get("low_confidence")
+                    if low:
+                        # Questions whose answer text may be misplaced; worth a look.
+                        entry["low_confidence"] = low
+                    # Absolute paths, so a run resumed from another directory still matches.
+                    journal.append(
+                        dict(entry, status="done", image=job.keys.get("image"), input=os.path.abspath(job.input))
+                    )
+                scores.add(job.student_id, job.final, job.error)
+                run_metrics.incr("students.done")
+                students[job.index] = entry
+                if on_result is not None:
+                    on_result(entry)
+                if n % 25 == 0:
+                    manifest.save()
+    finally:
+        if pool is not None:
+            pool.close()
+        manifest.save()
+        journal.close()
+        scores.close()
+    run_metrics.observe("batch.total", time.perf_counter() - t_start)
+
+    summary = {
+        "source": source,
+        "num_students": len(students),
+        "num_failed": sum(1 for s in students if "error" in s),
+        "num_resumed": sum(1 for s in students if s.get("resumed")),
+        "students": students,
+        "exam": exam.summary(),
+        "ocr_engine": ocr_info if pool is not None else dict(ocr_info, **engine_stats()),
+    }
+    if cache is not None:
+        summary["grade_cache"] = cache.stats()
+        cache.close()
+    if budget is not None:
+        summary["memory_budget"] = budget.stats()
+    if corrector is not None:
+        summary["corrector"] = dict(corrector.stats)
+    if pregrader is not None:
+        summary["pregrader"] = pregrade_report(run_metrics)
+    if regrade:
+        counters = run_metrics.to_dict()["counters"]
+        summary["regrade"] = {
+            name: int(counters.get(f"regrade.{name}", 0))
+            for name in ("reused.ocr", "reused.answers", "reused.questions", "regraded.questions")
+        }
+    summary["llm"] = {"capabilities": grader.capabilities(), "retry_budget": grader.retry_budget.stats()}
+    summary["metrics"] = run_metrics.to_dict()
+    run_metrics.close()
+    if metrics_path:
+        run_metrics.write_prometheus(metrics_path)
+    ensure_dir(results_dir)
+    save_json_file(os.path.join(results_dir, "summary.json"), summary)
+    return summary
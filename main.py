@@ -2,13 +2,52 @@ from __future__ import annotations
 
 import argparse
 import json
-
-from essay_grader.workflow import run_pipeline
+import os
+import sys
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="AutoEssayGrader CLI")
-    p.add_argument("--input", required=True, help="Path to essay image (jpg/png)")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument(
+        "--input",
+        help="One student's submission: an image (jpg/png), a PDF, a multi-page TIFF or a directory of page images",
+    )
+    src.add_argument(
+        "--batch",
+        help="Grade many essays in one process: a directory, glob pattern or manifest file (.txt/.json)",
+    )
+    src.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run an HTTP grading service that keeps the models loaded (POST /jobs, GET /jobs/<id>, GET /metrics)",
+    )
+    src.add_argument(
+        "--compile-exam",
+        action="store_true",
+        help="Compile configs/questions.json and answer_key.json into the rubric artifact grading loads, "
+        "and print its summary",
+    )
+    p.add_argument("--host", default="127.0.0.1", help="Service mode: address to listen on")
+    p.add_argument("--port", type=int, default=8080, help="Service mode: port to listen on")
+    p.add_argument(
+        "--service-batch-size",
+        type=int,
+        default=4,
+        help="Service mode: most uploads (and pages) recognized together in one OCR micro-batch",
+    )
+    p.add_argument(
+        "--service-batch-wait",
+        type=float,
+        default=0.02,
+        help="Service mode: seconds to wait for more uploads before running a micro-batch",
+    )
+    p.add_argument(
+        "--service-max-queue",
+        type=int,
+        default=64,
+        help="Service mode: uploads waiting for OCR beyond which new ones get 503",
+    )
     p.add_argument("--ocr-lang", default="en", help="OCR language: en or vi")
     p.add_argument("--api-url", default="http://localhost:2911/v1", help="OpenAI-compatible base URL of llama.cpp server")
     p.add_argument("--model", default="Llama-3.1-8B-Instruct", help="Model name exposed by the local API")
@@ -30,11 +69,229 @@ def parse_args() -> argparse.Namespace:
         default=1,
         help="Top-k candidates to generate; best candidate is used",
     )
+    p.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of LLM grading requests in flight at once",
+    )
+    p.add_argument("--llm-timeout", type=float, default=60.0, help="Per-request LLM timeout in seconds")
+    p.add_argument(
+        "--llm-retries",
+        type=int,
+        default=2,
+        help="Retries per LLM request on timeouts, connection errors, 429 and 5xx (with backoff)",
+    )
+    p.add_argument(
+        "--grade-cache",
+        default="results/grade_cache.sqlite",
+        help="SQLite file caching grades of unchanged answers across runs",
+    )
+    p.add_argument(
+        "--preprocess",
+        choices=["full", "fast", "none"],
+        default="fast",
+        help="Image preprocessing before OCR: full (NL-means denoise), fast (median denoise, "
+        "downscaled deskew estimate) or none",
+    )
+    p.add_argument(
+        "--grade-mode",
+        choices=["question", "student"],
+        default="question",
+        help="LLM requests: one per question, or one per student (all questions at once, "
+        "with per-question fallback for invalid answers)",
+    )
+    p.add_argument(
+        "--pregrade",
+        action="store_true",
+        help="Score blank, near-exact and unrelated answers by text similarity without the LLM",
+    )
+    p.add_argument(
+        "--pregrade-accept",
+        type=float,
+        default=0.95,
+        help="Similarity to the answer key at or above which an answer gets full marks",
+    )
+    p.add_argument(
+        "--pregrade-reject",
+        type=float,
+        default=0.05,
+        help="Similarity at or below which an answer sharing no word with the key gets 0",
+    )
+    p.add_argument(
+        "--no-json-schema",
+        action="store_true",
+        help="Do not send the result JSON schema (constrained decoding); request plain JSON mode",
+    )
+    p.add_argument(
+        "--no-prompt-cache",
+        action="store_true",
+        help="Do not send llama.cpp prompt-cache hints (for servers that reject unknown fields)",
+    )
+    p.add_argument(
+        "--llm-slots",
+        type=int,
+        default=None,
+        help="Pin each question to one of this many llama.cpp server slots (the server's --parallel)",
+    )
+    p.add_argument(
+        "--llm-stream",
+        action="store_true",
+        help="Stream LLM responses and record time-to-first-token (llm.ttft)",
+    )
+    p.add_argument(
+        "--save-ocr-json",
+        action="store_true",
+        help="Also write PaddleOCR's raw *_res.json files to the results directory",
+    )
+    p.add_argument(
+        "--ocr-workers",
+        type=int,
+        default=0,
+        help="Batch and service mode: run OCR in this many worker processes (0 or 1 = in-process)",
+    )
+    p.add_argument(
+        "--ocr-threads",
+        type=int,
+        default=None,
+        help="Intra-op CPU threads per OCR worker (default: CPU count / workers)",
+    )
+    p.add_argument(
+        "--memory-budget-mb",
+        type=float,
+        default=None,
+        help="Memory for decoded pages per OCR worker (in-process: for all pages in flight); larger "
+        "scans are processed at a lower resolution and read-ahead waits until pages fit",
+    )
+    p.add_argument(
+        "--queue-size",
+        type=int,
+        default=2,
+        help="Batch mode: students buffered between pipeline stages (backpressure)",
+    )
+    p.add_argument(
+        "--regrade",
+        action="store_true",
+        help="Batch mode: reuse OCR text, answers and grades from the previous run in the results "
+        "directory whose inputs (image, settings, question, answer key, model) did not change",
+    )
+    p.add_argument(
+        "--pages-per-student",
+        type=int,
+        default=None,
+        help="Batch mode: split PDFs/TIFFs with more pages than this (e.g. one scan per class) into "
+        "consecutive runs of this many pages, one per student",
+    )
+    p.add_argument(
+        "--resume",
+        action="store_true",
+        help="Batch mode: skip students the results directory's journal.jsonl lists as done "
+        "(e.g. after a crash) and append the rest",
+    )
+    p.add_argument("--trace", default=None, help="Append per-stage timings and counters to this JSON-lines file")
+    p.add_argument(
+        "--metrics-out",
+        default=None,
+        help="Batch mode: write run totals in Prometheus text format to this file",
+    )
+    p.add_argument("--no-grade-cache", action="store_true", help="Always call the LLM, ignoring the grade cache")
     return p.parse_args()
 
 
+def _report_progress(entry: dict) -> None:
+    if "error" in entry:
+        status = f"failed: {entry['error']}"
+    else:
+        status = f"{entry['total_score']}/{entry['max_total_score']}"
+    print(f"{entry['student_id']}: {status}", file=sys.stderr, flush=True)
+
+
 def main() -> None:
     args = parse_args()
+    if args.compile_exam:
+        from essay_grader.exam import compiled_path, load_exam
+
+        exam = load_exam("configs", compile_only=True)
+        print(json.dumps(dict(exam.summary(), path=compiled_path("configs", exam.version)), ensure_ascii=False, indent=2))
+        return
+    # Imported after argument parsing so `--help` and usage errors return at
+    # once; the grading modules load their own heavy dependencies lazily.
+    from essay_grader.pregrader import PreGradeConfig
+    from essay_grader.workflow import run_batch, run_pipeline
+
+    grade_cache = None if args.no_grade_cache else args.grade_cache
+    pregrade = None
+    if args.pregrade:
+        pregrade = PreGradeConfig(accept_threshold=args.pregrade_accept, reject_threshold=args.pregrade_reject)
+    if args.batch:
+        summary = run_batch(
+            source=args.batch,
+            ocr_lang=args.ocr_lang,
+            api_url=args.api_url,
+            model=args.model,
+            ocr_mode=args.ocr_mode,
+            vn_corrector=args.vn_corrector,
+            vn_model=args.vn_model,
+            vn_top_k=args.vn_top_k,
+            max_concurrency=args.max_concurrency,
+            llm_timeout=args.llm_timeout,
+            llm_retries=args.llm_retries,
+            structured_output=not args.no_json_schema,
+            pregrade=pregrade,
+            regrade=args.regrade,
+            resume=args.resume,
+            pages_per_student=args.pages_per_student,
+            memory_budget_mb=args.memory_budget_mb,
+            grade_cache=grade_cache,
+            save_ocr_json=args.save_ocr_json,
+            preprocess=args.preprocess,
+            grade_mode=args.grade_mode,
+            prompt_cache=not args.no_prompt_cache,
+            llm_slots=args.llm_slots,
+            llm_stream=args.llm_stream,
+            ocr_workers=args.ocr_workers,
+            ocr_threads=args.ocr_threads,
+            queue_size=args.queue_size,
+            on_result=_report_progress,
+            trace_path=args.trace,
+            metrics_path=args.metrics_out,
+        )
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+    if args.serve:
+        from essay_grader.service import GradingService, serve
+
+        service = GradingService(
+            results_dir=os.path.join("results", "service"),
+            ocr_lang=args.ocr_lang,
+            api_url=args.api_url,
+            model=args.model,
+            ocr_mode=args.ocr_mode,
+            vn_corrector=args.vn_corrector,
+            vn_model=args.vn_model,
+            vn_top_k=args.vn_top_k,
+            max_concurrency=args.max_concurrency,
+            llm_timeout=args.llm_timeout,
+            llm_retries=args.llm_retries,
+            structured_output=not args.no_json_schema,
+            pregrade=pregrade,
+            grade_cache=grade_cache,
+            preprocess=args.preprocess,
+            grade_mode=args.grade_mode,
+            prompt_cache=not args.no_prompt_cache,
+            llm_slots=args.llm_slots,
+            llm_stream=args.llm_stream,
+            ocr_workers=args.ocr_workers,
+            ocr_threads=args.ocr_threads,
+            memory_budget_mb=args.memory_budget_mb,
+            batch_size=args.service_batch_size,
+            batch_wait=args.service_batch_wait,
+            max_queue=args.service_max_queue,
+            trace_path=args.trace,
+        )
+        serve(service, host=args.host, port=args.port)
+        return
+
     result = run_pipeline(
         image_path=args.input,
         ocr_lang=args.ocr_lang,
@@ -44,6 +301,20 @@ def main() -> None:
         vn_corrector=args.vn_corrector,
         vn_model=args.vn_model,
         vn_top_k=args.vn_top_k,
+        max_concurrency=args.max_concurrency,
+        llm_timeout=args.llm_timeout,
+        llm_retries=args.llm_retries,
+        structured_output=not args.no_json_schema,
+        pregrade=pregrade,
+        memory_budget_mb=args.memory_budget_mb,
+        grade_cache=grade_cache,
+        save_ocr_json=args.save_ocr_json,
+        preprocess=args.preprocess,
+        grade_mode=args.grade_mode,
+        prompt_cache=not args.no_prompt_cache,
+        llm_slots=args.llm_slots,
+        llm_stream=args.llm_stream,
+        trace_path=args.trace,
     )
     print(json.dumps(result, ensure_ascii=False, indent=2))
 